@@ -0,0 +1,317 @@
+"""
+Headless benchmarks of the library, playlist and state hot paths.
+
+A synthetic library of empty .mp3 files is generated in a temporary
+directory for every size, nothing needs a display or an audio device.
+Results are written as JSON so that runs from different commits can be
+compared:
+
+    python benchmarks/benchmark.py --output before.json
+    python benchmarks/benchmark.py --output after.json
+    python benchmarks/benchmark.py --compare before.json after.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import library
+import statestore
+from playlist import pattern
+from playlist import plan
+from playlist.model import PlayListModel
+from playlist.playqueue import PlayQueue
+
+SIZES = (1000, 10000, 100000)
+REPEAT = 5
+TRACKS_PER_FOLDER = 25
+# Calls per run for operations that are too fast to time one by one.
+CALLS = 1000
+# Slowdown of the median that compare reports as a regression.
+THRESHOLD = 1.2
+
+ORCHESTRAS = ('Di Sarli', "D'Arienzo", 'Pugliese', 'Troilo', 'Canaro',
+              'Biagi', 'Calo', 'Tanturi', 'De Angelis', 'Fresedo', 'Donato',
+              'Rodríguez', 'Laurenz', 'Demare', 'Varela', 'Lomuto')
+SINGERS = ('Rufino', 'Podesta', 'Echague', 'Castillo', 'Fiorentino', 'Maida',
+           'Moran', 'Vargas', 'Duran', 'Chanel', 'Ortiz', 'Lesica')
+WORDS = ('amor', 'noche', 'corazon', 'milonga', 'vals', 'tango', 'barrio',
+         'luna', 'recuerdo', 'silencio', 'cielo', 'sueño', 'alma', 'flor',
+         'madre', 'canción', 'gris', 'viejo', 'farol', 'esquina')
+
+def make_library(root, size, seed=0):
+    """
+    Write size empty tracks below root, one folder per orchestra with
+    album folders of TRACKS_PER_FOLDER tracks. Returns the orchestra
+    folders.
+    """
+    rng = random.Random(seed)
+    folders = []
+    for number in range(size):
+        orchestra = ORCHESTRAS[number % len(ORCHESTRAS)]
+        album = number // (TRACKS_PER_FOLDER * len(ORCHESTRAS))
+        directory = os.path.join(root, orchestra, f'{album:04d}')
+        if not number // len(ORCHESTRAS) % TRACKS_PER_FOLDER:
+            os.makedirs(directory, exist_ok=True)
+        title = ' '.join(rng.sample(WORDS, 3)).capitalize()
+        name = f'{number:06d} {title} - {rng.choice(SINGERS)}.mp3'
+        open(os.path.join(directory, name), 'wb').close()
+    for orchestra in ORCHESTRAS[:min(size, len(ORCHESTRAS))]:
+        folders.append(os.path.join(root, orchestra))
+    return folders
+
+def measure(function, repeat, setup=None):
+    """
+    Time repeat runs of function in milliseconds.
+
+    If setup is given it is called before every run, outside the timing,
+    and its result is passed to function.
+    """
+    times = []
+    for _ in range(repeat):
+        args = (setup(), ) if setup else ()
+        start = time.perf_counter()
+        function(*args)
+        times.append((time.perf_counter() - start) * 1000)
+    return {'median': statistics.median(times), 'best': min(times),
+            'max': max(times), 'runs': repeat}
+
+def run_queue(size):
+    """
+    Enqueue, dequeue and show positions for size entries, as the queue
+    column and get_track of file playlists do.
+    """
+    queue = PlayQueue()
+    for row in range(size):
+        queue.append(row % (size // 2 or 1))
+    for row in range(0, size // 2, 3):
+        queue.remove_last(row)
+    for row in range(0, size // 2, 7):
+        queue.positions(row)
+    while queue.pop() is not None:
+        pass
+
+def bench_library(folders, data, repeat):
+    """Scanning and the trie of the library."""
+    results = {}
+    counter = iter(range(repeat))
+
+    def fresh():
+        return library.Library(os.path.join(data, f'scan{next(counter)}.db'))
+    def scan(lib):
+        lib.scan(folders)
+        lib.close()
+    results['library.scan'] = measure(scan, repeat, fresh)
+
+    lib = library.Library(os.path.join(data, 'library.db'))
+    lib.scan(folders)
+    results['library.rescan unchanged'] = measure(
+        lambda: lib.rescan(folders), repeat)
+
+    def build_trie():
+        lib.trie = None
+        lib.tree()
+    results['library.tree build'] = measure(build_trie, repeat)
+    return lib, results
+
+def bench_pattern(lib, folders, repeat):
+    """Building patterns and selecting tandas from them."""
+    results = {}
+    half = folders[:max(1, len(folders) // 2)]
+    results['pattern.build'] = measure(
+        lambda: pattern.Pattern('Tango', half, 4, library=lib), repeat)
+    p = pattern.Pattern('Tango', half, 4, library=lib)
+    p.exclude_path(os.path.join(half[0], '0000'))
+
+    def select():
+        for _ in range(CALLS):
+            p.select_files()
+    results[f'pattern.select_files x{CALLS}'] = measure(select, repeat)
+    results['pattern.files'] = measure(lambda: p.files, repeat)
+
+    evening = plan.Plan(['Tango', 'Tango', 'Vals', 'Tango', 'Milonga'],
+                        {name: p.files for name in ('Tango', 'Vals', 'Milonga')},
+                        {'Tango': 4, 'Vals': 3, 'Milonga': 3}, seed=1)
+
+    def tandas():
+        evening.permutations = {}
+        for slot in range(CALLS):
+            evening.tanda(slot)
+    results[f'plan.tanda x{CALLS}'] = measure(tandas, repeat)
+    return results
+
+def bench_search(lib, repeat):
+    """Building the search index and typing a query."""
+    results = {}
+
+    def build():
+        lib.text_index = None
+        lib.index()
+    results['search.build'] = measure(build, repeat)
+    index = lib.index()
+    query = 'pugliese amor rufino'
+
+    def type_query():
+        index.last = None
+        for end in range(1, len(query) + 1):
+            index.search(query[:end])
+    results[f'search.type {len(query)} keys'] = measure(type_query, repeat)
+    keystrokes = []
+    index.last = None
+    for end in range(1, len(query) + 1):
+        start = time.perf_counter()
+        index.search(query[:end])
+        keystrokes.append((time.perf_counter() - start) * 1000)
+    results['search.slowest key'] = {
+        'median': max(keystrokes), 'best': max(keystrokes),
+        'max': max(keystrokes), 'runs': 1}
+    return results
+
+def bench_playlist(paths, data, repeat):
+    """File playlist rows, saving and loading state, track advance."""
+    results = {}
+
+    def add():
+        PlayListModel().add(paths)
+    results['fileplaylist.add'] = measure(add, repeat)
+    model = PlayListModel()
+    model.add(paths)
+    model.enqueue(range(0, len(paths), 10))
+    results['fileplaylist.serialize'] = measure(model.state, repeat)
+    results['fileplaylist.load'] = measure(
+        lambda: PlayListModel().load(model.state()), repeat)
+    model.queue = PlayQueue()
+
+    store = statestore.StateStore(os.path.join(data, 'state'))
+    record = model.state()
+
+    def save():
+        # Clear digests so that the record is written every run.
+        store.digests = {}
+        store.save('playlist-bench', record)
+    results['state.save'] = measure(save, repeat)
+    results['state.load'] = measure(
+        lambda: store.load('playlist-bench'), repeat)
+    results['state.size kB'] = {
+        'median': os.path.getsize(store.record_path('playlist-bench')) / 1024,
+        'best': None, 'max': None, 'runs': 1}
+
+    def sequential():
+        for _ in range(len(paths)):
+            model.get_track(1)
+    results[f'advance.sequential x{len(paths)}'] = measure(sequential, repeat)
+
+    def shuffled():
+        model.random = True
+        for _ in range(len(paths)):
+            model.get_track(1)
+        model.random = False
+    results[f'advance.shuffle x{len(paths)}'] = measure(shuffled, repeat)
+    results[f'queue x{len(paths)}'] = measure(
+        lambda: run_queue(len(paths)), repeat)
+    return results
+
+def run(sizes, repeat):
+    """Run all benchmarks for every size, returns the results."""
+    results = {}
+    for size in sizes:
+        temp = tempfile.mkdtemp(prefix='milonga-bench-')
+        try:
+            music = os.path.join(temp, 'music')
+            data = os.path.join(temp, 'data')
+            os.makedirs(data)
+            start = time.perf_counter()
+            folders = make_library(music, size)
+            print(f'{size} tracks written in '
+                  f'{time.perf_counter() - start:.1f} s', file=sys.stderr)
+            lib, timings = bench_library(folders, data, repeat)
+            timings.update(bench_pattern(lib, folders, repeat))
+            timings.update(bench_search(lib, repeat))
+            paths = [path for folder in folders
+                     for path in lib.files(folder)]
+            timings.update(bench_playlist(paths, data, repeat))
+            lib.close()
+        finally:
+            shutil.rmtree(temp, ignore_errors=True)
+        for name, timing in timings.items():
+            results[f'{name} [{size}]'] = timing
+            print(f'{name} [{size}]: {timing["median"]:.2f}', file=sys.stderr)
+    return results
+
+def commit():
+    """Current git commit, None if it is not known."""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+            capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(old_path, new_path, threshold=THRESHOLD):
+    """
+    Print medians of two runs side by side, returns the names of the
+    benchmarks that got slower than threshold.
+    """
+    with open(old_path) as fh:
+        old = json.load(fh)
+    with open(new_path) as fh:
+        new = json.load(fh)
+    print(f'{"benchmark":<45} {old["commit"] or old_path:>12} '
+          f'{new["commit"] or new_path:>12}  ratio')
+    slower = []
+    for name, timing in new['results'].items():
+        before = old['results'].get(name)
+        if not before or not before['median']:
+            print(f'{name:<45} {"":>12} {timing["median"]:>12.2f}')
+            continue
+        ratio = timing['median'] / before['median']
+        flag = ''
+        if ratio > threshold:
+            slower.append(name)
+            flag = ' slower'
+        print(f'{name:<45} {before["median"]:>12.2f} '
+              f'{timing["median"]:>12.2f} {ratio:6.2f}{flag}')
+    return slower
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', default=','.join(map(str, SIZES)),
+                        help='comma separated library sizes')
+    parser.add_argument('--repeat', type=int, default=REPEAT)
+    parser.add_argument('--output', help='write results to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'),
+                        help='compare two result files')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD)
+    args = parser.parse_args()
+    if args.compare:
+        return 1 if compare(*args.compare, args.threshold) else 0
+    logging.basicConfig(level=logging.WARNING)
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    output = {'commit': commit(),
+              'date': datetime.datetime.now().isoformat(timespec='seconds'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'repeat': args.repeat,
+              'results': run(sizes, args.repeat)}
+    text = json.dumps(output, indent=1)
+    if args.output:
+        with open(args.output, 'w') as fh:
+            fh.write(text)
+    else:
+        print(text)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
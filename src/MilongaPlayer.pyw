@@ -1,4 +1,5 @@
 import configparser
+import functools
 import logging
 import os
 import pickle
@@ -6,13 +7,24 @@ import sys
 import tkinter
 import tkinter.ttk
 
+import fader
+import library
+import metrics
 import player
 import playlist
+import scheduler
 import settings
+import statestore
 import statuswindow
+import telemetry
 
 VERSION = '1.8.0'
 
+# Seconds before the end of a track when the next track is preloaded.
+PREROLL = 10
+# Milliseconds between checks that the end of a track was not missed.
+WATCHDOG_INTERVAL = 2000
+
 class Gui():
     def __init__(self, master, player_instance):
         self.init_ok = False
@@ -20,28 +32,38 @@ class Gui():
         self.log = logging.getLogger('MilongaPlayer')
         self.config_path = os.path.join(self.data_path, 'config.ini')
         config = self.load_config()
+        self.library = library.Library(
+            os.path.join(self.data_path, 'library.db'))
+        self.store = statestore.StateStore(
+            os.path.join(self.data_path, 'state'))
         startup_info = self.on_startup()
         self.master.winfo_toplevel().title(f"Milonga Player {VERSION}")
         self.master.protocol("WM_DELETE_WINDOW", self.on_close)
         self.player = ContiniousPlayer(self.master, player_instance)
+        self.general(self.settings.get('general', {}))
+        self.telemetry = telemetry.Telemetry(self.master, player_instance)
 
         # Buttons
         buttons = tkinter.ttk.Frame(master)
         tkinter.Button(buttons, command=self.configure, text='Settings').pack(side='left')
-        tkinter.Button(buttons, command=lambda : statuswindow.StatusWindow(self.master, player_instance),
+        tkinter.Button(buttons, command=lambda : statuswindow.StatusWindow(self.master, self.telemetry),
                        text='External Window').pack(side='left')
 
         # Playlists.
         upper = tkinter.ttk.Frame(master)
         self.playlist = playlist.PlayList(
-            upper, self.player, startup_info.get('playlists', {}))
+            upper,
+            self.player,
+            startup_info.get('playlists', {}),
+            self.store,
+            self.library)
         
         # Player controlls.
         bottom = tkinter.ttk.Frame(master)
         self.controlls = PlayerControlls(bottom, self.player)
 
         # Status bar.
-        status_bar = StatusBar(master, player_instance)
+        status_bar = StatusBar(master, player_instance, self.telemetry)
         status_bar.pack(side='top', fill=tkinter.X)
 
         buttons.pack(side='top')
@@ -80,6 +102,13 @@ class Gui():
             if 'playback' in section.lower():
                 set_binding(self.player, values)
 
+    def general(self, values):
+        """Apply general settings."""
+        values = {**settings.General.defaults(), **values}
+        self.library.loudness.set_enabled(values['normalize'])
+        self.player.player_instance.gains = (
+            self.library.loudness if values['normalize'] else None)
+
     def configure(self):
         """Configure settings."""
         new_settings = settings.SettingsDialog(self.master, 'Settings', self.settings)
@@ -115,26 +144,38 @@ class Gui():
         # First set saved windowed size and pos then set state.
         self.master.geometry(f'{width}x{height}+{posx}+{posy}')
         self.master.state(state)
+        metrics.registry.enabled = config.getboolean(
+            'metrics', 'enabled', fallback=False)
+        self.metrics_path = config.get(
+            'metrics', 'path',
+            fallback=os.path.join(self.data_path, 'metrics.txt'))
+        self.log.info(f'Metrics enabled: {metrics.registry.enabled}')
         return config
 
     def on_startup(self, *args, **kwargs):
         """
         Run only once uppon startup.
 
-        Sets various saved states from last run.
+        Sets various saved states from last run. State is loaded from the
+        state store, the single startup_info.dat of older versions is only
+        read if the store has no playlists yet and is returned so that it
+        can be converted.
         """
-        try:
-            path = os.path.join(self.data_path, 'startup_info.dat')
-            self.log.info(f'Reading startup info from: {path}')
-            with open(path, 'br') as fh:
-                startup_info = pickle.load(fh)
-        except:
-            self.log.error('Error during startup:', exc_info=True)
-            startup_info = {}
+        startup_info = {}
+        path = os.path.join(self.data_path, 'startup_info.dat')
+        if 'playlists' not in self.store.keys() and os.path.exists(path):
+            try:
+                self.log.info(f'Reading old startup info from: {path}')
+                with open(path, 'br') as fh:
+                    startup_info = pickle.load(fh)
+            except Exception:
+                self.log.error('Error reading old startup info:', exc_info=True)
+                startup_info = {}
+        main = startup_info.get('main') or self.store.load('main', {})
 
         # Setting key mapp.
         for key, default in (('settings', settings.SettingsDialog.defaults()),):
-            value = startup_info.get('main', {}).get(key, default)
+            value = main.get(key, default)
             self.log.debug(f'Setting: self.{key} to {value}')
             setattr(self, key, value)
         return startup_info
@@ -166,16 +207,20 @@ class Gui():
             with open(self.config_path, 'w') as fh:
                 config.write(fh)
                 self.log.debug(f'Close down info written to: {self.config_path}')
-            with open(os.path.join(self.data_path, 'startup_info.dat'), 'bw') as fh:
-                self.log.info(self.settings)
-                pickle.dump({'main': {'settings': self.settings},
-                             'playlists': self.playlist.on_close()},
-                            fh)
+            self.log.info(self.settings)
+            self.store.save('main', {'settings': self.settings})
+            self.playlist.on_close()
+            if metrics.registry.enabled:
+                metrics.registry.dump(self.metrics_path)
+            self.player.player_instance.transitions.write(
+                os.path.join(self.data_path, 'transitions.log'))
         except Exception as err:
             self.log.error('Something bad happened during shutdown', exc_info=True)
         else:
             self.log.info('Close down info saved successfully')
         finally:
+            self.player.close()
+            self.library.close()
             self.master.destroy()
             self.log.info('Shutting down!')
             logging.shutdown()
@@ -188,7 +233,7 @@ class Gui():
             
 class StatusBar(tkinter.ttk.Frame):
     """Display status of play."""
-    def __init__(self, master, player_instance, *args, **kwargs):
+    def __init__(self, master, player_instance, telemetry, *args, **kwargs):
         self.log = logging.getLogger('MilongaPlayer.StatusBar')
         self.log.info('initializing Status Bar')
         super().__init__(master, *args, **kwargs)
@@ -204,8 +249,7 @@ class StatusBar(tkinter.ttk.Frame):
                       variable=self.position,
                       command=self.slider_callback).pack(fill=tkinter.X)
         tkinter.ttk.Label(self, textvar=self.name).pack()
-        self.log.info('Starting worker in Status Bar')
-        self.worker()
+        telemetry.subscribe(self, self.on_telemetry)
         self.log.info('Status Bar initialization done')
 
     def slider_callback(self, value):
@@ -215,7 +259,7 @@ class StatusBar(tkinter.ttk.Frame):
         """
         self.player_instance.set_position(int(value)/1000)
 
-    def update_time(self, media):
+    def update_time(self, values):
         """
         Update time/duration values.
         """
@@ -224,23 +268,34 @@ class StatusBar(tkinter.ttk.Frame):
             minutes = (ms//(1000*60))%(60*60)
             secs = (ms//1000)%60
             return ':'.join([str(x).zfill(2) for x in (hours, minutes, secs)])
-        duration = convert_time(media.get_duration())
-        current_time = convert_time(max(0, self.player_instance.get_time()))
+        duration = convert_time(values['duration'])
+        current_time = convert_time(values['time'])
         self.time.set(f'{current_time}/{duration}')
 
-    def worker(self):
-        """Continiously update the status."""
-        media = self.player_instance.get_media()
-        if media:
-            name = os.path.basename(self.player_instance.current_track)
-            self.name.set(name)
-            self.position.set(self.player_instance.get_position()*1000)
-            self.update_time(media)
-        self.after(100, self.worker)
+    def on_telemetry(self, changed, values):
+        """Update the status with changed values from telemetry."""
+        if not 'time' in values:
+            return
+        if 'name' in changed:
+            self.name.set(values['name'])
+        if 'position' in changed:
+            self.position.set(values['position']*1000)
+        if 'time' in changed or 'duration' in changed:
+            self.update_time(values)
 
 class ContiniousPlayer():
     """
     Play music tracks continously.
+
+    The next track is started when the player reports the end of the
+    current one, the events are handed over to the Tk thread by a
+    scheduler. The upcoming track is preloaded PREROLL seconds before
+    the end. A slow watchdog only runs while playing, in case an event
+    is lost.
+
+    Playlists can give options for the current track, 'length' cuts it
+    after that many seconds and 'fade' fades it out over that many
+    seconds with 'curve' while the next track fades in.
     """
     def __init__(self, master, player_instance):
         self.log = logging.getLogger('MilongaPlayer.ContiniousPlayer')
@@ -249,6 +304,12 @@ class ContiniousPlayer():
         self.player_instance = player_instance
         self.playing = False
         self.paused = False
+        self.watchdog_id = None
+        self.transition = (0, fader.DEFAULT_CURVE)
+        self.scheduler = scheduler.Scheduler(master, self.on_event)
+        for name in ('playing', 'end', 'error', 'fade'):
+            player_instance.add_listener(
+                name, functools.partial(self.scheduler.post, name))
         self.log.info('initialization of ContinousPlayer done')
 
     def play(self, track=None):
@@ -261,6 +322,8 @@ class ContiniousPlayer():
             self.paused = not self.paused
             self.log.debug(f'Setting pause to: {self.paused}')
             self.player_instance.set_pause(self.paused)
+            if self.paused:
+                self.scheduler.cancel_timer()
             return
         else:
             self.playing = True
@@ -271,7 +334,7 @@ class ContiniousPlayer():
                 self.log.warning('Play unable to get track')
                 return
             self.player_instance.play(track)
-            self.worker()
+            self.start_watchdog()
 
     def stop(self):
         """
@@ -280,22 +343,38 @@ class ContiniousPlayer():
         self.log.info('Stop')
         self.playing = False
         self.paused = False
+        self.scheduler.cancel_timer()
+        if self.watchdog_id:
+            self.master.after_cancel(self.watchdog_id)
+            self.watchdog_id = None
         self.player_instance.stop()
+        self.player_instance.transitions.cancel()
+
+    def close(self):
+        """Stop playback and the scheduler."""
+        self.stop()
+        self.scheduler.stop()
 
+    @metrics.timed('player.next')
     def next(self):
         """
         Change to next track.
         """
         self.log.info('Next')
+        if self.playing:
+            self.player_instance.transitions.begin('next')
         track = self.get_track(1)
         self.log.debug(f'Next track: {track}')
         self.set_track(track)
 
+    @metrics.timed('player.previous')
     def previous(self):
         """
         Change to previous track.
         """
         self.log.info('Previous')
+        if self.playing:
+            self.player_instance.transitions.begin('previous')
         track = self.get_track(-1)
         self.log.debug(f'Previous track: {track}')
         self.set_track(track)
@@ -316,25 +395,81 @@ class ContiniousPlayer():
             self.log.debug('Is not playing, set next track without playing')
             self.player_instance.set_mrl(track)
         
+    def preload_next(self):
+        """Let the player prepare the track that will be played next."""
+        self.player_instance.preload(self.peek_track())
 
-    def worker(self):
-        """
-        Worker "thread" to continiously play.
-        """
-        if not self.playing:
-            self.log.info('Worker stopping')
-            self.player_instance.stop()
+
+    def on_event(self, name, track=None):
+        """Handle event from the scheduler."""
+        self.log.debug(f'Event: {name} {track}')
+        if name == 'preroll':
+            self.preload_next()
+        elif track != self.player_instance.current_track:
+            self.log.debug(f'Ignoring {name} for previous track: {track}')
+        elif name == 'playing':
+            self.schedule_preroll()
+            self.schedule_transition()
+        elif name == 'fade':
+            if self.playing and not self.paused:
+                self.advance(*self.transition)
+        elif self.playing and not self.paused:
+            self.advance()
+
+    def schedule_preroll(self):
+        """Preload the next track PREROLL seconds before the end."""
+        length = self.player_instance.get_length()
+        if length <= 0:
+            self.preload_next()
+            return
+        remaining = (length - max(0, self.player_instance.get_time())) / 1000
+        self.scheduler.set_timer(max(0, remaining - PREROLL), 'preroll')
+
+    def schedule_transition(self):
+        """Schedule the cut or fade out given by the track options."""
+        options = self.get_track_options()
+        fade = options.get('fade', 0)
+        cut = options.get('length', 0) * 1000
+        if not (fade or cut):
             return
-        if self.paused or self.player_instance.is_playing():
-            self.master.after(100, self.worker)
+        length = self.player_instance.get_length()
+        if length > 0:
+            cut = min(cut or length, length)
+        if cut <= 0:
             return
+        self.transition = (fade, options.get('curve', fader.DEFAULT_CURVE))
+        remaining = (cut - max(0, self.player_instance.get_time())) / 1000
+        self.player_instance.schedule_fade(
+            max(0, remaining - fade), fade, self.transition[1])
+        # Preload before the fade rather than before the end of the file.
+        self.scheduler.set_timer(max(0, remaining - fade - PREROLL), 'preroll')
+
+    @metrics.timed('player.advance')
+    def advance(self, fade=0, curve=fader.DEFAULT_CURVE):
+        """Continue with the next track."""
         track = self.get_track(1)
         if not track:
-            self.log.warning('Worker unable to get next track')
+            self.log.warning('Unable to get next track')
+            return
+        self.log.info(f'Playing next track: {track}')
+        self.player_instance.play(track, fade, curve)
+
+    def start_watchdog(self):
+        """Start watchdog unless it is already running."""
+        if not self.watchdog_id:
+            self.watchdog_id = self.master.after(
+                WATCHDOG_INTERVAL, self.watchdog)
+
+    def watchdog(self):
+        """Advance if the end of a track was missed."""
+        self.watchdog_id = None
+        if not self.playing:
             return
-        self.log.info(f'Worker playing track: {track}')
-        self.player_instance.play(track)
-        self.master.after(100, self.worker)
+        if not self.paused and not self.player_instance.is_busy():
+            self.log.warning('Player stopped without an event, advancing')
+            self.player_instance.transitions.begin('watchdog')
+            self.advance()
+        self.start_watchdog()
 
     def key_event(self, target, event):
         """Set keybinding"""
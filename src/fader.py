@@ -0,0 +1,130 @@
+import logging
+import math
+import threading
+import time
+
+# Seconds between volume steps of a ramp.
+STEP = 0.01
+
+# Gain curves for a fade in, from 0 to 1 as t goes from 0 to 1. A fade
+# out runs the curve backwards.
+CURVES = {
+    'linear': lambda t: t,
+    'equal power': lambda t: math.sin(t * math.pi / 2),
+    'quadratic': lambda t: t * t,
+    'smooth': lambda t: t * t * (3 - 2 * t),
+}
+DEFAULT_CURVE = 'linear'
+
+class Ramp():
+    """A volume change of one media player over time."""
+    def __init__(self, target, start, end, duration, curve, begin,
+                 on_start, on_done):
+        self.target = target
+        self.start = start
+        self.end = end
+        self.duration = duration
+        self.curve = CURVES.get(curve, CURVES[DEFAULT_CURVE])
+        self.begin = begin
+        self.on_start = on_start
+        self.on_done = on_done
+        self.started = False
+        self.volume = None
+
+    def volume_at(self, now):
+        """Volume at time now, and if the ramp is done."""
+        if self.duration <= 0:
+            return self.end, True
+        t = min(1.0, (now - self.begin) / self.duration)
+        if self.end >= self.start:
+            volume = self.start + (self.end - self.start) * self.curve(t)
+        else:
+            volume = self.end + (self.start - self.end) * self.curve(1 - t)
+        return int(round(volume)), t >= 1.0
+
+class Fader():
+    """
+    Run volume ramps on a dedicated thread.
+
+    Timing uses time.perf_counter and ramps can be scheduled ahead, so
+    fades start on time and stay smooth whatever the Tk thread is doing.
+    Every target has at most one ramp, a new ramp replaces the old one.
+    The on_start and on_done callbacks are called from the fader thread.
+    """
+    def __init__(self, step=STEP):
+        self.log = logging.getLogger('MilongaPlayer.Fader')
+        self.step = step
+        self.ramps = {}
+        self.condition = threading.Condition()
+        self.running = True
+        self.thread = threading.Thread(
+            target=self.run, name='Fader', daemon=True)
+        self.thread.start()
+
+    def ramp(self, target, start, end, duration, curve=DEFAULT_CURVE,
+             delay=0, on_start=None, on_done=None):
+        """
+        Change volume of target from start to end over duration seconds,
+        beginning after delay seconds.
+        """
+        begin = time.perf_counter() + max(0, delay)
+        with self.condition:
+            self.ramps[id(target)] = Ramp(target, start, end, duration, curve,
+                                          begin, on_start, on_done)
+            self.condition.notify()
+
+    def cancel(self, target):
+        """Cancel ramp of target, the volume is left as it is."""
+        with self.condition:
+            self.ramps.pop(id(target), None)
+
+    def is_ramping(self, target):
+        """True if target has a ramp that has started."""
+        ramp = self.ramps.get(id(target))
+        return bool(ramp and ramp.started)
+
+    def run(self):
+        """Step all ramps until stopped."""
+        while True:
+            callbacks = []
+            with self.condition:
+                if not self.running:
+                    return
+                now = time.perf_counter()
+                timeout = None
+                for key, ramp in list(self.ramps.items()):
+                    wait = ramp.begin - now if ramp.begin > now else self.step
+                    timeout = wait if timeout is None else min(timeout, wait)
+                    if ramp.begin > now:
+                        continue
+                    if not ramp.started:
+                        ramp.started = True
+                        callbacks.append(ramp.on_start)
+                    volume, done = ramp.volume_at(now)
+                    if volume != ramp.volume:
+                        ramp.volume = volume
+                        ramp.target.audio_set_volume(volume)
+                    if done:
+                        del self.ramps[key]
+                        callbacks.append(ramp.on_done)
+                if not callbacks:
+                    self.condition.wait(timeout)
+            # Callbacks may stop players or post events, they are called
+            # without holding the lock.
+            for callback in callbacks:
+                self.call(callback)
+
+    def call(self, callback):
+        """Call callback and log errors."""
+        if callback:
+            try:
+                callback()
+            except Exception:
+                self.log.error('Fader callback failed', exc_info=True)
+
+    def stop(self):
+        """Stop the fader thread."""
+        with self.condition:
+            self.running = False
+            self.ramps.clear()
+            self.condition.notify()
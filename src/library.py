@@ -0,0 +1,388 @@
+import collections
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import loudness
+import metadata
+import metrics
+import pathtrie
+import scanner
+import searchindex
+
+SCHEMA_VERSION = 2
+
+Diff = collections.namedtuple('Diff', ('added', 'removed', 'modified'))
+
+class Library():
+    """
+    Persistent index of the music files on disk.
+
+    Tracks are kept in a sqlite database keyed by path together with
+    their size and modification time. Root paths that has been scanned
+    are remembered, so a root is only walked once and later lookups are
+    answered from the index.
+
+    Every directory is stored with its modification time and
+    subdirectories, so that a rescan only has to list the directories
+    that has changed since last time.
+
+    All indexed files are also kept in a path trie that is shared by
+    everyone selecting files from the library, and in a search index by
+    their names and tags. Both are built on first use and kept up to
+    date by rescans.
+    """
+    def __init__(self, path, extentions=scanner.EXTENTIONS):
+        self.log = logging.getLogger('MilongaPlayer.Library')
+        self.path = path
+        self.scanner = scanner.Scanner(extentions)
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.log.info(f'Opening library: {path}')
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.create_tables()
+        self.trie = None
+        # Changes made while the trie is built, applied when it is done.
+        self.trie_changes = None
+        self.trie_lock = threading.Lock()
+        self.text_index = None
+        # Tags changed while the index is built, None for removed paths.
+        self.index_changes = None
+        self.index_lock = threading.Lock()
+        self.metadata = metadata.MetadataCache(self)
+        self.loudness = loudness.LoudnessCache(self)
+
+    def create_tables(self):
+        """
+        Create tables if they do not exist.
+
+        The index is only a cashe of what is on disk, so tables from an
+        older schema are dropped and rebuilt on next scan.
+        """
+        with self.lock, self.db:
+            self.db.execute('CREATE TABLE IF NOT EXISTS info ('
+                            'key TEXT PRIMARY KEY, value)')
+            row = self.db.execute(
+                "SELECT value FROM info WHERE key='schema'").fetchone()
+            if row and row[0] != SCHEMA_VERSION:
+                self.log.info(f'Rebuilding library from schema {row[0]}')
+                for table in ('tracks', 'roots', 'dirs'):
+                    self.db.execute(f'DROP TABLE IF EXISTS {table}')
+                self.db.execute("DELETE FROM info WHERE key='schema'")
+            self.db.execute('CREATE TABLE IF NOT EXISTS tracks ('
+                            'path TEXT PRIMARY KEY, '
+                            'dir TEXT, '
+                            'size INTEGER, '
+                            'mtime REAL) WITHOUT ROWID')
+            self.db.execute('CREATE INDEX IF NOT EXISTS tracks_dir '
+                            'ON tracks (dir)')
+            self.db.execute('CREATE TABLE IF NOT EXISTS dirs ('
+                            'path TEXT PRIMARY KEY, '
+                            'mtime REAL, '
+                            'subdirs TEXT) WITHOUT ROWID')
+            self.db.execute('CREATE TABLE IF NOT EXISTS roots ('
+                            'path TEXT PRIMARY KEY, '
+                            'scanned REAL)')
+            self.db.execute('INSERT OR IGNORE INTO info VALUES '
+                            "('schema', ?), ('version', 0)",
+                            (SCHEMA_VERSION, ))
+
+    def close(self):
+        """Close the database."""
+        self.metadata.close()
+        self.loudness.close()
+        with self.lock:
+            self.db.close()
+
+    @property
+    def version(self):
+        """Counter that is stepped every time the index changes."""
+        with self.lock:
+            return self.db.execute(
+                "SELECT value FROM info WHERE key='version'").fetchone()[0]
+
+    def bump_version(self):
+        """Step version, call with the lock held and within a transaction."""
+        self.db.execute(
+            "UPDATE info SET value=value+1 WHERE key='version'")
+
+    @staticmethod
+    def prefix_range(root):
+        """
+        Range of paths that lies below root.
+
+        Paths are stored as produced by walking root so every file below it
+        starts with root and a separator, that makes the subtree a
+        contigous range in the primary key index.
+        """
+        if root.endswith(('/', os.sep)):
+            prefix = root
+        else:
+            prefix = root + os.sep
+        return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+    def is_scanned(self, root):
+        """Return True if root has been scanned."""
+        with self.lock:
+            return self.db.execute('SELECT 1 FROM roots WHERE path=?',
+                                   (root, )).fetchone() is not None
+
+    def known(self, paths):
+        """The paths of paths that are indexed."""
+        paths = list(paths)
+        found = set()
+        with self.lock:
+            # Stay below the limit of SQLite on the number of parameters.
+            for start in range(0, len(paths), 500):
+                chunk = paths[start:start + 500]
+                cursor = self.db.execute(
+                    'SELECT path FROM tracks WHERE path IN '
+                    f'({",".join("?" * len(chunk))})', chunk)
+                found.update(row[0] for row in cursor)
+        return found
+
+    def files(self, root):
+        """
+        Get all indexed files below root.
+
+        Root is scanned first if it has not been scanned before.
+        """
+        if not self.is_scanned(root):
+            self.scan([root])
+        low, high = self.prefix_range(root)
+        with self.lock:
+            cursor = self.db.execute(
+                'SELECT path FROM tracks WHERE path>=? AND path<? '
+                'ORDER BY path', (low, high))
+            return [row[0] for row in cursor]
+
+    def tree(self, roots=()):
+        """
+        Shared trie of all indexed files.
+
+        Roots that has not been scanned before are scanned first. Hold the
+        lock while using the trie, rescans update it in place.
+
+        The trie is built without holding the lock, so that others can
+        use the library meanwhile. Rescans done during the build are
+        applied before it is put in place. Do not call with the lock held.
+        """
+        for root in roots:
+            if not self.is_scanned(root):
+                self.scan([root])
+        with self.trie_lock:
+            with self.lock:
+                if self.trie is not None:
+                    return self.trie
+                self.trie_changes = []
+                paths = [row[0] for row in
+                         self.db.execute('SELECT path FROM tracks')]
+            trie = pathtrie.PathTrie(paths)
+            with self.lock:
+                for removed, added in self.trie_changes:
+                    for path in removed:
+                        trie.remove(path)
+                    for path in added:
+                        trie.add(path)
+                self.trie_changes = None
+                self.trie = trie
+            self.log.info(f'Built trie of {len(trie)} tracks')
+            return trie
+
+    def index(self, paths=(), wait=True):
+        """
+        Shared search index of all indexed files, by name and tags.
+
+        Paths that are not in the library, like files added directly to a
+        playlist, are added to the index as well. Hold the lock while
+        using the index, rescans and metadata reads update it in place.
+
+        The index is built on first use, unless wait is False, then None
+        is returned while another thread builds it. Do not call with the
+        lock held.
+        """
+        if self.text_index is None:
+            if not self.index_lock.acquire(wait):
+                return None
+            try:
+                self.build_index()
+            finally:
+                self.index_lock.release()
+        with self.lock:
+            missing = [path for path in paths if path not in self.text_index]
+            if missing:
+                self.index_paths(missing)
+            return self.text_index
+
+    def build_index(self):
+        """
+        Build the search index, call with the index lock held.
+
+        The index is built without holding the lock, so that others can
+        use the library meanwhile. Changes made during the build are
+        applied before it is put in place.
+        """
+        with self.lock:
+            if self.text_index is not None:
+                return
+            self.index_changes = {}
+            tracks = [row[0] for row in
+                      self.db.execute('SELECT path FROM tracks')]
+        tags = self.metadata.cached(tracks)
+        text_index = searchindex.SearchIndex()
+        for path in tracks:
+            text_index.add(path, searchindex.describe(path, tags.get(path)))
+        text_index.merge()
+        with self.lock:
+            for path, values in self.index_changes.items():
+                if values is None:
+                    text_index.remove(path)
+                else:
+                    text_index.add(path, searchindex.describe(path, values))
+            self.index_changes = None
+            self.text_index = text_index
+        self.log.info(f'Built search index of {len(tracks)} tracks')
+
+    def prepare_index(self, paths=()):
+        """Build the search index in a background thread."""
+        threading.Thread(target=self.index, args=(list(paths), ),
+                         name='SearchIndex', daemon=True).start()
+
+    def index_paths(self, paths):
+        """Put paths in the search index with their cached tags."""
+        paths = list(paths)
+        tags = self.metadata.cached(paths)
+        self.index_tags({path: tags.get(path) for path in paths})
+
+    def index_tags(self, tags, indexed=False):
+        """
+        Put paths in the search index with their tags, if it is built or
+        being built. With indexed only paths already in a built index are
+        updated.
+
+        Tags maps paths to tags. Call with the lock held.
+        """
+        if self.text_index is not None:
+            for path, values in tags.items():
+                if not indexed or path in self.text_index:
+                    self.text_index.add(path, searchindex.describe(path, values))
+        elif self.index_changes is not None:
+            self.index_changes.update(
+                (path, values or {}) for path, values in tags.items())
+
+    def remove_tree(self, path, diff):
+        """
+        Remove everything indexed in and below path.
+
+        Call with the lock held and within a transaction.
+        """
+        low, high = self.prefix_range(path)
+        cursor = self.db.execute(
+            'SELECT path FROM tracks WHERE dir=? OR (path>=? AND path<?)',
+            (path, low, high))
+        diff.removed.extend(row[0] for row in cursor)
+        self.db.execute(
+            'DELETE FROM tracks WHERE dir=? OR (path>=? AND path<?)',
+            (path, low, high))
+        self.db.execute(
+            'DELETE FROM dirs WHERE path=? OR (path>=? AND path<?)',
+            (path, low, high))
+
+    def update_dir(self, directory, diff):
+        """
+        Update index for a single directory that has been listed.
+
+        Call with the lock held and within a transaction.
+        """
+        path, mtime, tracks, subdirs = directory
+        indexed = {row[0]: (row[1], row[2]) for row in self.db.execute(
+            'SELECT path, size, mtime FROM tracks WHERE dir=?', (path, ))}
+        row = self.db.execute(
+            'SELECT subdirs FROM dirs WHERE path=?', (path, )).fetchone()
+        old_subdirs = row[0].split('\0') if row and row[0] else []
+        removed = [p for p in indexed if p not in tracks]
+        added = [p for p in tracks if p not in indexed]
+        modified = [p for p in tracks
+                    if p in indexed and indexed[p] != tracks[p]]
+        self.db.executemany('DELETE FROM tracks WHERE path=?',
+                            ((p, ) for p in removed))
+        self.db.executemany(
+            'INSERT OR REPLACE INTO tracks VALUES (?, ?, ?, ?)',
+            ((p, path) + tracks[p] for p in added + modified))
+        self.db.execute('INSERT OR REPLACE INTO dirs VALUES (?, ?, ?)',
+                        (path, mtime, '\0'.join(subdirs)))
+        diff.added.extend(added)
+        diff.removed.extend(removed)
+        diff.modified.extend(modified)
+        for name in set(old_subdirs) - set(subdirs):
+            self.remove_tree(os.path.join(path, name), diff)
+
+    def snapshot(self, path, mtime):
+        """Stored subdirectories of path if it is unchanged, else None."""
+        with self.lock:
+            row = self.db.execute('SELECT mtime, subdirs FROM dirs '
+                                  'WHERE path=?', (path, )).fetchone()
+        if row and row[0] == mtime:
+            return row[1].split('\0') if row[1] else []
+        return None
+
+    @metrics.timed('library.rescan')
+    def rescan(self, roots, force=False):
+        """
+        Incrementally rescan roots.
+
+        Only directories whose modification time differ from the stored
+        snapshot are listed again, unchanged directories are descended
+        using their stored subdirectories. With force every directory is
+        listed. Returns a Diff with the added, removed and modified tracks.
+
+        Files rewritten in place do not change the modification time of
+        their directory, they are only reported as modified when the
+        directory is listed, use force to find them.
+        """
+        roots = list(roots)
+        self.log.info(f'Scanning: {roots}, {force=}')
+        diff = Diff([], [], [])
+        listed = 0
+        snapshot = None if force else self.snapshot
+        for batch in self.scanner.walk(roots, snapshot):
+            with self.lock, self.db:
+                for directory in batch:
+                    if directory.mtime is None:
+                        self.remove_tree(directory.path, diff)
+                    elif directory.tracks is not None:
+                        listed += 1
+                        self.update_dir(directory, diff)
+        with self.lock, self.db:
+            self.db.executemany('INSERT OR REPLACE INTO roots VALUES (?, ?)',
+                                ((root, time.time()) for root in roots))
+            if any(diff):
+                self.bump_version()
+            if self.trie is not None:
+                for path in diff.removed:
+                    self.trie.remove(path)
+                for path in diff.added:
+                    self.trie.add(path)
+            elif self.trie_changes is not None:
+                self.trie_changes.append((diff.removed, diff.added))
+            if self.text_index is not None:
+                for path in diff.removed:
+                    self.text_index.remove(path)
+            elif self.index_changes is not None:
+                self.index_changes.update(
+                    (path, None) for path in diff.removed)
+            if self.text_index is not None or self.index_changes is not None:
+                self.index_paths(diff.added + diff.modified)
+        self.log.info(f'Scanned {roots}, listed {listed} directories, '
+                      f'{len(diff.added)} added, {len(diff.removed)} removed, '
+                      f'{len(diff.modified)} modified')
+        self.loudness.analyse(diff.added + diff.modified)
+        return diff
+
+    def scan(self, roots):
+        """Scan roots from scratch, ignoring any stored snapshots."""
+        return self.rescan(roots, force=True)
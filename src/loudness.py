@@ -0,0 +1,202 @@
+import concurrent.futures
+import logging
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+# Loudness that tracks are adjusted to in LUFS, the ReplayGain 2.0
+# reference level.
+TARGET = -18.0
+# Largest boost in dB, quiet transfers are not lifted further than this.
+MAX_GAIN = 12.0
+MAX_WORKERS = max(1, (os.cpu_count() or 2) // 2)
+BATCH_SIZE = 20
+FFMPEG = shutil.which('ffmpeg')
+
+LOUDNESS = re.compile(r'I:\s+(-?[\d.]+|-inf) LUFS')
+PEAK = re.compile(r'Peak:\s+(-?[\d.]+|-inf) dBFS')
+
+def analyse(path, processes=None):
+    """
+    Measure integrated loudness in LUFS and true peak in dBFS of path.
+
+    The track is decoded by an ffmpeg process with the ebur128 filter,
+    running at the lowest priority. Started processes are added to the
+    set processes while they run.
+    """
+    command = [FFMPEG, '-nostdin', '-hide_banner', '-nostats', '-vn',
+               '-i', path, '-af', 'ebur128=peak=true', '-f', 'null', '-']
+    kwargs = {}
+    if os.name == 'nt':
+        kwargs['creationflags'] = (subprocess.IDLE_PRIORITY_CLASS |
+                                   subprocess.CREATE_NO_WINDOW)
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL,
+                               stderr=subprocess.PIPE, **kwargs)
+    if os.name != 'nt':
+        # Lowered after the start, preexec_fn is not safe with threads.
+        try:
+            os.setpriority(os.PRIO_PROCESS, process.pid, 19)
+        except OSError:
+            pass
+    if processes is not None:
+        processes.add(process)
+    try:
+        _, stderr = process.communicate()
+    finally:
+        if processes is not None:
+            processes.discard(process)
+    text = stderr.decode(errors='replace')
+    summary = text[text.rfind('Summary:'):]
+    loudness = LOUDNESS.search(summary)
+    if process.returncode or not loudness:
+        raise ValueError(f'ffmpeg exited with {process.returncode}')
+    peak = PEAK.search(summary)
+    return float(loudness.group(1)), float(peak.group(1)) if peak else None
+
+def gain(loudness, peak=None):
+    """Gain in dB that brings loudness to TARGET without clipping."""
+    if loudness is None or loudness == float('-inf'):
+        return None
+    value = min(TARGET - loudness, MAX_GAIN)
+    if peak is not None:
+        value = min(value, -peak)
+    return value
+
+class LoudnessCache():
+    """
+    Loudness of tracks, cached in the library database.
+
+    Entries are keyed by path and only valid while size and modification
+    time match the file, so changed files are analysed again. Every
+    result is stored as soon as it is done, an analysis that is stopped
+    picks up where it was on next start. Tracks that can not be analysed
+    are stored without loudness and not tried again until they change.
+
+    Analysis needs ffmpeg, without it no gains are known.
+    """
+    def __init__(self, library, max_workers=MAX_WORKERS):
+        self.log = logging.getLogger('MilongaPlayer.Loudness')
+        self.library = library
+        self.max_workers = max_workers
+        self.enabled = False
+        self.pool = None
+        self.pending = set()
+        # Gains of valid entries, read from the database when analysis
+        # starts so that track changes never wait for the library lock.
+        self.gains = {}
+        self.pending_lock = threading.Lock()
+        self.processes = set()
+        with library.lock, library.db:
+            library.db.execute(
+                'CREATE TABLE IF NOT EXISTS loudness ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+                'loudness REAL, peak REAL) WITHOUT ROWID')
+
+    @property
+    def available(self):
+        """True if tracks can be analysed."""
+        return FFMPEG is not None
+
+    def set_enabled(self, enabled):
+        """Start or stop background analysis."""
+        self.enabled = enabled
+        if not enabled:
+            self.close()
+        elif not self.available:
+            self.log.warning('ffmpeg not found, loudness is not analysed')
+        else:
+            self.start()
+
+    def gain(self, path):
+        """Cached gain in dB for path, None if it is not known."""
+        return self.gains.get(path)
+
+    def load_gains(self):
+        """Read the gains of all valid entries."""
+        with self.library.lock:
+            rows = self.library.db.execute(
+                'SELECT l.path, l.loudness, l.peak FROM loudness l '
+                'LEFT JOIN tracks k ON k.path=l.path WHERE '
+                'k.path IS NULL OR (k.size=l.size AND k.mtime=l.mtime)'
+            ).fetchall()
+        gains = {}
+        for path, loudness, peak in rows:
+            value = gain(loudness, peak)
+            if value is not None:
+                gains[path] = value
+        self.gains = gains
+        self.log.info(f'Loaded gains of {len(gains)} tracks')
+
+    def start(self):
+        """Start analysing all indexed tracks that have no valid entry."""
+        if not (self.enabled and self.available):
+            return
+        if not self.pool:
+            self.pool = concurrent.futures.ThreadPoolExecutor(
+                self.max_workers, thread_name_prefix='Loudness')
+        self.pool.submit(self.analyse_missing)
+
+    def analyse_missing(self):
+        """Queue tracks without a valid entry, run in worker thread."""
+        self.load_gains()
+        with self.library.lock:
+            missing = [row[0] for row in self.library.db.execute(
+                'SELECT k.path FROM tracks k '
+                'LEFT JOIN loudness l ON l.path=k.path '
+                'WHERE l.path IS NULL OR l.size!=k.size OR l.mtime!=k.mtime '
+                'ORDER BY k.path')]
+        self.log.info(f'{len(missing)} tracks to analyse')
+        self.analyse(missing)
+
+    def analyse(self, paths):
+        """Queue paths for analysis, if enabled."""
+        if not (self.enabled and self.pool):
+            return
+        with self.pending_lock:
+            paths = [path for path in paths if path not in self.pending]
+            self.pending.update(paths)
+        # The files have changed, their old gains are not valid.
+        for path in paths:
+            self.gains.pop(path, None)
+        for start in range(0, len(paths), BATCH_SIZE):
+            self.pool.submit(self.analyse_batch, paths[start:start + BATCH_SIZE])
+
+    def analyse_batch(self, paths):
+        """Analyse paths and store the results, run in worker thread."""
+        for path in paths:
+            if not self.pool:
+                return
+            stat = None
+            try:
+                stat = os.stat(path)
+                loudness, peak = analyse(path, self.processes)
+            except Exception as err:
+                self.log.warning(f'Could not analyse {path}: {err}')
+                loudness = peak = None
+            finally:
+                with self.pending_lock:
+                    self.pending.discard(path)
+            if not self.pool:
+                # Stopped while running, the result is not to be trusted.
+                return
+            if stat is None:
+                continue
+            with self.library.lock, self.library.db:
+                self.library.db.execute(
+                    'INSERT OR REPLACE INTO loudness VALUES (?, ?, ?, ?, ?)',
+                    (path, stat.st_size, stat.st_mtime, loudness, peak))
+            value = gain(loudness, peak)
+            if value is not None:
+                self.gains[path] = value
+
+    def close(self):
+        """Stop analysis, running ffmpeg processes are killed."""
+        pool, self.pool = self.pool, None
+        if pool:
+            pool.shutdown(wait=False)
+        for process in list(self.processes):
+            process.kill()
+        with self.pending_lock:
+            self.pending.clear()
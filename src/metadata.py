@@ -0,0 +1,358 @@
+import concurrent.futures
+import logging
+import os
+import queue
+import struct
+import threading
+
+# Columns that can be shown from tag metadata.
+COLUMNS = ('artist', 'singer', 'title', 'year', 'genre', 'duration')
+
+# Largest ID3v2 tag that is read, bigger tags are mostly cover art.
+MAX_TAG_SIZE = 256 * 1024
+# How far past the tag to look for the first MPEG frame.
+FRAME_SEARCH_SIZE = 64 * 1024
+MAX_WORKERS = 4
+CHUNK_SIZE = 200
+
+# ID3v2 frame to column, three letter ids are from ID3v2.2.
+FRAMES = {'TPE1': 'artist', 'TP1': 'artist',
+          'TIT2': 'title', 'TT2': 'title',
+          'TYER': 'year', 'TDRC': 'year', 'TYE': 'year',
+          'TCON': 'genre', 'TCO': 'genre',
+          'TLEN': 'duration', 'TLE': 'duration'}
+# Descriptions of user defined text frames that hold the singer.
+SINGER_FRAMES = ('singer', 'vocals', 'vocalist')
+
+BITRATES = {(1, 1): (0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448),
+            (1, 2): (0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384),
+            (1, 3): (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+            (2, 1): (0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256),
+            (2, 2): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+            (2, 3): (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160)}
+SAMPLE_RATES = {1: (44100, 48000, 32000),
+                2: (22050, 24000, 16000),
+                2.5: (11025, 12000, 8000)}
+
+def decode_text(data):
+    """Decode an ID3v2 text frame."""
+    if not data:
+        return ''
+    encoding = {0: 'latin-1', 1: 'utf-16', 2: 'utf-16-be', 3: 'utf-8'}.get(
+        data[0], 'latin-1')
+    return data[1:].decode(encoding, 'replace').split('\x00')[0].strip()
+
+def split_terminated(data, wide):
+    """Split data at the first null terminator, two bytes if wide."""
+    if not wide:
+        head, _, tail = data.partition(b'\x00')
+        return head, tail
+    for index in range(0, len(data) - 1, 2):
+        if data[index:index + 2] == b'\x00\x00':
+            return data[:index], data[index + 2:]
+    return data, b''
+
+def syncsafe(data):
+    """Decode a 28 bit syncsafe integer."""
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+def parse_id3v2(fh):
+    """
+    Parse ID3v2 tag at start of file.
+
+    Returns the tags found and the size of the tag in bytes.
+    """
+    header = fh.read(10)
+    if len(header) < 10 or header[:3] != b'ID3':
+        return {}, 0
+    major, flags = header[3], header[5]
+    size = syncsafe(header[6:10])
+    tag_size = 10 + size + (10 if flags & 0x10 else 0)
+    data = fh.read(min(size, MAX_TAG_SIZE))
+    if flags & 0x80 and major < 4:
+        data = data.replace(b'\xff\x00', b'\xff')
+    position = 0
+    if flags & 0x40 and major >= 3:
+        ext_size = struct.unpack('>I', data[:4])[0]
+        position = syncsafe(data[:4]) if major == 4 else ext_size + 4
+    id_size, header_size = (3, 6) if major == 2 else (4, 10)
+    tags = {}
+    while position + header_size <= len(data):
+        frame_id = data[position:position + id_size]
+        if not frame_id.strip(b'\x00'):
+            break
+        if major == 2:
+            frame_size = int.from_bytes(data[position + 3:position + 6], 'big')
+        elif major == 4:
+            frame_size = syncsafe(data[position + 4:position + 8])
+        else:
+            frame_size = struct.unpack('>I', data[position + 4:position + 8])[0]
+        body = data[position + header_size:position + header_size + frame_size]
+        position += header_size + frame_size
+        frame_id = frame_id.decode('latin-1')
+        if frame_id in FRAMES:
+            tags.setdefault(FRAMES[frame_id], decode_text(body))
+        elif frame_id in ('TXXX', 'TXX'):
+            description, value = split_terminated(
+                body[1:], body[:1] in (b'\x01', b'\x02'))
+            if decode_text(body[:1] + description).lower() in SINGER_FRAMES:
+                tags.setdefault('singer', decode_text(body[:1] + value))
+    return tags, tag_size
+
+def parse_id3v1(fh, file_size):
+    """Parse ID3v1 tag at end of file."""
+    if file_size < 128:
+        return {}
+    fh.seek(file_size - 128)
+    data = fh.read(128)
+    if data[:3] != b'TAG':
+        return {}
+    def text(start, end):
+        return data[start:end].split(b'\x00')[0].decode('latin-1').strip()
+    return {key: value for key, value in (('title', text(3, 33)),
+                                          ('artist', text(33, 63)),
+                                          ('year', text(93, 97))) if value}
+
+def mpeg_duration(fh, offset, audio_size):
+    """
+    Duration in seconds from the first MPEG frame after offset.
+
+    Uses the frame count of a Xing/Info or VBRI header if there is one,
+    otherwise the bitrate of the first frame.
+    """
+    fh.seek(offset)
+    data = fh.read(FRAME_SEARCH_SIZE)
+    index = data.find(b'\xff')
+    while 0 <= index < len(data) - 4:
+        b1, b2, b3 = data[index + 1], data[index + 2], data[index + 3]
+        version = {3: 1, 2: 2, 0: 2.5}.get((b1 >> 3) & 3)
+        layer = {3: 1, 2: 2, 1: 3}.get((b1 >> 1) & 3)
+        bitrate_index, rate_index = b2 >> 4, (b2 >> 2) & 3
+        if ((b1 & 0xe0) == 0xe0 and version and layer and
+                0 < bitrate_index < 15 and rate_index < 3):
+            break
+        index = data.find(b'\xff', index + 1)
+    else:
+        return None
+    bitrate = BITRATES[(min(version, 2), layer)][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version][rate_index]
+    samples = 384 if layer == 1 else 1152 if layer == 2 or version == 1 else 576
+    mono = (b3 >> 6) == 3
+    side_info = (17 if mono else 32) if version == 1 else (9 if mono else 17)
+    xing = index + 4 + side_info
+    frames = None
+    if data[xing:xing + 4] in (b'Xing', b'Info'):
+        flags = struct.unpack('>I', data[xing + 4:xing + 8])[0]
+        if flags & 1:
+            frames = struct.unpack('>I', data[xing + 8:xing + 12])[0]
+    elif data[index + 36:index + 40] == b'VBRI':
+        frames = struct.unpack('>I', data[index + 50:index + 54])[0]
+    if frames:
+        return frames * samples / sample_rate
+    return (audio_size - index) * 8 / bitrate
+
+def read_tags(path):
+    """
+    Read tag metadata from file.
+
+    Only the ID3v2 tag at the start, the first audio frame and the ID3v1
+    tag at the end of the file are read. Returns size, modification time
+    and a dict of tags.
+    """
+    stat = os.stat(path)
+    with open(path, 'rb') as fh:
+        tags, tag_size = parse_id3v2(fh)
+        for key, value in parse_id3v1(fh, stat.st_size).items():
+            tags.setdefault(key, value)
+        duration = None
+        if tags.get('duration', '').isdigit():
+            duration = int(tags['duration']) / 1000
+        if not duration:
+            duration = mpeg_duration(fh, tag_size, stat.st_size - tag_size)
+    tags['duration'] = duration
+    if tags.get('year'):
+        tags['year'] = tags['year'][:4]
+    genre = tags.get('genre', '')
+    if genre.startswith('(') and ')' in genre:
+        # ID3v1 genre number reference, keep the text after it if any.
+        tags['genre'] = genre[genre.index(')') + 1:].strip()
+    return stat.st_size, stat.st_mtime, tags
+
+def unchanged(path, size, mtime):
+    """True if the file at path still has size and modification time."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return False
+    return stat.st_size == size and stat.st_mtime == mtime
+
+def describe(path, tags):
+    """Text for a track, title and artist if known otherwise file name."""
+    if not tags or not tags.get('title'):
+        return os.path.basename(path)
+    text = tags['title']
+    if tags.get('artist'):
+        text = f'{text} - {tags["artist"]}'
+    if tags.get('year'):
+        text = f'{text} ({tags["year"]})'
+    return text
+
+def format_duration(seconds):
+    """Format duration in seconds as m:ss."""
+    if seconds is None or seconds == '':
+        return ''
+    seconds = int(round(seconds))
+    return f'{seconds // 60}:{str(seconds % 60).zfill(2)}'
+
+class MetadataCache():
+    """
+    Tag metadata for tracks, cached in the library database.
+
+    Entries are keyed by path and only valid while size and modification
+    time match what the library has indexed for the path, or the file
+    itself for paths not in the library. Missing entries are read by a
+    pool of worker threads.
+    """
+    def __init__(self, library, max_workers=MAX_WORKERS):
+        self.log = logging.getLogger('MilongaPlayer.Metadata')
+        self.library = library
+        self.pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+        # Paths being read, mapped to the callbacks waiting for them.
+        self.pending = {}
+        self.pending_lock = threading.Lock()
+        with library.lock, library.db:
+            library.db.execute(
+                'CREATE TABLE IF NOT EXISTS tags ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime REAL, '
+                + ', '.join(f'{column}' for column in COLUMNS) +
+                ') WITHOUT ROWID')
+
+    def close(self):
+        """Stop workers, does not wait for work in progress."""
+        self.pool.shutdown(wait=False)
+
+    def cached(self, paths):
+        """
+        Get cached metadata for paths, as a dict path -> tags.
+
+        Tracks of the library are checked against their indexed size and
+        modification time, other files, like files added directly to a
+        playlist, are checked against the file itself.
+        """
+        paths = list(paths)
+        result = {}
+        columns = ', '.join(f't.{column}' for column in COLUMNS)
+        for start in range(0, len(paths), 500):
+            chunk = paths[start:start + 500]
+            # Locked per chunk so that long lookups let others in between.
+            with self.library.lock:
+                cursor = self.library.db.execute(
+                    f'SELECT t.path, t.size, t.mtime, k.path IS NULL, {columns} '
+                    'FROM tags t LEFT JOIN tracks k ON k.path=t.path '
+                    f'WHERE t.path IN ({",".join("?" * len(chunk))}) AND '
+                    '(k.path IS NULL OR (k.size=t.size AND k.mtime=t.mtime))',
+                    chunk)
+                rows = cursor.fetchall()
+            for row in rows:
+                if row[3] and not unchanged(row[0], row[1], row[2]):
+                    continue
+                result[row[0]] = dict(zip(COLUMNS, row[4:]))
+        return result
+
+    def request(self, paths, callback):
+        """
+        Get metadata for paths.
+
+        Cached metadata is returned directly, the rest is read in the
+        background and passed to callback in chunks, from a worker thread.
+        """
+        result = self.cached(paths)
+        missing = []
+        with self.pending_lock:
+            for path in paths:
+                if path in result:
+                    continue
+                if path not in self.pending:
+                    missing.append(path)
+                self.pending.setdefault(path, []).append(callback)
+        for start in range(0, len(missing), CHUNK_SIZE):
+            self.pool.submit(
+                self.read_chunk, missing[start:start + CHUNK_SIZE])
+        return result
+
+    def read_chunk(self, paths):
+        """Read and cache metadata for paths, run in worker thread."""
+        result = {}
+        rows = []
+        for path in paths:
+            try:
+                size, mtime, tags = read_tags(path)
+            except Exception as err:
+                self.log.warning(f'Could not read tags from {path}: {err}')
+                tags = {}
+                size = mtime = None
+            result[path] = tags
+            if size is not None:
+                rows.append((path, size, mtime) +
+                            tuple(tags.get(column) for column in COLUMNS))
+        with self.library.lock, self.library.db:
+            self.library.db.executemany(
+                'INSERT OR REPLACE INTO tags VALUES '
+                f'({", ".join("?" * (3 + len(COLUMNS)))})', rows)
+            self.library.index_tags(result, indexed=True)
+        waiting = {}
+        with self.pending_lock:
+            for path in paths:
+                for callback in self.pending.pop(path, ()):
+                    waiting.setdefault(callback, {})[path] = result[path]
+        for callback, tags in waiting.items():
+            try:
+                callback(tags)
+            except Exception:
+                self.log.error('Metadata callback failed', exc_info=True)
+
+class Requester():
+    """
+    Deliver metadata to a Tk widget.
+
+    Metadata read in the background is put on a queue that is polled from
+    the mainloop while requests are outstanding, on_result is called with
+    a dict path -> tags in the mainloop.
+    """
+    POLL_INTERVAL = 100
+
+    def __init__(self, widget, cache, on_result):
+        self.widget = widget
+        self.cache = cache
+        self.on_result = on_result
+        self.results = queue.Queue()
+        self.outstanding = 0
+        self.polling = False
+
+    def request(self, paths):
+        """Request metadata, returns what is cached."""
+        paths = list(paths)
+        result = self.cache.request(paths, self.results.put)
+        self.outstanding += len(set(paths) - set(result))
+        if self.outstanding and not self.polling:
+            self.polling = True
+            self.widget.after(self.POLL_INTERVAL, self.poll)
+        return result
+
+    def poll(self):
+        """Move results from the queue to on_result."""
+        result = {}
+        while True:
+            try:
+                chunk = self.results.get_nowait()
+            except queue.Empty:
+                break
+            result.update(chunk)
+        if result:
+            self.outstanding = max(0, self.outstanding - len(result))
+            self.on_result(result)
+        if self.outstanding and self.cache.pending:
+            self.widget.after(self.POLL_INTERVAL, self.poll)
+        else:
+            self.outstanding = 0
+            self.polling = False
@@ -0,0 +1,178 @@
+import bisect
+import collections
+import cProfile
+import functools
+import logging
+import threading
+import time
+
+# Number of recent samples kept per metric.
+SIZE = 1000
+# Upper bounds in milliseconds of the histogram buckets.
+BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000)
+PROFILE_SECONDS = 30
+
+class Metric():
+    """
+    Durations of one timed operation.
+
+    The latest SIZE samples are kept in a ring buffer for percentiles and
+    the histogram, count, total and max cover the whole run.
+    """
+    def __init__(self, name, size=SIZE):
+        self.name = name
+        self.samples = collections.deque(maxlen=size)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        """Add a sample in milliseconds."""
+        self.samples.append(value)
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def histogram(self):
+        """Number of recent samples in each of BUCKETS and above them."""
+        counts = [0] * (len(BUCKETS) + 1)
+        for value in self.samples:
+            counts[bisect.bisect_left(BUCKETS, value)] += 1
+        return counts
+
+    def summary(self):
+        """Count, total, mean, percentiles of recent samples and max."""
+        ordered = sorted(self.samples)
+        def percentile(p):
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+        return {'name': self.name,
+                'count': self.count,
+                'total': self.total,
+                'mean': self.total / self.count if self.count else 0.0,
+                'p50': percentile(0.5),
+                'p95': percentile(0.95),
+                'max': self.max,
+                'histogram': self.histogram()}
+
+class Registry():
+    """
+    Timings and counters of the application.
+
+    Everything is off until enabled, then timed calls cost one clock read
+    before and after. Metrics can be recorded from any thread.
+    """
+    def __init__(self):
+        self.log = logging.getLogger('MilongaPlayer.Metrics')
+        self.enabled = False
+        self.metrics = {}
+        self.counters = collections.Counter()
+        self.lock = threading.Lock()
+        self.profiler = None
+
+    def add(self, name, value):
+        """Add a duration in milliseconds to metric name."""
+        with self.lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Metric(name)
+            metric.add(value)
+
+    def count(self, name, number=1):
+        """Step counter name, if enabled."""
+        if self.enabled:
+            with self.lock:
+                self.counters[name] += number
+
+    def clear(self):
+        """Forget everything recorded."""
+        with self.lock:
+            self.metrics = {}
+            self.counters = collections.Counter()
+
+    def summary(self):
+        """Summaries of all metrics, sorted by name, and the counters."""
+        with self.lock:
+            metrics = [metric.summary() for name, metric in
+                       sorted(self.metrics.items())]
+            counters = dict(sorted(self.counters.items()))
+        return metrics, counters
+
+    def report(self):
+        """Summary as text."""
+        metrics, counters = self.summary()
+        lines = [f'Metrics {time.strftime("%Y-%m-%d %H:%M:%S")}',
+                 f'{"name":<36}{"count":>8}{"mean":>10}{"p50":>10}'
+                 f'{"p95":>10}{"max":>10}{"total":>12}']
+        for m in metrics:
+            lines.append(f'{m["name"]:<36}{m["count"]:>8}{m["mean"]:>10.1f}'
+                         f'{m["p50"]:>10.1f}{m["p95"]:>10.1f}'
+                         f'{m["max"]:>10.1f}{m["total"]:>12.1f}')
+        lines.append('')
+        lines.append('Histograms, ms upper bound: count')
+        bounds = [str(bound) for bound in BUCKETS] + ['more']
+        for m in metrics:
+            buckets = ', '.join(f'{bound}: {count}' for bound, count in
+                                zip(bounds, m['histogram']) if count)
+            lines.append(f'{m["name"]}: {buckets}')
+        if counters:
+            lines.append('')
+            lines.append('Counters')
+            for name, value in counters.items():
+                lines.append(f'{name:<36}{value:>8}')
+        return '\n'.join(lines) + '\n'
+
+    def dump(self, path):
+        """Append the summary to file path."""
+        with open(path, 'a', encoding='utf-8') as fh:
+            fh.write(self.report() + '\n')
+        self.log.info(f'Metrics written to {path}')
+
+    def start_profile(self):
+        """
+        Start profiling the calling thread, returns False if a profile
+        is already running.
+        """
+        if self.profiler:
+            return False
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active.
+            self.log.warning('Could not start profiler', exc_info=True)
+            return False
+        self.profiler = profiler
+        self.log.info('Profiling started')
+        return True
+
+    def stop_profile(self, path):
+        """Stop profiling and write the stats to path for pstats."""
+        profiler, self.profiler = self.profiler, None
+        if not profiler:
+            return
+        profiler.disable()
+        profiler.dump_stats(path)
+        self.log.info(f'Profile written to {path}')
+
+registry = Registry()
+
+def timed(name):
+    """Decorator that records the duration of calls as metric name."""
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not registry.enabled:
+                return function(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                registry.add(name, (time.perf_counter() - start) * 1000)
+        return wrapper
+    return decorator
+
+def count(name, number=1):
+    """Step counter name, if enabled."""
+    registry.count(name, number)
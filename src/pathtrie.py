@@ -0,0 +1,173 @@
+import re
+import sys
+
+SEPARATORS = re.compile(r'[\\/]+')
+
+def split(path):
+    """Directory names of path, either separator is accepted."""
+    return tuple(part for part in SEPARATORS.split(path) if part)
+
+def is_below(parts, root):
+    """True if the path parts are root or below root."""
+    return parts[:len(root)] == root
+
+class Node():
+    """A directory with its subdirectories and files."""
+    __slots__ = ('children', 'files', 'count')
+
+    def __init__(self):
+        self.children = {}
+        self.files = []
+        self.count = 0
+
+class PathTrie():
+    """
+    Files indexed by the directories of their paths.
+
+    Every directory is a node that keeps its subdirectories, the files
+    directly in it and the number of files below it. A subtree is found
+    by walking its path and counted without visiting it, so work on a
+    root is proportional to its depth and not to the number of files.
+
+    Paths and directory names are interned, every pattern picking a file
+    from the shared trie gets the same string.
+    """
+    def __init__(self, paths=()):
+        self.root = Node()
+        for path in paths:
+            self.add(path)
+
+    def __len__(self):
+        return self.root.count
+
+    def add(self, path):
+        """Add file."""
+        path = sys.intern(path)
+        node = self.root
+        node.count += 1
+        for part in split(path)[:-1]:
+            node = node.children.setdefault(sys.intern(part), Node())
+            node.count += 1
+        node.files.append(path)
+
+    def remove(self, path):
+        """Remove file, empty directories are dropped."""
+        parts = split(path)[:-1]
+        nodes = [self.root]
+        for part in parts:
+            node = nodes[-1].children.get(part)
+            if node is None:
+                return
+            nodes.append(node)
+        try:
+            nodes[-1].files.remove(path)
+        except ValueError:
+            return
+        for node in nodes:
+            node.count -= 1
+        for parent, part, node in zip(reversed(nodes[:-1]), reversed(parts),
+                                      reversed(nodes[1:])):
+            if node.count:
+                break
+            del parent.children[part]
+
+    def node(self, path):
+        """Node of directory path, None if there are no files below it."""
+        return self.node_at(split(path))
+
+    def node_at(self, parts):
+        """Node of the directory with path parts."""
+        node = self.root
+        for part in parts:
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def count(self, path):
+        """Number of files below path."""
+        node = self.node(path)
+        return node.count if node else 0
+
+class Selection():
+    """
+    Files of a trie below included paths and not below excluded ones.
+
+    Rules map directories to True to include or False to exclude them,
+    the nearest rule above a file decides. The selection is kept as the
+    included subtrees, each with the excluded subtrees within it, so
+    counting and picking files only walks the paths of the rules.
+    """
+    def __init__(self, trie, rules):
+        rules = {split(path): include for path, include in rules.items()}
+        self.entries = []
+        for parts, include in rules.items():
+            if not include or self.nearest(rules, parts):
+                continue
+            node = trie.node_at(parts)
+            if node is None:
+                continue
+            holes = []
+            for other, other_include in rules.items():
+                if (other_include or other == parts or
+                        not is_below(other, parts)):
+                    continue
+                between = [rule for rule in rules
+                           if rule != other and is_below(other, rule)
+                           and len(rule) > len(parts) and not rules[rule]]
+                hole = trie.node_at(other)
+                if hole is not None and not between:
+                    holes.append((other, hole))
+            count = node.count - sum(hole.count for _, hole in holes)
+            self.entries.append((parts, node, holes, count))
+        self.count = sum(entry[3] for entry in self.entries)
+
+    @staticmethod
+    def nearest(rules, parts):
+        """Value of the nearest rule above parts, False if there is none."""
+        for length in range(len(parts) - 1, -1, -1):
+            if parts[:length] in rules:
+                return rules[parts[:length]]
+        return False
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for parts, node, holes, count in self.entries:
+            yield from self.walk(node, {id(hole) for _, hole in holes})
+
+    def walk(self, node, skip):
+        """Files below node, except below nodes in skip."""
+        yield from node.files
+        for child in node.children.values():
+            if id(child) not in skip:
+                yield from self.walk(child, skip)
+
+    def nth(self, index):
+        """File number index of the selection."""
+        for parts, node, holes, count in self.entries:
+            if index < count:
+                return self.descend(parts, node, holes, index)
+            index -= count
+        raise IndexError('Selection index out of range')
+
+    def descend(self, parts, node, holes, index):
+        """File number index below node, not counting files in holes."""
+        while True:
+            if index < len(node.files):
+                return node.files[index]
+            index -= len(node.files)
+            for name, child in node.children.items():
+                child_parts = parts + (name, )
+                inside = [(hole_parts, hole) for hole_parts, hole in holes
+                          if is_below(hole_parts, child_parts)]
+                if any(hole is child for _, hole in inside):
+                    continue
+                count = child.count - sum(hole.count for _, hole in inside)
+                if index < count:
+                    parts, node, holes = child_parts, child, inside
+                    break
+                index -= count
+            else:
+                raise IndexError('Selection index out of range')
@@ -1,26 +1,75 @@
 import ctypes
 import logging
 import os
+import threading
 import time
 import vlc
 
+import fader
+import metrics
+import transitions
+
 # Windows sleep behaviour constants
 ES_CONTINOUS = 0x80000000
 ES_SYSTEM_REQUIRED = 0x00000001
 
+# Seconds to wait for a track to start playing before giving up on it.
+START_TIMEOUT = 5
+VOLUME = 100
+MAX_VOLUME = 200
+
 class Player():
     """
     Interface towards vlc-player.
     
     Some enhancements to some methods are done.
+
+    Playback state is followed through the events of VLC instead of
+    polling. Listeners can be added for the events 'playing', 'end' and
+    'error', note that they are called from a VLC thread and must not
+    call back in to VLC. The upcoming track can be preloaded so that it
+    is already opened and parsed when it is played.
+
+    There are two decks, each its own media player, so one track can fade
+    out while the next fades in. The active deck is self.vlc, events from
+    the other deck are ignored. Fades are run by a fader thread, the
+    'fade' event is sent when a scheduled fade out starts.
+
+    If gains is set, its gain(track) gives a loudness correction in dB
+    that is applied as volume when the track is played. It is looked up
+    when the track is preloaded.
+
+    Every change of track is timed by self.transitions, from the end of
+    the previous track or the call to play until VLC reports playing.
     """
     def __init__(self, *args, **kwargs):
         self.log = logging.getLogger('MilongaPlayer.Player')
-        self.vlc = vlc.MediaPlayer(*args, **kwargs)
+        self.instance = vlc.Instance(*args, **kwargs)
+        self.decks = [self.instance.media_player_new() for _ in range(2)]
+        self.deck = 0
+        self.vlc = self.decks[self.deck]
+        self.volume = VOLUME
+        self.track_volume = VOLUME
+        self.gains = None
+        self.fader = fader.Fader()
         self.playing = False
         self.paused = False
         self.current_track = None
-        self.t = None
+        self.preloaded = None
+        self.state = 'stopped'
+        self.start_time = None
+        self.started = threading.Event()
+        self.listeners = {'playing': [], 'end': [], 'error': [], 'fade': []}
+        self.transitions = transitions.Transitions()
+        for deck, media_player in enumerate(self.decks):
+            events = media_player.event_manager()
+            for event_type, name in (
+                    (vlc.EventType.MediaPlayerPlaying, 'playing'),
+                    (vlc.EventType.MediaPlayerEndReached, 'end'),
+                    (vlc.EventType.MediaPlayerEncounteredError, 'error')):
+                events.event_attach(event_type, self.on_vlc_event, name, deck)
+            events.event_attach(vlc.EventType.MediaPlayerESAdded,
+                                self.on_streams, deck)
 
     def __getattr__(self, item):
         return getattr(self.vlc, item)
@@ -31,7 +80,130 @@ class Player():
 
     def __exit__(self, *args):
         self.enable_sleep()
-        self.vlc.stop()        
+        self.fader.stop()
+        for media_player in self.decks:
+            media_player.stop()
+
+    def add_listener(self, name, callback):
+        """Call callback with the current track on event name."""
+        self.listeners[name].append(callback)
+
+    def notify(self, name, track):
+        """Call listeners of name."""
+        for callback in self.listeners[name]:
+            try:
+                callback(track)
+            except Exception:
+                self.log.error(f'Listener for {name} failed', exc_info=True)
+
+    def on_vlc_event(self, event, name, deck):
+        """Handle event from VLC, runs in a VLC thread."""
+        if deck != self.deck:
+            return
+        self.state = name
+        if name == 'playing':
+            self.started.set()
+            self.transitions.playing()
+        else:
+            self.log.info(f'Event {name} for {self.current_track}')
+            if name == 'end':
+                self.transitions.begin('end')
+            else:
+                self.transitions.cancel(name)
+        self.notify(name, self.current_track)
+
+    def on_streams(self, event, deck):
+        """VLC has found a stream of the media, runs in a VLC thread."""
+        if deck == self.deck:
+            self.transitions.parsed()
+
+    def on_fade(self, track):
+        """A scheduled fade out starts, runs in the fader thread."""
+        self.transitions.begin('fade')
+        self.notify('fade', track)
+
+    def switch_deck(self):
+        """Make the other deck active, returns the one that was active."""
+        old = self.vlc
+        self.deck = 1 - self.deck
+        self.vlc = self.decks[self.deck]
+        return old
+
+    def stop_inactive(self, media_player):
+        """Stop media player unless it has become the active deck."""
+        if media_player is not self.vlc:
+            media_player.stop()
+
+    def schedule_fade(self, delay, duration, curve=fader.DEFAULT_CURVE):
+        """
+        Fade out the current track over duration seconds, starting after
+        delay seconds.
+
+        Listeners of 'fade' are told when the fade starts so that the next
+        track can be faded in, the deck is stopped when it is silent.
+        """
+        media_player = self.vlc
+        track = self.current_track
+        self.log.debug(f'Fade of {track} in {delay:.1f}s over {duration}s')
+        self.fader.ramp(media_player, self.track_volume, 0, duration, curve, delay,
+                        on_start=lambda: self.on_fade(track),
+                        on_done=lambda: self.stop_inactive(media_player))
+
+    def is_busy(self):
+        """
+        True while a track is starting or playing.
+
+        A track that has not started within START_TIMEOUT is given up on.
+        """
+        if self.state == 'starting':
+            if time.monotonic() - self.start_time < START_TIMEOUT:
+                return True
+            self.log.warning(
+                f'Timeout waiting for playback to start: {self.current_track}')
+            self.state = 'error'
+            self.transitions.cancel('timeout')
+            return False
+        return bool(self.vlc.is_playing())
+
+    def preload(self, track):
+        """
+        Open and parse track in the background so that it is ready when
+        it is played next.
+        """
+        if not track or (self.preloaded and self.preloaded[0] == track):
+            return
+        if not os.path.exists(track):
+            self.log.warning(f'Could not find track to preload: {track}')
+            return
+        self.log.debug(f'Preloading: {track}')
+        media = self.instance.media_new(track)
+        media.parse_with_options(vlc.MediaParseFlag.local, 0)
+        self.preloaded = (track, media, self.volume_for(track))
+
+    def volume_for(self, track):
+        """Volume to play track at, with its loudness gain applied."""
+        gain = self.gains.gain(track) if self.gains else None
+        if gain is None:
+            return self.volume
+        volume = int(round(self.volume * 10 ** (gain / 20)))
+        return max(0, min(MAX_VOLUME, volume))
+
+    def media(self, track):
+        """
+        Media and volume for track, the preloaded ones if they are for
+        track.
+        """
+        if self.preloaded and self.preloaded[0] == track:
+            _, media, volume = self.preloaded
+            self.preloaded = None
+            return media, volume
+        return self.instance.media_new(track), self.volume_for(track)
+
+    def set_mrl(self, track):
+        """Set track to play without starting it."""
+        self.current_track = track
+        media, self.track_volume = self.media(track)
+        self.vlc.set_media(media)
 
     def pause(self):
         """Toggle pause status."""
@@ -42,32 +214,58 @@ class Player():
         """Set pause status to wanted status."""
         self.paused = wanted_status
         self.log.info(f'Setting paused: {wanted_status}')
+        if wanted_status:
+            # A fade in progress is cut short, a scheduled fade is set
+            # again when playback resumes.
+            for media_player in self.decks:
+                self.fader.cancel(media_player)
+                self.stop_inactive(media_player)
+            self.vlc.audio_set_volume(self.track_volume)
         self.vlc.set_pause(wanted_status)
         
-    def play(self, track=None):
+    @metrics.timed('player.play')
+    def play(self, track=None, fade=0, curve=fader.DEFAULT_CURVE):
         """
         Play selected track if suplied otherwise
         tell vlc to just play whats loaded currently.
+
+        With fade the track is faded in over fade seconds on the other
+        deck, while the current track fades out if it is not already.
         """
         if track:
+            self.transitions.opening(track)
             if not os.path.exists(track):
                 self.log.warning(f'Could not find track: {track}')
+                self.transitions.cancel('missing')
                 return
-            self.current_track = track
+            if fade and self.vlc.is_playing():
+                old = self.switch_deck()
+                if not self.fader.is_ramping(old):
+                    self.fader.ramp(
+                        old, old.audio_get_volume(), 0, fade, curve,
+                        on_done=lambda: self.stop_inactive(old))
+            preloaded = bool(self.preloaded and self.preloaded[0] == track)
             self.set_mrl(track)
+            self.transitions.opened(preloaded)
+            if fade:
+                self.vlc.audio_set_volume(0)
+                self.fader.ramp(self.vlc, 0, self.track_volume, fade, curve)
+            else:
+                self.fader.cancel(self.vlc)
+                self.vlc.audio_set_volume(self.track_volume)
+        self.started.clear()
+        self.state = 'starting'
+        self.start_time = time.monotonic()
         self.vlc.play()
-        start_time = time.monotonic() 
-        while not self.is_playing():
-            if time.monotonic() - start_time > 5:
-                self.log.warning(
-                    'Timeout recived in waiting for playback to start')
-                return
 
     def stop(self):
         """Stop playing."""
         self.playing = False
-        self.pause = False
-        self.vlc.stop()
+        self.paused = False
+        self.state = 'stopped'
+        for media_player in self.decks:
+            self.fader.cancel(media_player)
+            media_player.stop()
 
     def enable_sleep(self):
         """Enable sleep on windows"""
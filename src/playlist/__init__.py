@@ -1,20 +1,61 @@
 import logging
 import os
-import pickle
 import tkinter
 import tkinter.ttk
+import uuid
+
+import metrics
 
 from playlist import pattern
 from playlist.fileplaylist import FilePlayList
 from playlist.patternplaylist import PatternPlayList
 
+PLAYLIST_TYPES = {'Pattern': PatternPlayList,
+                  'File': FilePlayList}
+
+class TabStub(tkinter.ttk.Frame):
+    """
+    Placeholder for a playlist that has not been loaded yet.
+
+    Holds the key of the playlist record, the playlist itself is created
+    the first time the tab is used. A stub that could not be loaded
+    stays in place as failed and has no tracks, its record is kept as
+    it is.
+    """
+    def __init__(self, master, record, name, pl_type, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+        self.record = record
+        self.name = name
+        self.type = pl_type
+        self.failed = False
+
+    def fail(self):
+        """Mark the stub as failed to load."""
+        self.failed = True
+        tkinter.ttk.Label(
+            self, text=f'Could not load playlist {self.name}').pack()
+
+    def get_track(self, index=0):
+        return ''
+
+    def peek_track(self):
+        return None
+
+    def get_track_options(self):
+        return {}
+
 class PlayList(tkinter.ttk.Frame):
     """Root playlist frame."""
-    def __init__(self, master, player_instance, startup_info, *args, **kwargs):
+    def __init__(self, master, player_instance, startup_info, store, library,
+                 *args, **kwargs):
         self.log = logging.getLogger('MilongaPlayer.PlayList')
         super().__init__(master, *args, **kwargs)
         self.player_instance = player_instance
+        self.store = store
+        self.library = library
         self.player_instance.get_track = self.get_track
+        self.player_instance.peek_track = self.peek_track
+        self.player_instance.get_track_options = self.get_track_options
         self.player_instance.set_playlist = self.set_playlist
 
         # Buttons
@@ -31,12 +72,12 @@ class PlayList(tkinter.ttk.Frame):
         # small screens. expands to take availbe space during packing.
         self.tabs = tkinter.ttk.Notebook(self, width=1, height=1)
         self.tabs.bind('<Button-3>', self.popup)
+        self.tabs.bind('<<NotebookTabChanged>>', self.on_tab_changed)
 
         # Packing
         buttonbar.pack(fill=tkinter.X)
         self.tabs.pack(fill=tkinter.BOTH, expand=1)
-        
-        self.cashe = {}
+
         self.on_startup(startup_info)
 
     def popup(self, event):
@@ -74,45 +115,166 @@ class PlayList(tkinter.ttk.Frame):
         widget.destroy()
               
     def on_startup(self, startup_info):
-        """Run once on startup to load playlists and set state."""
-        playlists = {'Pattern': PatternPlayList,
-                     'File': FilePlayList}
-        self.cashe = startup_info.get('cashe', {})
+        """
+        Run once on startup to load playlists and set state.
+
+        Each playlist is a record of its own in the store. Tabs start out
+        as stubs and the record is only loaded when the tab is first
+        used. startup_info is only given when converting the single state
+        file of older versions.
+        """
         self.current_playlist = None
-        for pl in startup_info.get('playlists', []):
-            if not (pl and pl.get('type', '') in playlists):
-                continue
-            self.log.debug('Adding playlist of type: {pl[type]}')
-            tab = playlists[pl['type']](self.tabs,
-                                        self.player_instance,
-                                        pl,
-                                        self.cashe)
-            tab.pack(expand=1, fill=tkinter.BOTH)
-            self.tabs.add(tab, text=pl.get('name', 'playlist'))
-
-        current_tab = startup_info.get('current_tab', None)
-        if current_tab in self.tabs.tabs():
+        if startup_info:
+            self.log.info('Converting playlists from old state file')
+            for pl in startup_info.get('playlists', []):
+                self.create_tab(self.new_record_key(), pl)
+            current_tab = startup_info.get('current_tab', None)
+        else:
+            index = self.store.load('playlists', {})
+            for entry in index.get('tabs', []):
+                if isinstance(entry, str):
+                    # Index saved without names, load the record directly.
+                    if not self.create_tab(entry, self.store.load(entry)):
+                        stub = TabStub(self.tabs, entry, entry, None)
+                        stub.fail()
+                        self.tabs.add(stub, text=entry)
+                    continue
+                stub = TabStub(self.tabs, entry['key'], entry['name'], entry['type'])
+                self.tabs.add(stub, text=entry['name'])
+            current_tab = index.get('current_tab', None)
+
+        tabs = [str(tab) for tab in self.tabs.tabs()]
+        if isinstance(current_tab, int) and current_tab < len(tabs):
+            self.tabs.select(tabs[current_tab])
+        elif current_tab in tabs:
             self.tabs.select(current_tab)
+        if tabs:
+            self.materialize(self.tabs.select())
 
+    def create_tab(self, key, pl, index='end'):
+        """Create tab for a saved playlist record, returns the tab."""
+        if not (pl and pl.get('type', '') in PLAYLIST_TYPES):
+            self.log.warning(f'Skipping playlist {key}, no valid type')
+            return None
+        self.log.debug(f'Adding playlist of type: {pl["type"]}')
+        try:
+            tab = PLAYLIST_TYPES[pl['type']](self.tabs,
+                                             self.player_instance,
+                                             pl,
+                                             self.library)
+        except Exception:
+            self.log.error(f'Could not load playlist {key}', exc_info=True)
+            return None
+        tab.record = key
+        tab.pack(expand=1, fill=tkinter.BOTH)
+        self.tabs.insert(index, tab, text=pl.get('name', 'playlist'))
+        return tab
+
+    @metrics.timed('playlist.materialize')
+    def materialize(self, name):
+        """
+        Get playlist widget of tab, loading it if it is still a stub.
+
+        A playlist without a saved record starts empty. A record that can
+        not be loaded keeps the stub as failed, so the record is not
+        saved over on close and can still be recovered.
+        """
+        widget = self.tabs.nametowidget(name)
+        if not isinstance(widget, TabStub) or widget.failed:
+            return widget
+        self.log.info(f'Loading playlist: {widget.record}')
+        pl = self.store.load(widget.record)
+        if pl is None and not os.path.exists(
+                self.store.record_path(widget.record)):
+            pl = {'type': widget.type, 'name': widget.name}
+        index = self.tabs.index(widget)
+        selected = str(self.tabs.select()) == str(widget)
+        tab = self.create_tab(widget.record, pl, index)
+        if tab is None:
+            self.log.error(f'Could not load playlist {widget.record}, '
+                           'keeping its record as it is')
+            widget.fail()
+            return widget
+        tab.name = widget.name
+        self.tabs.tab(tab, text=widget.name)
+        if selected:
+            self.tabs.select(tab)
+        self.tabs.forget(widget)
+        widget.destroy()
+        return tab
+
+    def on_tab_changed(self, event=None):
+        """Load the selected tab if needed."""
+        selected = self.tabs.select()
+        if selected:
+            self.materialize(selected)
+
+    @staticmethod
+    def new_record_key():
+        """Key for the record of a new playlist."""
+        return f'playlist-{uuid.uuid4().hex}'
+
+    @metrics.timed('playlist.on_close')
     def on_close(self):
-        """Run on close to save playlists and state."""
-        playlists = [pl.on_close()
-                     for pl in self.tabs.children.values()]
-        return {'cashe': self.cashe,
-                'current_tab': self.tabs.select(),
-                'playlists': playlists,
-                'version': 1}
+        """
+        Run on close to save playlists and state.
+
+        Playlists are saved one record each, a playlist that fails to save
+        is logged and does not stop the others. Tabs that were never loaded
+        keep their record as it is. Records of removed playlists are
+        deleted.
+        """
+        tabs = []
+        for name in self.tabs.tabs():
+            widget = self.tabs.nametowidget(name)
+            entry = {'key': widget.record, 'name': widget.name}
+            tabs.append(entry)
+            if isinstance(widget, TabStub):
+                entry['type'] = widget.type
+                continue
+            try:
+                pl = widget.on_close()
+                entry['type'] = pl['type']
+                self.store.save(widget.record, pl)
+            except Exception:
+                self.log.error(f'Could not save playlist {widget.record}',
+                               exc_info=True)
+                entry['type'] = type(widget).__name__.replace('PlayList', '')
+        keys = {entry['key'] for entry in tabs}
+        for key in self.store.keys():
+            if key.startswith('playlist-') and key not in keys:
+                self.store.delete(key)
+        current_tab = self.tabs.index('current') if tabs else None
+        self.store.save('playlists', {'current_tab': current_tab,
+                                      'tabs': tabs,
+                                      'version': 3})
 
     def set_playlist(self, pl):
         self.current_playlist = pl
             
+    @metrics.timed('playlist.get_track')
     def get_track(self, index=0):
         """Get track from currently selected tab."""
-        if not self.current_playlist in self.tabs.tabs():
+        if not str(self.current_playlist) in map(str, self.tabs.tabs()):
             self.current_playlist = self.tabs.select()
-        widget = self.tabs.nametowidget(self.current_playlist)
+        if not self.current_playlist:
+            return ''
+        widget = self.materialize(self.current_playlist)
+        self.current_playlist = widget
         return widget.get_track(index)
 
+    def peek_track(self):
+        """Get the upcoming track from currently playing tab."""
+        if not str(self.current_playlist) in map(str, self.tabs.tabs()):
+            return None
+        return self.materialize(self.current_playlist).peek_track()
+
+    def get_track_options(self):
+        """Get playback options for the current track."""
+        if not str(self.current_playlist) in map(str, self.tabs.tabs()):
+            return {}
+        return self.materialize(self.current_playlist).get_track_options()
+
     def add_playlist(self, pl_type):
         """Add a new playlist of the selected type."""
         playlist_types = {'pattern': PatternPlayList,
@@ -120,7 +282,8 @@ class PlayList(tkinter.ttk.Frame):
         p = playlist_types[pl_type](self.tabs,
                                     self.player_instance,
                                     None,
-                                    self.cashe)
+                                    self.library)
+        p.record = self.new_record_key()
         p.pack(expand=1, fill=tkinter.BOTH)
         self.tabs.add(p, text='Playlist')
          
@@ -130,7 +293,9 @@ class PlayList(tkinter.ttk.Frame):
         """
         self.log.info(f'Key event: {target}({event})')
         tab_name = self.tabs.select()
-        widget = self.tabs.nametowidget(tab_name)
+        if not tab_name:
+            return
+        widget = self.materialize(tab_name)
         try:
             getattr(widget, target)(event)
         except AttributeError:
@@ -1,19 +1,46 @@
 import logging
-import os
-import random
+import queue
+import threading
 import tkinter
 import tkinter.simpledialog
 import tkinter.ttk
 
+import metadata
+import metrics
+import searchindex
+from playlist.model import PlayListModel
+from widgets import VirtualTreeview
+
 class FilePlayList(tkinter.ttk.Frame):
-    """Standard playlist."""
+    """
+    Standard playlist.
+
+    The rows and the play state are held by self.model, the view only
+    observes it. Changes to the model are applied to the view once the
+    current event has been handled, so stepping tracks does not wait on
+    the view. Only the visible part is put in the view. While searching
+    the view shows the rows in self.matches instead of all rows.
+    """
     def __init__(
-        self, master, player_instance, startup_info, cashe, *args, **kwargs):
+        self, master, player_instance, startup_info, library, *args, **kwargs):
         self.log = logging.getLogger('MilongaPlayer.PlayList.FilePlayList')
         self.log.info('Initialization of PlayList')
         self.player = player_instance
-        self.cashe = cashe
-        self.queue = []
+        self.library = library
+        self.model = PlayListModel()
+        self.model.add_observer(self.on_model_change)
+        self.changes = set()
+        self.change_id = None
+        self.tags = {}
+        self.metadata = metadata.Requester(
+            self, library.metadata, self.on_metadata)
+        self.matches = None
+        self.match_positions = None
+        # Normalized query that self.matches was found with.
+        self.searched = None
+        self.search_id = None
+        # Paths not yet given to the search index of the library.
+        self.unindexed = []
         super().__init__(master, *args, **kwargs)
 
         buttons = tkinter.ttk.Frame(self)
@@ -23,160 +50,309 @@ class FilePlayList(tkinter.ttk.Frame):
         tkinter.ttk.Button(
             buttons, text='Add folder', command=self.add_folder).pack(side='left')
         self.random = tkinter.IntVar()
+        self.random.trace_add('write', self.on_random)
         tkinter.ttk.Checkbutton(
             buttons, variable=self.random, text='Random').pack(side='left')
-        
+        tkinter.ttk.Label(buttons, text='Search').pack(side='left')
+        self.query = tkinter.StringVar()
+        self.query.trace_add('write', self.on_query)
+        search = tkinter.ttk.Entry(buttons, textvariable=self.query)
+        search.pack(side='left', fill=tkinter.X, expand=1)
+        search.bind('<FocusIn>', self.prepare_search)
+        search.bind('<Return>', self.enqueue_match)
+        search.bind('<Escape>', lambda event: self.query.set(''))
 
-        self.view = tkinter.ttk.Treeview(self, show='headings')
-        self.view.bind('<ButtonPress-1>', self.on_click)
-        self.view.bind('<ButtonPress-3>', self.on_right_click)
-        self.view.bind('<Control-ButtonPress-1>', self.on_ctrl_click)
-        self.view.bind('<B1-Motion>', self.on_move)
-        self.view.bind('<Double-1>', self.on_dclick)
+        self.view = VirtualTreeview(self, self, show='headings')
+        self.view.tree.bind('<ButtonPress-1>', self.on_click)
+        self.view.tree.bind('<ButtonPress-3>', self.on_right_click)
+        self.view.tree.bind('<Control-ButtonPress-1>', self.on_ctrl_click)
+        self.view.tree.bind('<B1-Motion>', self.on_move)
+        self.view.tree.bind('<Double-1>', self.on_dclick)
         self.view.pack(side='left', expand=1, fill=tkinter.BOTH)
-        scrollbar = tkinter.ttk.Scrollbar(
-            self, orient='vertical', command=self.view.yview)
-        scrollbar.pack(side='left', fill=tkinter.Y)
-        self.view.configure(yscrollcommand=scrollbar.set)
         self.add_columns(('queue', 'name'))
-        self.view.column('queue', width=60, stretch=False)
-        self.view.heading('queue', text='')
+        self.view.tree.column('queue', width=60, stretch=False)
+        self.view.tree.heading('queue', text='')
 
         self.on_startup(startup_info)
 
-        # Development stuff
-        for iid in self.view.get_children():
-            self.view.set(iid, 'queue', '')
-        self.queue = []
-
     def on_startup(self, startup_info):
         """Run once on startup to set files and settings."""
         if not startup_info:
             startup_info = {'name': 'Playlist',
                             'files': {},
                             'current_index': None,
-                            'playlist': [],
+                            'rows': [],
                             'columns': ['name'],
                             'settings': {}}
-        for key, default in (('files', {}),
-                             ('current_index', None),
-                             ('name', 'Playlist'),
-                             ('queue', [])):
-            value = startup_info.get(key, default)
-            setattr(self, key, value)
+        self.name = startup_info.get('name', 'Playlist')
         value = startup_info.get('columns', ['queue', 'name'])
         self.log.info(f'Showing columns: {value}')
-        self.view['displaycolumns'] = value
-        for iid, path, values in startup_info.get('playlist', []):
-            self.view.insert('', 'end', iid=iid, text=path)
-            for key, value in values.items():
-                self.view.set(iid, key, value)
+        missing = [column for column in value if column in metadata.COLUMNS
+                   and column not in self.view.tree['columns']]
+        if missing:
+            self.add_columns(missing)
+        self.view.tree['displaycolumns'] = value
+        self.model.load(startup_info)
+        self.unindexed = list(self.model.paths.values())
+        self.request_metadata(self.model.paths.values())
         for setting, default in (('random', False),):
             value = startup_info.get('settings', {}).get(setting, default)
             self.log.info(f'Setting self.{setting} to {value}')
             getattr(self, setting).set(value)
-        try:
-            self.view.selection_set(self.current_index)
-            self.view.see(self.current_index)
-        except:
-            pass
-            
+        if self.model.current is not None:
+            self.view.selection_set((self.model.current, ))
+            self.view.see(self.model.current)
+
     def on_close(self):
         """Run on close to save state and settings."""
-        startup_info = {'type': 'File'}
-        for key in ('files', 'current_index', 'name', 'queue'):
-            startup_info[key] = getattr(self, key)
-        startup_info['playlist'] = []
-        startup_info['columns'] = self.view['columns']
-        for child in self.view.get_children():
-            text = self.view.item(child, 'text')
-            values = {key: self.view.set(child, key) for key in startup_info['columns']}
-            startup_info['playlist'].append((child, text, values))
+        startup_info = self.model.state()
+        startup_info['type'] = 'File'
+        startup_info['name'] = self.name
+        startup_info['columns'] = self.view.tree['displaycolumns']
         startup_info['settings'] = {}
         for setting in ('random',):
             startup_info['settings'][setting] = getattr(self, setting).get()
         return startup_info
 
+    def on_random(self, *args):
+        """Keep random mode of the model in step with the checkbutton."""
+        self.model.random = bool(self.random.get())
+
+    def on_model_change(self, changes):
+        """Apply changes of the model to the view when idle."""
+        self.changes.update(changes)
+        if 'rows' in changes:
+            # Matches can not be narrowed down from rows that are gone.
+            self.searched = None
+        if not self.change_id:
+            self.change_id = self.after_idle(self.apply_changes)
+
+    def apply_changes(self):
+        """Render the view once for all changes since last time."""
+        self.change_id = None
+        changes, self.changes = self.changes, set()
+        if 'rows' in changes and self.matches is not None:
+            self.filter_rows()
+        playing = self.model.playing
+        if 'playing' in changes and playing in self.model.paths:
+            self.view.selected = {playing}
+            if self.view.row_exists(playing):
+                # See renders the view.
+                self.view.see(playing)
+                return
+        self.view.refresh()
+
+    def shown_rows(self):
+        """Rows in the view, only the matches while searching."""
+        return self.model.rows if self.matches is None else self.matches
+
+    def row_count(self):
+        """Number of rows, used by the view."""
+        return len(self.shown_rows())
+
+    def row_index(self, i):
+        """Position of row id in the view, used by the view."""
+        if self.matches is None:
+            return self.model.row_positions()[i]
+        if self.match_positions is None:
+            self.match_positions = {
+                i: index for index, i in enumerate(self.matches)}
+        return self.match_positions[i]
+
+    def row(self, index):
+        """Id, text and column values of row at index, used by the view."""
+        i = self.shown_rows()[index]
+        path = self.model.paths[i]
+        values = []
+        for column in self.view.tree['columns']:
+            if column == 'queue':
+                values.append(','.join(map(str, self.model.queue.positions(i))))
+            elif column == 'duration':
+                values.append(metadata.format_duration(
+                    self.tags.get(path, {}).get(column)))
+            elif column in metadata.COLUMNS:
+                values.append(self.tags.get(path, {}).get(column) or '')
+            else:
+                values.append(self.model.files.get(path, {}).get(column, ''))
+        return i, path, values
+
     def add_folder(self, path=None):
-        """Add the files from folder to playlist."""
+        """
+        Add the files from folder to playlist.
+
+        The folder is scanned in a background thread so that the mainloop,
+        and with it the player, keeps running while it is walked.
+        """
         path = path or tkinter.filedialog.askdirectory()
         if not path:
             self.log.info('User canceled')
             return
-        for root, dirs, files in os.walk(path):
-            files = [os.path.join(root, file) for file in
-                     files if file.endswith('.mp3')]
-            if files:
-                self.add_files(files)
+        results = queue.Queue()
+        threading.Thread(target=self.folder_worker, args=(path, results),
+                         daemon=True).start()
+        self.poll_folder(results)
 
+    def folder_worker(self, path, results):
+        """Scan path and get its files, run in worker thread."""
+        try:
+            self.library.rescan([path])
+            results.put(self.library.files(path))
+        except Exception:
+            self.log.error(f'Could not scan {path}', exc_info=True)
+            results.put([])
+
+    def poll_folder(self, results):
+        """Add the files of the folder when the scan is done."""
+        try:
+            files = results.get_nowait()
+        except queue.Empty:
+            self.after(50, self.poll_folder, results)
+            return
+        if files:
+            self.add_files(files)
+
+    @metrics.timed('fileplaylist.add_files')
     def add_files(self, paths=None):
         """Add one or more files to playlist."""
         paths = paths or tkinter.filedialog.askopenfilename(multiple=True,
                                                             filetypes=(('MP3', '*.mp3'),))
-        for path in paths:
-            if not os.path.splitext(path)[1].lower() in ('.mp3', ):
-                continue
-            self.files[path] = {'name': os.path.splitext(os.path.basename(path))[0]}
-            item = self.view.insert('', 'end', text=path)
-            for key in self.view['columns']:
-                try:
-                    self.view.set(item, key, self.files[path][key])
-                except KeyError:
-                    pass
+        added = self.model.add(paths)
+        self.unindexed.extend(added)
+        self.request_metadata(added)
         
     def add_columns(self, columns, **kwargs):
         """Add data columns."""
         # Preserve current column headers and their settings
-        current_columns = list(self.view['columns'])
-        current_columns = {key:self.view.heading(key) for key in current_columns}
+        tree = self.view.tree
+        current_columns = list(tree['columns'])
+        current_columns = {key: tree.heading(key) for key in current_columns}
         self.log.info(f'Current columns: {current_columns}')
 
-        self.view['columns'] = list(current_columns.keys()) + list(columns)
+        tree['columns'] = list(current_columns.keys()) + list(columns)
         for column in columns:
             self.log.info('Adding column: {column}')
-            self.view.heading(column, text=column.capitalize(), **kwargs)
+            tree.heading(column, text=column.capitalize(), **kwargs)
 
         # Set saved column values for the already existing columns
         for key in current_columns:
             # State is not valid to set with heading
             state = current_columns[key].pop('state')
-            self.view.heading(key, **current_columns[key])
+            tree.heading(key, **current_columns[key])
+
+        # Values are taken from the model and self.tags when rows are
+        # rendered.
+        self.view.refresh()
 
-        for item in self.view.get_children(''):
-            key = self.view.item(item, 'text')
-            for column in columns:
-                value = self.files[key].get(column, '')
-                self.view.set(item, column, value)
+    def displayed_columns(self):
+        """Columns that are shown."""
+        displayed = self.view.tree['displaycolumns']
+        if tuple(displayed) == ('#all', ) or displayed == '#all':
+            return list(self.view.tree['columns'])
+        return list(displayed)
+
+    def toggle_column(self, column):
+        """Show or hide a metadata column."""
+        displayed = self.displayed_columns()
+        if column in displayed:
+            displayed.remove(column)
+        else:
+            if column not in self.view.tree['columns']:
+                self.add_columns((column, ))
+            displayed.append(column)
+        self.log.info(f'Showing columns: {displayed}')
+        self.view.tree['displaycolumns'] = displayed
+        self.request_metadata(self.model.paths.values())
+        self.view.refresh()
+
+    def request_metadata(self, paths):
+        """
+        Get tag metadata for paths if any metadata column is shown.
+
+        Cached metadata is used directly, the rest is read in the
+        background and shown when it arrives.
+        """
+        if not set(self.displayed_columns()) & set(metadata.COLUMNS):
+            return
+        self.tags.update(self.metadata.request(
+            path for path in paths if path not in self.tags))
+
+    def on_metadata(self, tags):
+        """Metadata read in the background has arrived."""
+        self.tags.update(tags)
+        self.view.refresh()
 
     def get_track(self, index=0):
+        """Get track to play, see PlayListModel.get_track."""
+        return self.model.get_track(index)
+
+    def peek_track(self):
+        """Track that get_track(1) will return, without stepping to it."""
+        return self.model.peek_track()
+
+    def get_track_options(self):
+        """Tracks are played whole without fades."""
+        return {}
+
+    def prepare_search(self, event=None):
+        """Index the paths of the playlist before the first search."""
+        if self.unindexed:
+            self.library.prepare_index(self.unindexed)
+            self.unindexed = []
+
+    def on_query(self, *args):
+        """Search when typing has paused for SEARCH_DELAY."""
+        if self.search_id:
+            self.after_cancel(self.search_id)
+        self.search_id = self.after(searchindex.SEARCH_DELAY, self.on_search)
+
+    def on_search(self, *args):
+        """Show only the rows matching the search, in playlist order."""
+        self.search_id = None
+        self.filter_rows(narrow=True)
+        self.view.refresh()
+
+    def filter_rows(self, narrow=False):
         """
-        Get track to play.
-
-        Index > 0 gets that amount of tracks forward in list."""
-        if self.queue:
-            self.decrement_queue_index()
-            iid = self.queue.pop(0)
-            self.view.selection_set(iid)
-            self.view.see(iid)
-            return self.view.item(iid, 'text')
-        if not self.current_index:
-            self.current_index = (self.view.get_children() or [None])[0]
-        if not self.current_index:
-            return ''
-        if self.random.get():
-            self.current_index = random.choice(self.view.get_children())
-            index = 0
-        
-        if index == 0:
-            self.view.selection_set(self.current_index)
-            self.view.see(self.current_index)
-            return self.view.item(self.current_index, 'text')
-        elif index > 0:
-            self.current_index = self.view.next(self.current_index) or self.view.get_children()[0]
-            return self.get_track(index-1)
+        Find the rows matching the search.
+
+        With narrow, a query that continues the last one only looks
+        through the rows that matched the last one, as it can only match
+        fewer.
+        """
+        query = self.query.get()
+        found = None
+        if searchindex.tokenize(query):
+            index = self.library.index(self.unindexed, wait=False)
+            if index is None:
+                # Still being built, search again in a while.
+                self.after(searchindex.SEARCH_RETRY, self.on_search)
+                return
+            self.unindexed = []
+            with self.library.lock:
+                found = index.search(query)
+        if found is None:
+            self.matches = None
+            self.searched = None
         else:
-            self.current_index = self.view.prev(self.current_index) or self.view.get_children()[-1]
-            return self.get_track(index+1)
+            text = searchindex.normalize(query)
+            rows = self.model.rows
+            if (narrow and self.matches is not None and
+                    self.searched is not None and text.startswith(self.searched)):
+                rows = self.matches
+            paths = self.model.paths
+            self.matches = [i for i in rows if paths[i] in found]
+            self.searched = text
+        self.match_positions = None
+
+    def enqueue_match(self, event=None):
+        """Enqueue the selected matches, or the first match."""
+        if self.search_id:
+            # Enter pressed before the search was run.
+            self.after_cancel(self.search_id)
+            self.on_search()
+        if self.matches is None:
+            return
+        self.model.enqueue(self.view.selection() or self.matches[:1])
         
     def on_click(self, event):
         """
@@ -184,12 +360,12 @@ class FilePlayList(tkinter.ttk.Frame):
 
         Select single element in list.
         """
-        region = self.view.identify("region", event.x, event.y)
+        region = self.view.identify_region(event.x, event.y)
         if region == 'heading':
             # Do Sorting here
             return
-        tv = event.widget
-        tv.selection_set(tv.identify_row(event.y))
+        i = self.view.identify_row(event.y)
+        self.view.selection_set(() if i is None else (i, ))
 
     def on_ctrl_click(self, event):
         """
@@ -197,26 +373,27 @@ class FilePlayList(tkinter.ttk.Frame):
 
         Multiselect.
         """
-        region = self.view.identify("region", event.x, event.y)
+        region = self.view.identify_region(event.x, event.y)
         if region == 'heading':
             return
-        iid = self.view.identify_row(event.y)
+        i = self.view.identify_row(event.y)
         current_selection = self.view.selection()
         return
-        if iid in current_selection:
-            self.view.selection_remove((iid, ))
+        if i in current_selection:
+            self.view.selection_remove((i, ))
         else:
-            self.view.selection_add((iid, ))
+            self.view.selection_add((i, ))
 
     def on_right_click(self, event):
         """Right click context menu."""
-        region = self.view.identify('region', event.x, event.y)
+        region = self.view.identify_region(event.x, event.y)
         if region == 'heading':
+            self.column_menu(event)
             return
         
-        iid = self.view.identify('item', event.x, event.y)
-        if not iid in self.view.selection():
-            self.view.selection_set(iid)
+        i = self.view.identify_row(event.y)
+        if i is not None and not i in self.view.selection():
+            self.view.selection_set((i, ))
 
         menu = tkinter.Menu(self, tearoff=0)
         menu.add_command(label='Enqueue', command=self.enqueue)
@@ -227,66 +404,56 @@ class FilePlayList(tkinter.ttk.Frame):
         finally:
             menu.grab_release()
 
+    def column_menu(self, event):
+        """Right click menu on headings to choose metadata columns."""
+        displayed = self.displayed_columns()
+        menu = tkinter.Menu(self, tearoff=0)
+        # Keep references, variables are unset when garbage collected.
+        menu.variables = []
+        for column in metadata.COLUMNS:
+            variable = tkinter.BooleanVar(menu, column in displayed)
+            menu.variables.append(variable)
+            menu.add_checkbutton(
+                label=column.capitalize(), variable=variable,
+                command=lambda column=column: self.toggle_column(column))
+        try:
+            menu.tk_popup(event.x_root, event.y_root, 0)
+        finally:
+            menu.grab_release()
+
     def on_move(self, event):
-        """Move element in list."""
-        tv = event.widget
-        moveto = tv.index(tv.identify_row(event.y))
-        tv.move(tv.selection(), '', moveto)
+        """Move selected elements in list to the row under the pointer."""
+        target = self.view.identify_row(event.y)
+        selection = self.view.selection()
+        if (target is None or not selection or target in selection
+                or self.matches is not None):
+            return
+        self.model.move(selection, target)
 
     def on_dclick(self, event):
         """On double click play that track."""
-        region = self.view.identify('region', event.x, event.y)
+        region = self.view.identify_region(event.x, event.y)
         if region == 'heading':
             return
-        iid = self.view.identify('item', event.x, event.y)
-        self.current_index = iid
-        path = self.view.item(iid, 'text')
+        i = self.view.identify_row(event.y)
+        if i is None:
+            return
+        path = self.model.play_row(i)
         self.player.set_playlist(self)
         self.player.play(path)
 
     def delete(self, event=None):
         """Delete selection key binding."""
-        to_delete = self.view.selection()
-        if self.current_index in to_delete:
-            self.current_index = self.view.next(to_delete[-1]) or self.view.get_children()[0]
-        self.view.delete(*to_delete)
+        self.model.remove(self.view.selection())
 
     def select_all(self, event):
         """Select all keybinding."""
-        self.view.selection_set(self.view.get_children())
-
-    def decrement_queue_index(self):
-        for iid in set(self.queue):
-            indexes = self.view.set(iid, 'queue').split(',')
-            new_indexes = []
-            for index in indexes:
-                if index:
-                    index = int(index) - 1
-                if index:
-                    new_indexes.append(str(index))
-            self.view.set(iid, 'queue', ','.join(new_indexes))
+        self.view.selection_set(self.shown_rows())
 
     def dequeue(self, event=None):
-        self.queue.reverse()
-        for iid in self.view.selection():
-            try:
-                self.queue.remove(iid)
-            except ValueError:
-                pass
-            else:
-                new = ','.join(self.view.set(iid, 'queue').split(',')[:-1])
-                self.view.set(iid, 'queue', new)
-        self.queue.reverse()
-            
+        """Remove the last queued entry of each selected file."""
+        self.model.dequeue(self.view.selection())
 
     def enqueue(self, event=None):
         """Enque file to play"""
-        for iid in self.view.selection():
-            self.queue.append(iid.strip())
-            current = self.view.set(iid, 'queue')
-            if current:
-                current += ','
-            current += str(len(self.queue))
-            self.view.set(iid, 'queue', current)
-            
-            
+        self.model.enqueue(self.view.selection())
@@ -0,0 +1,240 @@
+import array
+import contextlib
+import os
+
+from playlist.playqueue import PlayQueue
+from playlist.shufflebag import ShuffleBag
+
+EXTENTIONS = ('.mp3', )
+
+class PlayListModel():
+    """
+    Rows of a file playlist, independent of any widget.
+
+    Rows are held in self.rows as ids in play order, with the path of
+    each id in self.paths. The model also keeps the current row, the play
+    queue and the shuffle bag, so a playlist can be stepped through
+    without Tk.
+
+    Observers are called with the set of kinds of changes, 'rows',
+    'queue' and 'playing'. Changes made within batch() are collected and
+    passed on once when the batch ends.
+    """
+    def __init__(self):
+        self.rows = []
+        self.paths = {}
+        self.files = {}
+        self.positions = None
+        self.next_id = 0
+        self.current = None
+        self.playing = None
+        self.random = False
+        self.queue = PlayQueue()
+        self.shuffle = ShuffleBag()
+        self.observers = []
+        self.changes = set()
+        self.depth = 0
+
+    def __len__(self):
+        return len(self.rows)
+
+    def add_observer(self, callback):
+        """Call callback with the kinds of changes after every change."""
+        self.observers.append(callback)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """Collect changes and notify observers once at the end."""
+        self.depth += 1
+        try:
+            yield self
+        finally:
+            self.depth -= 1
+            if not self.depth:
+                self.notify()
+
+    def changed(self, kind):
+        """Record a change, observers are notified unless in a batch."""
+        self.changes.add(kind)
+        if not self.depth:
+            self.notify()
+
+    def notify(self):
+        """Pass collected changes on to observers."""
+        changes, self.changes = self.changes, set()
+        if changes:
+            for callback in self.observers:
+                callback(changes)
+
+    def load(self, state):
+        """
+        Set rows, current row, queue and shuffle from a saved state.
+
+        State is what state() returns, rows saved as (iid, path, values)
+        by older versions are converted.
+        """
+        with self.batch():
+            self.files = state.get('files', {})
+            self.current = state.get('current_index')
+            queue = state.get('queue', [])
+            if 'playlist' in state:
+                playlist = state['playlist']
+                ids = {iid: index
+                       for index, (iid, path, values) in enumerate(playlist)}
+                self.set_rows([path for iid, path, values in playlist])
+                self.current = ids.get(self.current)
+                queue = [ids[iid] for iid in queue if iid in ids]
+            else:
+                self.set_rows(state.get('rows', []))
+            if self.current not in self.paths:
+                self.current = None
+            self.queue = PlayQueue(queue)
+            self.load_shuffle(state.get('shuffle', {}))
+            self.changed('queue')
+
+    def state(self):
+        """
+        State to save, rows are saved as a list of paths and ids are
+        renumbered to be the position of the row.
+        """
+        positions = self.row_positions()
+        return {'files': self.files,
+                'current_index': positions.get(self.current),
+                'queue': [positions[i] for i in self.queue],
+                'rows': [self.paths[i] for i in self.rows],
+                'shuffle': {
+                    'order': array.array(
+                        'l', (positions[i] for i in self.shuffle.order)),
+                    'cursor': self.shuffle.cursor}}
+
+    def set_rows(self, paths):
+        """Set rows from a list of paths, ids are the positions."""
+        self.rows = list(range(len(paths)))
+        self.paths = dict(enumerate(paths))
+        self.positions = None
+        self.next_id = len(paths)
+        self.changed('rows')
+
+    def load_shuffle(self, shuffle):
+        """Restore saved shuffle order, start a new one if it is not valid."""
+        order = shuffle.get('order', ())
+        if len(order) == len(self.paths) and set(order) == self.paths.keys():
+            self.shuffle = ShuffleBag(order=order, cursor=shuffle['cursor'])
+        else:
+            self.shuffle = ShuffleBag(self.rows)
+
+    def row_positions(self):
+        """Map of id to position, rebuilt when rows has changed."""
+        if self.positions is None:
+            self.positions = {i: index for index, i in enumerate(self.rows)}
+        return self.positions
+
+    def add(self, paths):
+        """Add files last, returns the paths that were added."""
+        added = []
+        for path in paths:
+            if not os.path.splitext(path)[1].lower() in EXTENTIONS:
+                continue
+            self.files[path] = {
+                'name': os.path.splitext(os.path.basename(path))[0]}
+            self.paths[self.next_id] = path
+            self.rows.append(self.next_id)
+            self.shuffle.add(self.next_id)
+            self.next_id += 1
+            added.append(path)
+        self.positions = None
+        self.changed('rows')
+        return added
+
+    def remove(self, ids):
+        """Remove rows, the current row moves to the next one left."""
+        ids = set(ids)
+        if not ids:
+            return
+        if self.current in ids:
+            position = self.row_positions()[self.current]
+            following = [i for i in self.rows[position:] if i not in ids]
+            self.current = following[0] if following else None
+        self.rows = [i for i in self.rows if i not in ids]
+        for i in ids:
+            self.paths.pop(i)
+            self.queue.discard(i)
+            self.shuffle.remove(i)
+        self.positions = None
+        if self.current is None and self.rows:
+            self.current = self.rows[0]
+        self.changed('rows')
+
+    def move(self, ids, target):
+        """Move rows ids, given in play order, to the place of target."""
+        positions = self.row_positions()
+        downwards = positions[ids[0]] < positions[target]
+        moving = set(ids)
+        rows = [i for i in self.rows if i not in moving]
+        moveto = rows.index(target) + downwards
+        self.rows = rows[:moveto] + list(ids) + rows[moveto:]
+        self.positions = None
+        self.changed('rows')
+
+    def enqueue(self, ids):
+        """Queue rows to be played next, after what is already queued."""
+        for i in ids:
+            self.queue.append(i)
+        self.changed('queue')
+
+    def dequeue(self, ids):
+        """Remove the last queued entry of each row."""
+        for i in ids:
+            self.queue.remove_last(i)
+        self.changed('queue')
+
+    def play_row(self, i):
+        """Make row i the current row and the one playing, returns its path."""
+        self.current = i
+        return self.set_playing(i)
+
+    def set_playing(self, i):
+        """Mark row i as playing, returns its path."""
+        self.playing = i
+        self.changed('playing')
+        return self.paths[i]
+
+    def get_track(self, index=0):
+        """
+        Get track to play.
+
+        Index > 0 gets that amount of tracks forward in list. Queued rows
+        are played first without moving the current row. In random mode
+        tracks are taken from the shuffle bag instead.
+        """
+        if self.queue:
+            i = self.queue.pop()
+            self.changed('queue')
+            return self.set_playing(i)
+        if self.random:
+            if self.current not in self.paths:
+                self.current = self.shuffle.next()
+            for _ in range(index):
+                self.current = self.shuffle.next()
+            for _ in range(-index):
+                self.current = self.shuffle.previous()
+            index = 0
+        if self.current not in self.paths:
+            self.current = (self.rows or [None])[0]
+        if self.current is None:
+            return ''
+        if index:
+            position = self.row_positions()[self.current]
+            self.current = self.rows[(position + index) % len(self.rows)]
+        return self.set_playing(self.current)
+
+    def peek_track(self):
+        """Track that get_track(1) will return, without stepping to it."""
+        row = self.queue.peek()
+        if row is None:
+            if self.random:
+                row = self.shuffle.peek()
+            elif self.current in self.paths:
+                position = self.row_positions()[self.current]
+                row = self.rows[(position + 1) % len(self.rows)]
+        return self.paths.get(row)
@@ -1,19 +1,52 @@
 import logging
 import os
 import random
+import sys
 
-EXTENTIONS = ('.mp3')
+import metrics
+import pathtrie
+
+EXTENTIONS = ('.mp3',)
+# Playback options of a pattern and their defaults. Fade is the seconds
+# a track fades out while the next fades in, length the seconds after
+# which a track is cut, 0 plays it whole.
+OPTIONS = {'fade': 0, 'curve': 'linear', 'length': 0}
+
+def from_record(record, library=None):
+    """
+    Pattern saved with Pattern.record().
+
+    Nothing is scanned or selected, the files are looked up in the
+    library when they are needed.
+    """
+    p = Pattern.__new__(Pattern)
+    p.__setstate__(dict(record, log=logging.getLogger('MilongaPlayer.Pattern'),
+                        library=library))
+    return p
 
 class Pattern():
-    """Rules for playing a collection of songs"""
-    def __init__(self, name, root_paths=None, number=1, extentions=EXTENTIONS, cashe=None):
+    """
+    Rules for playing a collection of songs
+
+    The files are the files of the library below the root paths but not
+    below the excluded paths. They are looked up in the trie of the
+    library when needed, so changing paths never walks the files.
+    """
+    def __init__(self, name, root_paths=None, number=1, extentions=EXTENTIONS, library=None,
+                 fade=OPTIONS['fade'], curve=OPTIONS['curve'], length=OPTIONS['length'],
+                 excludes=None):
         self.log = logging.getLogger('MilongaPlayer.Pattern')
         self.name = name
         self.number = number
+        self.fade = fade
+        self.curve = curve
+        self.length = length
         self.extentions = extentions
-        self.files = []
+        self.excludes = list(excludes or [])
         self.playlist = []
-        self.cashe = {} if cashe is None else cashe
+        if library is None:
+            raise ValueError(f'Pattern {name} needs a library')
+        self.library = library
         if isinstance(root_paths, list):
             self.root_paths = root_paths
         elif root_paths:
@@ -33,9 +66,44 @@ class Pattern():
         pl = '\n\t'.join(pl)
         return f'{self.name}\n\t{pl}'        
 
+    def __getstate__(self):
+        # The library is shared and holds an open database, it is set
+        # again by the owning playlist after loading.
+        state = self.__dict__.copy()
+        state.pop('library', None)
+        return state
+
+    def __setstate__(self, state):
+        # Older saves carried a cashe dict with all scanned paths and a
+        # list of all files.
+        state.pop('cashe', None)
+        state.pop('files', None)
+        state.pop('file_sets', None)
+        state.setdefault('library', None)
+        state.setdefault('excludes', [])
+        # Share the strings of the tracks with the trie of the library.
+        state['playlist'] = list(map(sys.intern, state.get('playlist', [])))
+        for option, default in OPTIONS.items():
+            state.setdefault(option, default)
+        self.__dict__.update(state)
+
     def __len__(self):
         return len(self.playlist)
 
+    def options(self):
+        """Playback options for tracks of this pattern."""
+        return {option: getattr(self, option) for option in OPTIONS}
+
+    def record(self):
+        """Definition and selected tracks as plain data, for saving."""
+        return dict(self.options(),
+                    name=self.name,
+                    root_paths=list(self.root_paths),
+                    number=self.number,
+                    extentions=tuple(self.extentions),
+                    excludes=list(self.excludes),
+                    playlist=list(self.playlist))
+
     def next(self):
         """Get the next track to play"""
         if self.playlist:
@@ -43,30 +111,54 @@ class Pattern():
         else:
             self.log.warning('Playlist is empty')
         
+    def rules(self):
+        """Root paths mapped to True and excluded paths to False."""
+        rules = dict.fromkeys(self.root_paths, True)
+        rules.update(dict.fromkeys(self.excludes, False))
+        return rules
+
+    def tree(self, roots=None):
+        """
+        Trie of the library, roots that has not been scanned are scanned
+        first, by default the root paths. Patterns loaded from a saved
+        state has not scanned their roots, the library may be new.
+        """
+        if self.library is None:
+            raise RuntimeError(f'Pattern {self.name} has no library')
+        return self.library.tree(
+            self.root_paths if roots is None else roots)
+
+    def selection(self, trie):
+        """Selection of the files to play from trie, hold the library lock."""
+        return pathtrie.Selection(trie, self.rules())
+
+    @property
+    def files(self):
+        """All files of the pattern."""
+        trie = self.tree()
+        with self.library.lock:
+            return list(self.selection(trie))
+
+    def file_count(self):
+        """Number of files of the pattern."""
+        trie = self.tree()
+        with self.library.lock:
+            return len(self.selection(trie))
+
     def scan(self):
         """Get tracks to play from paths"""
         for path in self.root_paths:
             self.log.debug(f'Scaning root path: {path}')
             self.scan_path(path)
 
+    @metrics.timed('pattern.scan_path')
     def scan_path(self, path):
         """
-        Scan a specific path for tracks to play.
+        Make sure path is in the library.
 
-        Make use of cashe if possible.
+        The library only walks the path if it has not been indexed before.
         """
-        if path in self.cashe:
-            self.log.debug(f'Found path "{path}" in cashe')
-            self.files.extend(self.cashe[path])
-            return
-        self.cashe[path] = []
-        for root, dirs, files in os.walk(path):
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-                if os.path.splitext(path)[1] in self.extentions:
-                    if not file_path in self.files:
-                        self.files.append(file_path)
-                        self.cashe[path].append(file_path)
+        self.tree([path])
 
     def add_path(self, path):
         """
@@ -83,14 +175,38 @@ class Pattern():
         """
         self.log.info(f'Removing path: {path}')
         self.root_paths.remove(path)
-        self.files = [f for f in self.files if not f.startswith(path)]
+
+    def exclude_path(self, path):
+        """Leave out the files below path, a folder below a root path."""
+        self.log.info(f'Excluding path: {path}')
+        if not path in self.excludes:
+            self.excludes.append(path)
+
+    def include_path(self, path):
+        """Stop excluding path."""
+        self.log.info(f'Including path: {path}')
+        self.excludes.remove(path)
+
+    @metrics.timed('pattern.pick_files')
+    def pick_files(self):
+        """
+        Random files for a tanda, the playlist is not changed. Safe to
+        call from a worker thread.
+        """
+        trie = self.tree()
+        with self.library.lock:
+            selection = self.selection(trie)
+            count = len(selection)
+            return [selection.nth(index) for index in
+                    random.sample(range(count), min(self.number, count))]
 
     def select_files(self):
         """
         Randomly select the correct number of files to put in queue.
         """
-        if self.files:
-            self.playlist = random.sample(self.files, self.number)
+        files = self.pick_files()
+        if files:
+            self.playlist = files
             self.log.debug(f'Selected the following files: {",".join(self.playlist)}')
             return self.playlist
 
@@ -1,13 +1,23 @@
 import configparser
+import logging
+import os
+import queue
+import random
+import threading
 import tkinter
 import tkinter.filedialog
+import tkinter.messagebox
 import tkinter.ttk
 
+import fader
+import pathtrie
+from playlist.pattern import OPTIONS
 from widgets import Dialog
 
 class PatternBrowser(Dialog):
     """Dialog to edit pattern,"""
     def body(self, master, initial_data=None):
+        self.library = getattr(self.parent, 'library', None)
         # Top buttons
         button_bar = tkinter.ttk.Frame(master)
         button_bar.pack(side='top', fill=tkinter.X, expand=1)
@@ -167,9 +177,19 @@ class PatternBrowser(Dialog):
             
             paths = [x.strip() for x in
                      pattern.get(section, 'paths').split(',')]
+            excludes = [x.strip() for x in
+                        pattern.get(section, 'excludes', fallback='').split(',')
+                        if x.strip()]
             p = {'name': section,
                  'paths': paths,
-                 'number': pattern.getint(section, 'number')}
+                 'excludes': excludes,
+                 'number': pattern.getint(section, 'number'),
+                 'fade': pattern.getfloat(
+                     section, 'fade', fallback=OPTIONS['fade']),
+                 'curve': pattern.get(
+                     section, 'curve', fallback=OPTIONS['curve']),
+                 'length': pattern.getint(
+                     section, 'length', fallback=OPTIONS['length'])}
             self.add_pattern(p)
 
     def save_patterns(self):
@@ -184,7 +204,12 @@ class PatternBrowser(Dialog):
                     patterns.set('pattern_order', 'order', ', '.join(pattern_dict[key]))
                 else:
                     patterns.set(key, 'paths', ', '.join(pattern_dict[key]['paths']))
+                    patterns.set(key, 'excludes',
+                                 ', '.join(pattern_dict[key].get('excludes', [])))
                     patterns.set(key, 'number', str(pattern_dict[key]['number']))
+                    for option, default in OPTIONS.items():
+                        value = pattern_dict[key].get(option, default)
+                        patterns.set(key, option, str(value))
             with open(path, 'w') as fh:
                 patterns.write(fh)
 
@@ -214,13 +239,22 @@ class PatternBrowser(Dialog):
 class EditPattern(Dialog):
     """Dialog to edit a pattern."""
     def body(self, master, initial_data=None):
+        self.log = logging.getLogger('MilongaPlayer.EditPattern')
+        self.library = getattr(self.parent, 'library', None)
+        self.counter = None
         self.paths = []
+        self.excludes = []
         self.name = tkinter.StringVar()
         self.name.set('Name')
         buttonbar = tkinter.ttk.Frame(master)
         buttonbar.pack(side='top', fill=tkinter.X)
         add = tkinter.ttk.Button(buttonbar, command=self.add_path, text='Add path')
         add.pack(side='left')
+        exclude = tkinter.ttk.Button(
+            buttonbar, command=self.add_exclude, text='Exclude folder')
+        exclude.pack(side='left')
+        self.count = tkinter.StringVar()
+        tkinter.ttk.Label(buttonbar, textvariable=self.count).pack(side='left')
         
         tkinter.ttk.Entry(master, textvariable=self.name).pack(
             side='top', fill=tkinter.X)
@@ -230,43 +264,204 @@ class EditPattern(Dialog):
         self.number.set(3)
         sb = tkinter.ttk.Spinbox(master, to=100, textvariable=self.number)
         sb.pack(side='top', fill=tkinter.X)
+        tkinter.ttk.Label(master, text='Fade out seconds').pack(
+            side='top', fill=tkinter.X)
+        self.fade = tkinter.DoubleVar()
+        self.fade.set(OPTIONS['fade'])
+        tkinter.ttk.Spinbox(master, to=30, increment=0.5,
+                            textvariable=self.fade).pack(side='top', fill=tkinter.X)
+        tkinter.ttk.Label(master, text='Fade curve').pack(
+            side='top', fill=tkinter.X)
+        self.curve = tkinter.StringVar()
+        self.curve.set(OPTIONS['curve'])
+        tkinter.ttk.Combobox(master, textvariable=self.curve, state='readonly',
+                             values=list(fader.CURVES)).pack(side='top', fill=tkinter.X)
+        tkinter.ttk.Label(master, text='Cut after seconds (0 plays whole track)').pack(
+            side='top', fill=tkinter.X)
+        self.length = tkinter.IntVar()
+        self.length.set(OPTIONS['length'])
+        tkinter.ttk.Spinbox(master, to=3600, textvariable=self.length).pack(
+            side='top', fill=tkinter.X)
         self.path_frame = tkinter.ttk.Frame(master)
         self.path_frame.pack(side='top', fill=tkinter.BOTH)
+        self.exclude_frame = tkinter.ttk.Frame(master)
+        self.exclude_frame.pack(side='top', fill=tkinter.BOTH)
         if initial_data:
             self.name.set(initial_data['name'])
             self.number.set(initial_data['number'])
+            self.fade.set(initial_data.get('fade', OPTIONS['fade']))
+            self.curve.set(initial_data.get('curve', OPTIONS['curve']))
+            self.length.set(initial_data.get('length', OPTIONS['length']))
             for path in initial_data['paths']:
                 self.add_path(path)
+            for path in initial_data.get('excludes', ()):
+                self.add_exclude(path)
+        self.update_count()
+
+    def add_row(self, frame, rows, path, prefix=''):
+        """Add a row for path with a button to remove it."""
+        # Frame.
+        f = tkinter.ttk.Frame(frame)
+        f.path = path
+        f.prefix = prefix
+        f.pack(side='top', fill=tkinter.X)
+        rows.append(f)
+
+        # Label.
+        f.label = tkinter.ttk.Label(f, text=f'{prefix}{path}')
+        f.label.pack(side='left', fill=tkinter.X)
+
+        # Close button.
+        # ToDo: change to ttk button when a nice theme for close button exists
+        b = tkinter.Button(
+            f, text='X', relief='flat', command=lambda f=f: self.remove(f))
+        b.pack(side='right')
 
     def add_path(self, path=None):
         """Add path to pattern."""
         path = path or tkinter.filedialog.askdirectory()
         if path:
-            # Frame.
-            f = tkinter.ttk.Frame(self.path_frame)
-            f.path = path
-            f.pack(side='top', fill=tkinter.X)
-            self.paths.append(f)
-
-            # Label.
-            l = tkinter.ttk.Label(f, text=path)
-            l.pack(side='left', fill=tkinter.X)
-
-            # Close button.
-            # ToDo: change to ttk button when a nice theme for close button exists
-            b = tkinter.Button(
-                f, text='X', relief='flat', command=lambda f=f: self.remove(f))
-            b.pack(side='right')
+            self.add_row(self.path_frame, self.paths, path)
+            self.update_count()
+
+    def add_exclude(self, path=None):
+        """Exclude a folder below one of the paths."""
+        initialdir = self.paths[0].path if self.paths else None
+        path = path or tkinter.filedialog.askdirectory(initialdir=initialdir)
+        if not path:
+            return
+        parts = pathtrie.split(path)
+        if not any(pathtrie.is_below(parts, pathtrie.split(f.path))
+                   for f in self.paths):
+            tkinter.messagebox.showwarning(
+                'Exclude folder', f'{path} is not below any path',
+                parent=self)
+            return
+        self.add_row(self.exclude_frame, self.excludes, path, 'Excluding ')
+        self.update_count()
 
     def remove(self, widget):
         """Remove path from pattern."""
-        for index, w in enumerate(self.paths):
-            if w == widget:
-                self.paths.pop(index)
+        for rows in (self.paths, self.excludes):
+            if widget in rows:
+                rows.remove(widget)
                 widget.destroy()
+        self.update_count()
+
+    def update_count(self):
+        """
+        Show the number of tracks of the pattern and of every path.
+
+        Only folders already in the library are counted, new folders are
+        scanned when the pattern is loaded. The tracks are counted by a
+        counter thread, the trie of the library may have to be built.
+        """
+        if not self.library:
+            return
+        for f in self.paths + self.excludes:
+            f.label['text'] = f'{f.prefix}{f.path} (...)'
+        self.count.set('...')
+        results = queue.Queue()
+        self.counter = threading.Thread(
+            target=self.count_worker,
+            args=([f.path for f in self.paths],
+                  [f.path for f in self.excludes], results),
+            daemon=True)
+        self.counter.start()
+        self.poll_count(self.counter, results)
+
+    def count_worker(self, paths, excludes, results):
+        """Count the tracks of paths, run in counter thread."""
+        try:
+            scanned = [path for path in paths
+                       if self.library.is_scanned(path)]
+            trie = self.library.tree()
+            with self.library.lock:
+                counts = {path: trie.count(path) for path in paths + excludes}
+                rules = dict.fromkeys(scanned, True)
+                rules.update(dict.fromkeys(excludes, False))
+                count = len(pathtrie.Selection(trie, rules))
+            results.put((counts, count, len(scanned) < len(paths)))
+        except Exception:
+            self.log.error('Could not count tracks', exc_info=True)
+            results.put(None)
+
+    def poll_count(self, counter, results):
+        """Show the counts when the counter thread is done."""
+        if self.counter is not counter or not self.winfo_exists():
+            # Paths changed or the dialog closed meanwhile.
+            return
+        try:
+            result = results.get_nowait()
+        except queue.Empty:
+            self.after(50, self.poll_count, counter, results)
+            return
+        self.counter = None
+        if result is None:
+            self.count.set('')
+            return
+        counts, count, unscanned = result
+        for f in self.paths + self.excludes:
+            f.label['text'] = f'{f.prefix}{f.path} ({counts[f.path]} tracks)'
+        if unscanned:
+            self.count.set(f'{count} tracks and folders not yet scanned')
+        else:
+            self.count.set(f'{count} tracks')
 
     def apply(self):
         """Apply result on OK button press."""
         self.result = {'name': self.name.get(),
                        'paths': [l.path for l in self.paths],
-                       'number': self.number.get()}
+                       'excludes': [l.path for l in self.excludes],
+                       'number': self.number.get(),
+                       'fade': self.fade.get(),
+                       'curve': self.curve.get(),
+                       'length': self.length.get()}
+
+
+class PlanDialog(Dialog):
+    """Dialog to preview the planned evening and change its seed."""
+    def body(self, master, initial_data=None):
+        self.plan = initial_data['plan']
+        self.start = initial_data['start']
+        self.durations = initial_data['durations']
+        top = tkinter.ttk.Frame(master)
+        top.pack(side='top', fill=tkinter.X)
+        tkinter.ttk.Label(top, text='Seed').pack(side='left')
+        self.seed = tkinter.IntVar()
+        self.seed.set(self.plan.seed)
+        tkinter.ttk.Entry(top, textvariable=self.seed).pack(side='left')
+        tkinter.ttk.Button(
+            top, text='New seed', command=self.new_seed).pack(side='left')
+        tkinter.ttk.Label(top, text='Hours').pack(side='left')
+        self.hours = tkinter.DoubleVar()
+        self.hours.set(5)
+        tkinter.ttk.Spinbox(top, from_=0.5, to=12, increment=0.5, width=5,
+                            textvariable=self.hours).pack(side='left')
+        tkinter.ttk.Button(
+            top, text='Show', command=self.show).pack(side='left')
+        self.view = tkinter.ttk.Treeview(master, show='tree', height=20)
+        self.view.pack(side='top', fill=tkinter.BOTH, expand=1)
+        self.show()
+
+    def new_seed(self):
+        """Draw a new random seed and show its evening."""
+        self.seed.set(random.randrange(2 ** 32))
+        self.show()
+
+    def show(self):
+        """Show the evening of the current seed."""
+        self.view.delete(*self.view.get_children())
+        try:
+            seed = self.seed.get()
+        except tkinter.TclError:
+            return
+        for slot, name, tracks in self.plan.reseed(seed).evening(
+                self.hours.get(), self.start, self.durations):
+            iid = self.view.insert('', 'end', text=name)
+            for track in tracks:
+                self.view.insert(iid, 'end', text=os.path.basename(track))
+
+    def apply(self):
+        """Apply result on OK button press."""
+        self.result = self.seed.get()
@@ -1,17 +1,35 @@
+import heapq
 import logging
 import os
+import queue
+import threading
 import tkinter
+import tkinter.messagebox
 import tkinter.ttk
 
+import metadata
+import metrics
+import searchindex
 from playlist import history
 from playlist import pattern
 from playlist import patternbrowser
+from playlist import plan
+from widgets import VirtualTreeview
+
+# Most search results that are shown.
+MAX_RESULTS = 200
 
 class PatternPlayList(tkinter.ttk.Frame):
     """
     Pattern playlist.
+
+    Once all patterns are loaded the tandas are taken from a seeded plan
+    of the evening, slot is the number of the next tanda to take from it.
+
+    Tracks of the library can be searched for and put in the current
+    tanda, the search results are the rows of the result view.
     """
-    def __init__(self, master, player_instance, startup_info, cashe, *args, **kwargs):
+    def __init__(self, master, player_instance, startup_info, library, *args, **kwargs):
         self.log = logging.getLogger('MilongaPlayer.PlayList.PatternPlayList')
         self.log.info('Initialization of PlayList')
         super().__init__(master, *args, **kwargs)
@@ -21,10 +39,48 @@ class PatternPlayList(tkinter.ttk.Frame):
         pb = tkinter.ttk.Button(
             buttons, text='Pattern browser', command=self.edit_patterns)
         pb.pack(side='left')
-        uf = tkinter.ttk.Button(
+        self.update_button = tkinter.ttk.Button(
             buttons, text='Update files', command=self.update_files)
-        uf.pack(side='left')
-        
+        self.update_button.pack(side='left')
+        self.rescan_button = tkinter.ttk.Button(
+            buttons, text='Full rescan',
+            command=lambda: self.update_files(force=True))
+        self.rescan_button.pack(side='left')
+        self.updater = None
+        ep = tkinter.ttk.Button(
+            buttons, text='Evening plan', command=self.edit_plan)
+        ep.pack(side='left')
+        tkinter.ttk.Label(buttons, text='Search').pack(side='left')
+        self.query = tkinter.StringVar()
+        self.query.trace_add('write', self.on_query)
+        search = tkinter.ttk.Entry(buttons, textvariable=self.query)
+        search.pack(side='left', fill=tkinter.X, expand=1)
+        search.bind('<FocusIn>', lambda event: self.library.prepare_index())
+        search.bind('<Return>', lambda event: self.insert_found())
+        search.bind('<Escape>', lambda event: self.query.set(''))
+        self.loading = tkinter.ttk.Frame(buttons)
+        self.progress = tkinter.StringVar()
+        tkinter.ttk.Label(
+            self.loading, textvariable=self.progress).pack(side='left')
+        tkinter.ttk.Button(
+            self.loading, text='Cancel', command=self.cancel_load).pack(side='left')
+        self.loader = None
+        self.loader_results = queue.Queue()
+        self.placeholders = []
+
+        self.found = []
+        self.search_id = None
+        self.found_positions = {}
+        self.found_tags = {}
+        self.results = tkinter.ttk.Frame(self)
+        self.result_count = tkinter.StringVar()
+        tkinter.ttk.Label(
+            self.results, textvariable=self.result_count).pack(side='top')
+        self.result_view = VirtualTreeview(
+            self.results, self, show='tree', height=8)
+        self.result_view.tree.bind('<ButtonPress-3>', self.on_result_click)
+        self.result_view.pack(side='top', fill=tkinter.X)
+
         self.view = tkinter.ttk.Treeview(self, show='tree')
         self.view.bind('<Double-1>', self.on_dclick)
         self.view.pack(side='left', expand=1, fill=tkinter.BOTH)
@@ -34,51 +90,298 @@ class PatternPlayList(tkinter.ttk.Frame):
         self.view.configure(yscrollcommand=scrollbar.set)
         self.history = history.History(self)
         self.history.pack(side='left', fill=tkinter.Y)
+        self.library = library
+        self.metadata = metadata.Requester(
+            self, library.metadata, self.on_metadata)
+        self.plan = None
+        self.planner = None
+        self.keys = {}
+        self.slot = 0
+        self.prepared = {}
+        self.selecting = set()
+        self.waiting = set()
         self.on_startup(startup_info)
         self.current_track = None
         self.player = player_instance
-        self.cashe = cashe
         self.log.info('PlayList initialization Done')
 
     def on_startup(self, startup_info):
-        """Run once on startup to set playlist and state."""
+        """
+        Run once on startup to set playlist and state.
+
+        Patterns are saved as records of their definition and selected
+        tracks. Older versions pickled the Pattern objects as playlist,
+        those are still loaded.
+        """
         if not startup_info:
             startup_info = {'name': 'Playlist',
-                            'playlist': [],
+                            'patterns': [],
                             'pattern': None}
-        for key in ('name', 'playlist', 'pattern'):
+        for key in ('name', 'pattern'):
             try:
                 self.log.info(f'Loading: {key=}: {startup_info[key]}')
                 setattr(self, key, startup_info[key])
             except KeyError as err:
                 self.log.error(f'Error loading: KeyError: {err}')
                 setattr(self, key, None)
+        if 'patterns' in startup_info:
+            self.playlist = [pattern.from_record(record, self.library)
+                             for record in startup_info['patterns']]
+            if startup_info.get('library_version') != self.library.version:
+                self.drop_missing()
+        else:
+            self.playlist = startup_info.get('playlist') or []
+            for p in self.playlist:
+                p.library = self.library
         self.create_playlist_view()
+        saved_plan = startup_info.get('plan')
+        if saved_plan and self.playlist:
+            # The saved tandas are kept, only the plan is built again.
+            self.slot = saved_plan['slot']
+            self.build_plan(saved_plan['order'], saved_plan['seed'],
+                            apply=False)
+        self.prepare_tanda()
+
+    def drop_missing(self):
+        """
+        Remove selected tracks that are no longer in the library.
+
+        Patterns with roots that the library has never scanned are left
+        as they are, a new library knows none of their tracks yet.
+        """
+        patterns = [p for p in self.playlist
+                    if all(self.library.is_scanned(root)
+                           for root in p.root_paths)]
+        known = self.library.known(
+            path for p in patterns for path in p.playlist)
+        for p in patterns:
+            missing = [path for path in p.playlist if path not in known]
+            if missing:
+                self.log.info(f'Dropping tracks missing from library: {missing}')
+                p.playlist = [path for path in p.playlist if path in known]
 
     def on_close(self):
-        """Save state and playlist."""
+        """
+        Save state and playlist.
+
+        Patterns are saved by their definition and selected tracks
+        together with the version of the library, files are looked up in
+        the library again when they are loaded.
+        """
         dict_to_save = {}
         if self.current_track:
             self.playlist[0].insert_file(self.current_track)
-        for key in ('name', 'playlist', 'pattern'):
+        for key in ('name', 'pattern'):
             dict_to_save[key] = getattr(self, key)
+        dict_to_save['patterns'] = [p.record() for p in self.playlist]
+        dict_to_save['library_version'] = self.library.version
         dict_to_save['type'] = 'Pattern'
+        if self.plan:
+            dict_to_save['plan'] = dict(self.plan.state(), slot=self.slot)
+        elif self.planner:
+            dict_to_save['plan'] = dict(self.planner.state, slot=self.slot)
         return dict_to_save
             
     def move_to_last(self):
         """
         Moves playlist entry to last in the list.
+
+        While patterns are loading it is moved to be the last loaded one,
+        placeholder rows are kept at the end.
         """
         p = self.playlist.pop(0)
         self.log.info(f'Move to last: {p}')
-        p.select_files()
+        self.next_tanda(p)
         self.playlist.append(p)
         iid = self.view.get_children()[0]
         children = self.view.get_children(iid)
         self.log.debug(f'Removing children {children}')
         self.view.delete(*children)
-        self.view.move(iid, '', 'end')
+        self.view.move(iid, '', len(self.playlist) - 1)
         self.add_tracks(iid, p)
+        self.prepare_tanda()
+
+    def next_tanda(self, p):
+        """
+        Fill p with the next tanda of the plan, or with the tracks
+        prepared for it. If they are not ready p is left empty and its
+        rows are filled in when they are.
+        """
+        if self.plan or self.planner:
+            self.slot += 1
+        if self.plan:
+            name, tracks = self.plan.tanda(self.slot - 1)
+            if name == self.keys.get(id(p)):
+                p.playlist = tracks
+                return
+            self.log.warning(f'Plan has {name} where {p.name} is, '
+                             'selecting at random')
+        tracks = self.prepared.pop(p, None)
+        if tracks is None:
+            p.playlist = []
+            self.waiting.add(p)
+            self.prepare_tanda(p)
+        else:
+            p.playlist = tracks
+
+    def prepare_tanda(self, p=None):
+        """
+        Select the next tanda of p in a worker thread, by default of the
+        pattern that is moved to last next. Planned tandas need none.
+        """
+        if p is None:
+            if self.plan or self.planner or not self.playlist:
+                return
+            p = self.playlist[0]
+        if p in self.prepared or p in self.selecting:
+            return
+        self.selecting.add(p)
+        results = queue.Queue()
+        threading.Thread(target=self.select_worker, args=(p, results),
+                         daemon=True).start()
+        self.poll_select(p, results)
+
+    def select_worker(self, p, results):
+        """Pick the files of a tanda of p, run in worker thread."""
+        try:
+            results.put(p.pick_files())
+        except Exception:
+            self.log.error(f'Could not select files of {p.name}',
+                           exc_info=True)
+            results.put([])
+
+    def poll_select(self, p, results):
+        """Keep the selected tanda, or fill in p if it is waiting for it."""
+        if p not in self.selecting:
+            # Patterns were loaded again meanwhile.
+            return
+        try:
+            tracks = results.get_nowait()
+        except queue.Empty:
+            self.after(50, self.poll_select, p, results)
+            return
+        self.selecting.discard(p)
+        if p not in self.waiting:
+            self.prepared[p] = tracks
+            return
+        self.waiting.discard(p)
+        if p not in self.playlist or p.playlist:
+            return
+        p.playlist = tracks
+        iid = self.view.get_children()[self.playlist.index(p)]
+        self.add_tracks(iid, p)
+
+    def plan_keys(self):
+        """
+        Key of every pattern in the plan, in list order.
+
+        Patterns with the same name and paths share their tracks, so no
+        track repeats between them. Patterns that share a name but not
+        paths are numbered, in sorted order so that the keys do not
+        change as the list is turned.
+        """
+        definitions = [(p.name, sorted(p.root_paths), sorted(p.excludes))
+                       for p in self.playlist]
+        variants = {}
+        for definition in sorted(definitions):
+            same_name = variants.setdefault(definition[0], [])
+            if definition not in same_name:
+                same_name.append(definition)
+        keys = []
+        for definition in definitions:
+            number = variants[definition[0]].index(definition)
+            keys.append(f'{definition[0]} ({number + 1})' if number
+                        else definition[0])
+        return keys
+
+    def build_plan(self, order=None, seed=None, apply=True):
+        """
+        Plan for the files of the loaded patterns, built by a planner
+        thread since the files may have to be scanned. An order saved
+        for other patterns is not used. With apply the tandas not yet
+        started are taken from the plan when it is done.
+        """
+        keys = self.plan_keys()
+        self.keys = {id(p): key for p, key in zip(self.playlist, keys)}
+        patterns = dict(zip(keys, self.playlist))
+        if order and not set(order) <= patterns.keys():
+            self.log.warning(f'Plan order {order} does not match the patterns')
+            order = None
+        results = queue.Queue()
+        self.planner = threading.Thread(
+            target=self.plan_worker,
+            args=(order or keys, patterns, seed, results), daemon=True)
+        self.planner.state = {'order': order or keys, 'seed': seed}
+        self.progress.set('Planning')
+        self.loading.pack(side='left')
+        self.planner.start()
+        self.poll_plan(self.planner, results, apply)
+
+    @metrics.timed('patternplaylist.plan_worker')
+    def plan_worker(self, order, patterns, seed, results):
+        """Build the plan, run in planner thread."""
+        try:
+            results.put(plan.Plan(
+                order, {key: p.files for key, p in patterns.items()},
+                {key: p.number for key, p in patterns.items()}, seed))
+        except Exception:
+            self.log.error('Could not plan the evening', exc_info=True)
+            results.put(None)
+
+    def poll_plan(self, planner, results, apply):
+        """Put the plan in place when the planner thread is done."""
+        if self.planner is not planner:
+            return
+        try:
+            evening = results.get_nowait()
+        except queue.Empty:
+            self.after(50, self.poll_plan, planner, results, apply)
+            return
+        self.planner = None
+        self.loading.pack_forget()
+        if evening is None:
+            self.prepare_tanda()
+            return
+        self.plan = evening
+        if apply:
+            self.apply_plan()
+
+    def start_plan(self, seed=None):
+        """
+        Plan the evening and take the tandas not yet started from it.
+
+        The patterns in the list take the slots up to self.slot.
+        """
+        self.slot = self.slot or len(self.playlist)
+        self.build_plan(self.plan and self.plan.order, seed)
+
+    def apply_plan(self):
+        """Take the tandas not yet started from the plan."""
+        self.log.info(f'Planning evening with seed {self.plan.seed}')
+        first = self.slot - len(self.playlist)
+        for index, (iid, p) in enumerate(
+                zip(self.view.get_children(), self.playlist)):
+            if index == 0 and self.current_track:
+                continue
+            name, tracks = self.plan.tanda(first + index)
+            if name != self.keys.get(id(p)):
+                continue
+            p.playlist = tracks
+            self.view.delete(*self.view.get_children(iid))
+            self.add_tracks(iid, p)
+
+    def edit_plan(self):
+        """Preview the evening and change its seed."""
+        if not self.plan:
+            return
+        durations = {path: tags.get('duration') for path, tags in
+                     self.library.metadata.cached(self.plan.table).items()}
+        seed = patternbrowser.PlanDialog(
+            self, 'Evening plan',
+            {'plan': self.plan, 'start': self.slot - len(self.playlist),
+             'durations': durations}).result
+        if seed is not None and seed != self.plan.seed:
+            self.start_plan(seed)
 
     def move_to_item(self, iid):
         """
@@ -104,11 +407,110 @@ class PatternPlayList(tkinter.ttk.Frame):
         Add tracks to playlist.
         """
         self.log.info(f'Adding tracks to tree item {iid}')
+        tags = self.metadata.request(p.playlist)
         for path in p.playlist:
-            track = os.path.basename(path)
+            track = metadata.describe(path, tags.get(path))
             self.log.debug(f'Adding track: {track} to {iid}')
             self.view.insert(iid, 'end', text=track, values=(path,))
 
+    def on_query(self, *args):
+        """Search when typing has paused for SEARCH_DELAY."""
+        if self.search_id:
+            self.after_cancel(self.search_id)
+        self.search_id = self.after(searchindex.SEARCH_DELAY, self.on_search)
+
+    def on_search(self, *args):
+        """Show the tracks of the library that match the search."""
+        self.search_id = None
+        query = self.query.get()
+        found = None
+        if searchindex.tokenize(query):
+            index = self.library.index(wait=False)
+            if index is None:
+                # Still being built, search again in a while.
+                self.after(searchindex.SEARCH_RETRY, self.on_search)
+                return
+            with self.library.lock:
+                found = index.search(query)
+        if found is None:
+            self.found = []
+            self.results.pack_forget()
+        else:
+            # Sorted by path the tracks of an orchestra stay together.
+            self.found = heapq.nsmallest(MAX_RESULTS, found)
+            self.found_tags = self.library.metadata.cached(self.found)
+            if len(found) > MAX_RESULTS:
+                self.result_count.set(
+                    f'{len(found)} tracks, showing the first {MAX_RESULTS}')
+            else:
+                self.result_count.set(f'{len(found)} tracks')
+            self.results.pack(side='top', fill=tkinter.X, before=self.view)
+        self.found_positions = {path: index
+                                for index, path in enumerate(self.found)}
+        self.result_view.first = 0
+        self.result_view.refresh()
+
+    def row_count(self):
+        """Number of search results, used by the result view."""
+        return len(self.found)
+
+    def row_index(self, path):
+        """Position of a search result, used by the result view."""
+        return self.found_positions[path]
+
+    def row(self, index):
+        """Path, text and values of a search result, used by the result view."""
+        path = self.found[index]
+        return path, metadata.describe(path, self.found_tags.get(path)), ()
+
+    def on_result_click(self, event):
+        """Right click menu on search results."""
+        path = self.result_view.identify_row(event.y)
+        if path is not None and path not in self.result_view.selection():
+            self.result_view.selection_set((path, ))
+        menu = tkinter.Menu(self, tearoff=0)
+        menu.add_command(label='Play next', command=self.insert_found)
+        menu.add_command(label='Add to current tanda',
+                         command=lambda: self.insert_found(last=True))
+        try:
+            menu.tk_popup(event.x_root, event.y_root, 0)
+        finally:
+            menu.grab_release()
+
+    def insert_found(self, last=False):
+        """
+        Put the selected search results, or the first one, in the current
+        tanda. They are played next, or after the tanda with last.
+        """
+        if self.search_id:
+            # Enter pressed before the search was run.
+            self.after_cancel(self.search_id)
+            self.on_search()
+        paths = self.result_view.selection() or self.found[:1]
+        if not paths:
+            return
+        if not self.playlist:
+            self.log.warning('No patterns loaded')
+            return
+        p = self.playlist[0]
+        iid = self.view.get_children()[0]
+        index = len(p.playlist) if last else 0
+        tags = self.metadata.request(paths)
+        for offset, path in enumerate(paths):
+            self.log.info(f'Inserting {path} in {p.name}')
+            p.insert_file(path, index + offset)
+            self.view.insert(iid, index + offset, values=(path, ),
+                             text=metadata.describe(path, tags.get(path)))
+
+    def on_metadata(self, tags):
+        """Show title and artist for tracks whose metadata has arrived."""
+        for parent in self.view.get_children():
+            for iid in self.view.get_children(parent):
+                path = self.view.item(iid, 'values')[0]
+                if path in tags:
+                    self.view.item(
+                        iid, text=metadata.describe(path, tags[path]))
+
     def get_track(self, index=0):
         """
         If called with index==0 or no index then return current track if its set,
@@ -122,6 +524,9 @@ class PatternPlayList(tkinter.ttk.Frame):
             playlist = '\n\t'.join(playlist)
             return f'{name}\n\t{playlist}'
 
+        if not self.playlist:
+            self.log.warning('No patterns loaded')
+            return ''
         if not self.history.current.get():
             self.history.add(self.playlist[0])
             self.history.add(self.playlist[1])
@@ -145,6 +550,19 @@ class PatternPlayList(tkinter.ttk.Frame):
                 parent_iid = self.view.get_children()[0]
                 self.remove_first_child(parent_iid)
             return self.get_track(index - 1)
+
+    def peek_track(self):
+        """Track that get_track(1) will return, without stepping to it."""
+        for p in self.playlist[:2]:
+            if p.playlist:
+                return p.playlist[0]
+        return None
+
+    def get_track_options(self):
+        """Playback options of the pattern the current track is from."""
+        if not self.playlist:
+            return {}
+        return self.playlist[0].options()
         
     def create_playlist_view(self):
         """
@@ -165,28 +583,176 @@ class PatternPlayList(tkinter.ttk.Frame):
             self.log.debug(f'Pattern: {pattern}')
             self.load_pattern()
 
+    @metrics.timed('patternplaylist.load_pattern')
     def load_pattern(self):
-        """Load a pattern from file."""
+        """
+        Load a pattern.
+
+        Patterns are built by a background thread so that the mainloop
+        keeps running while their files are scanned. Every pattern gets a
+        placeholder row that is filled in when it is done.
+        """
+        self.cancel_load()
         for child in self.view.get_children():
             self.view.delete(child)
         self.playlist = []
+        self.placeholders = []
+        self.plan = None
+        self.planner = None
+        self.slot = 0
+        self.prepared = {}
+        self.selecting = set()
+        self.waiting = set()
+        patterns = []
         for key in self.pattern['pattern_order']:
             name = self.pattern[key]['name']
             paths = self.pattern[key]['paths']
             number = self.pattern[key]['number']
-            self.log.debug(f'{name=}, {paths=}, {number=}')
-            p = pattern.Pattern(name, paths, number, cashe=self.cashe)
+            options = {option: self.pattern[key][option]
+                       for option in pattern.OPTIONS
+                       if option in self.pattern[key]}
+            options['excludes'] = self.pattern[key].get('excludes', [])
+            self.log.debug(f'{name=}, {paths=}, {number=}, {options=}')
+            patterns.append((name, paths, number, options))
+            self.placeholders.append(
+                self.view.insert('', 'end', text=f'{name} (loading...)'))
+        cancel = threading.Event()
+        self.loader = threading.Thread(
+            target=self.load_worker,
+            args=(patterns, cancel, self.loader_results),
+            daemon=True)
+        self.loader.cancel = cancel
+        self.progress.set(f'Loading 0/{len(patterns)}')
+        self.loading.pack(side='left')
+        self.loader.start()
+        self.poll_load(self.loader)
+
+    @metrics.timed('patternplaylist.load_worker')
+    def load_worker(self, patterns, cancel, results):
+        """Build patterns in order, run in loader thread."""
+        for index, (name, paths, number, options) in enumerate(patterns):
+            if cancel.is_set():
+                return
+            try:
+                p = pattern.Pattern(name, paths, number, library=self.library,
+                                    **options)
+            except Exception:
+                self.log.error(f'Could not load pattern {name}', exc_info=True)
+                p = None
+            results.put((cancel, index, p))
+        results.put((cancel, None, None))
+
+    def poll_load(self, loader):
+        """Move loaded patterns from the loader thread in to the view."""
+        if self.loader is not loader:
+            return
+        while True:
+            try:
+                cancel, index, p = self.loader_results.get_nowait()
+            except queue.Empty:
+                break
+            if cancel is not loader.cancel:
+                # Result from a canceled load.
+                continue
+            if index is None:
+                self.log.info('Done loading patterns')
+                self.loader = None
+                self.loading.pack_forget()
+                self.start_plan()
+                return
+            iid = self.placeholders[index]
+            self.placeholders[index] = None
+            if p is None:
+                self.view.item(iid, text=f'{self.view.item(iid, "text")} failed')
+                continue
             self.playlist.append(p)
-        self.create_playlist_view()
+            self.view.item(iid, text=p.name)
+            self.view.move(iid, '', len(self.playlist) - 1)
+            self.add_tracks(iid, p)
+            self.progress.set(
+                f'Loading {index + 1}/{len(self.placeholders)}')
+        self.after(50, self.poll_load, loader)
+
+    def destroy(self):
+        """Stop loading before the widget is destroyed."""
+        self.cancel_load()
+        self.selecting = set()
+        super().destroy()
+
+    def cancel_load(self):
+        """
+        Cancel loading of patterns, patterns not done are dropped. A plan
+        being built is dropped as well.
+        """
+        if self.planner:
+            self.log.info('Canceling plan')
+            self.planner = None
+            self.loading.pack_forget()
+        if not self.loader:
+            return
+        self.log.info('Canceling load of patterns')
+        self.loader.cancel.set()
+        self.loader = None
+        self.loading.pack_forget()
+        for iid in self.placeholders:
+            if iid and self.view.exists(iid):
+                self.view.delete(iid)
+        self.placeholders = []
 
-    def update_files(self):
+    def update_files(self, force=False):
         """
-        Update files in patterns, clear cashe.
+        Update files in patterns.
+
+        Only directories changed since the last scan are listed again.
+        Files retagged or replaced in place do not change the
+        modification time of their directory, with force every directory
+        below the paths of the patterns is listed so they are found.
+
+        The rescan runs in a background thread so that the mainloop, and
+        with it the player, keeps running while the folders are walked.
         """
-        for pattern in self.playlist:
-            for path in pattern['paths']:
-                self.cashe.pop(path, None)
-        self.load_pattern()
+        if self.updater:
+            return
+        paths = {path for p in self.playlist for path in p.root_paths}
+        results = queue.Queue()
+        self.updater = threading.Thread(
+            target=self.update_worker, args=(paths, force, results),
+            daemon=True)
+        self.update_button.state(['disabled'])
+        self.rescan_button.state(['disabled'])
+        self.updater.start()
+        self.poll_update(results)
+
+    def update_worker(self, paths, force, results):
+        """Rescan paths, run in updater thread."""
+        try:
+            results.put(self.library.rescan(paths, force))
+        except Exception:
+            self.log.error('Could not update files', exc_info=True)
+            results.put(None)
+
+    def poll_update(self, results):
+        """Reload patterns and show the result when the rescan is done."""
+        try:
+            diff = results.get_nowait()
+        except queue.Empty:
+            self.after(50, self.poll_update, results)
+            return
+        self.updater = None
+        self.update_button.state(['!disabled'])
+        self.rescan_button.state(['!disabled'])
+        if diff is None:
+            return
+        added, removed, modified = diff
+        self.log.info(f'Updated files: {len(added)} added, '
+                      f'{len(removed)} removed, {len(modified)} modified')
+        if added or removed:
+            self.load_pattern()
+        tkinter.messagebox.showinfo(
+            'Update files',
+            f'{len(added)} added\n{len(removed)} removed\n'
+            f'{len(modified)} modified',
+            parent=self)
 
     def on_dclick(self, event):
         """
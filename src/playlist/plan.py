@@ -0,0 +1,108 @@
+import array
+import copy
+import itertools
+import random
+
+# Seconds assumed for a track whose duration is not known.
+TRACK_SECONDS = 180
+
+class Plan():
+    """
+    Seeded plan of the tandas of an evening.
+
+    Slot k of the evening is entry k of the pattern order, repeated over
+    and over. All files are kept once in a table and every pattern name
+    has an array of indexes in to it. The tandas of a pattern are taken
+    in turn from seeded permutations of its array, so no track repeats
+    before all tracks of the pattern have been played, and the same seed
+    always gives the same evening. Tandas are only generated when they
+    are asked for.
+    """
+    def __init__(self, order, files, numbers, seed=None):
+        """
+        Order is the pattern names in play order, files and numbers map
+        every name to its tracks and the number of tracks in a tanda.
+        """
+        self.seed = random.randrange(2 ** 32) if seed is None else seed
+        self.order = list(order)
+        self.numbers = dict(numbers)
+        index = {}
+        self.members = {}
+        for name in self.order:
+            if name not in self.members:
+                self.members[name] = array.array(
+                    'l', (index.setdefault(path, len(index))
+                          for path in files.get(name, ())))
+        self.table = list(index)
+        # Every order entry is the n:th entry with its name, a name with
+        # several entries takes turns between them.
+        self.ranks = []
+        self.counts = {}
+        for name in self.order:
+            self.ranks.append(self.counts.get(name, 0))
+            self.counts[name] = self.counts.get(name, 0) + 1
+        self.permutations = {}
+
+    def state(self):
+        """What is needed to recreate the plan together with the files."""
+        return {'seed': self.seed, 'order': self.order}
+
+    def reseed(self, seed):
+        """The same plan with another seed."""
+        other = copy.copy(self)
+        other.seed = seed
+        other.permutations = {}
+        return other
+
+    def permutation(self, name, epoch):
+        """Order of the tracks of name in a round through all of them."""
+        key = (name, epoch)
+        if key not in self.permutations:
+            members = array.array('l', self.members[name])
+            random.Random(f'{self.seed}:{name}:{epoch}').shuffle(members)
+            self.permutations[key] = members
+        return self.permutations[key]
+
+    def tanda(self, slot):
+        """Pattern name and tracks of slot."""
+        if not self.order:
+            return None, []
+        cycle, entry = divmod(slot, len(self.order))
+        name = self.order[entry]
+        members = self.members[name]
+        number = min(self.numbers.get(name, 1), len(members))
+        turn = cycle * self.counts[name] + self.ranks[entry]
+        tracks = []
+        for position in range(turn * number, (turn + 1) * number):
+            epoch, offset = divmod(position, len(members))
+            tracks.append(self.table[self.permutation(name, epoch)[offset]])
+        return name, tracks
+
+    def tandas(self, start=0):
+        """Generate (slot, name, tracks) from slot start on."""
+        for slot in itertools.count(start):
+            yield (slot, ) + self.tanda(slot)
+
+    def evening(self, hours, start=0, durations=None):
+        """
+        Tandas that fill hours of playing, from slot start.
+
+        Durations maps tracks to seconds, other tracks count as
+        TRACK_SECONDS.
+        """
+        if not self.table:
+            return []
+        durations = durations or {}
+        remaining = hours * 3600
+        result = []
+        # Tandas in a row without tracks, a whole round of them and no
+        # tanda will ever have tracks.
+        empty = 0
+        for slot, name, tracks in self.tandas(start):
+            if remaining <= 0 or empty >= len(self.order):
+                break
+            result.append((slot, name, tracks))
+            remaining -= sum(durations.get(track) or TRACK_SECONDS
+                             for track in tracks)
+            empty = 0 if tracks else empty + 1
+        return result
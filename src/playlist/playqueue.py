@@ -0,0 +1,86 @@
+import bisect
+import collections
+
+class PlayQueue():
+    """
+    Queue of rows to play.
+
+    Every entry gets an increasing sequence number and each row keeps the
+    sequence numbers of its entries, so the queue positions of a row can
+    be calculated without walking the queue. Entries that are dequeued
+    are only marked as removed and skipped once they reach the front.
+    """
+    def __init__(self, rows=()):
+        self.entries = collections.deque()
+        self.live = {}
+        self.sequences = {}
+        self.removed = []
+        self.next_sequence = 0
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.live)
+
+    def __iter__(self):
+        """Rows in the order they are queued."""
+        return (self.live[s] for s in self.entries if s in self.live)
+
+    def append(self, row):
+        """Enqueue row last."""
+        sequence = self.next_sequence
+        self.next_sequence += 1
+        self.entries.append(sequence)
+        self.live[sequence] = row
+        self.sequences.setdefault(row, []).append(sequence)
+
+    def pop(self):
+        """Dequeue and return the first row, None if empty."""
+        while self.entries:
+            sequence = self.entries.popleft()
+            if sequence not in self.live:
+                # Removed entries are the lowest still in the queue.
+                self.removed.pop(0)
+                continue
+            row = self.live.pop(sequence)
+            self.sequences[row].pop(0)
+            self.forget(row)
+            return row
+        return None
+
+    def peek(self):
+        """First row without dequeuing it, None if empty."""
+        for sequence in self.entries:
+            if sequence in self.live:
+                return self.live[sequence]
+        return None
+
+    def forget(self, row):
+        """Drop row if it has no entries left."""
+        if not self.sequences[row]:
+            del self.sequences[row]
+
+    def remove(self, sequence):
+        """Mark entry as removed."""
+        del self.live[sequence]
+        bisect.insort(self.removed, sequence)
+
+    def remove_last(self, row):
+        """Remove the last entry of row, return False if row is not queued."""
+        if row not in self.sequences:
+            return False
+        sequence = self.sequences[row].pop()
+        self.remove(sequence)
+        self.forget(row)
+        return True
+
+    def discard(self, row):
+        """Remove all entries of row."""
+        for sequence in self.sequences.pop(row, ()):
+            self.remove(sequence)
+
+    def positions(self, row):
+        """Queue positions of row, counted from 1."""
+        head = self.entries[0] if self.entries else self.next_sequence
+        return [sequence - head - bisect.bisect_left(self.removed, sequence) + 1
+                for sequence in self.sequences.get(row, ())]
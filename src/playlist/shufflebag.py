@@ -0,0 +1,98 @@
+import array
+import random
+
+class ShuffleBag():
+    """
+    Random order of rows where no row is repeated until all are played.
+
+    The order is a permutation of row ids kept in an integer array, rows
+    before the cursor have been played in the current round. Added rows
+    are swapped in to a random place among the rows not yet played, so
+    the bag never has to be reshuffled when rows are added or removed.
+    """
+    def __init__(self, rows=(), order=None, cursor=0):
+        if order is None:
+            self.order = array.array('l', rows)
+            random.shuffle(self.order)
+            self.cursor = 0
+        else:
+            self.order = array.array('l', order)
+            self.cursor = max(0, min(cursor, len(self.order)))
+        self.positions = None
+
+    def __len__(self):
+        return len(self.order)
+
+    def row_positions(self):
+        """Map of row to position in order, built on first use."""
+        if self.positions is None:
+            self.positions = {row: index for index, row in enumerate(self.order)}
+        return self.positions
+
+    def swap(self, a, b):
+        """Swap two positions in order."""
+        order = self.order
+        order[a], order[b] = order[b], order[a]
+        if self.positions is not None:
+            self.positions[order[a]] = a
+            self.positions[order[b]] = b
+
+    def add(self, row):
+        """Add row at a random place among the rows not yet played."""
+        self.order.append(row)
+        last = len(self.order) - 1
+        if self.positions is not None:
+            self.positions[row] = last
+        self.swap(last, random.randint(self.cursor, last))
+
+    def remove(self, row):
+        """Remove row from bag."""
+        positions = self.row_positions()
+        index = positions.get(row)
+        if index is None:
+            return
+        if index < self.cursor:
+            # Keep the played part together by first moving the row to
+            # the end of it.
+            self.cursor -= 1
+            self.swap(index, self.cursor)
+            index = self.cursor
+        self.swap(index, len(self.order) - 1)
+        self.order.pop()
+        del positions[row]
+
+    def shuffle(self):
+        """Start a new round."""
+        last = self.order[self.cursor - 1] if self.cursor else None
+        random.shuffle(self.order)
+        self.positions = None
+        self.cursor = 0
+        if len(self.order) > 1 and self.order[0] == last:
+            # Do not play the same row twice in a row between rounds.
+            self.swap(0, random.randint(1, len(self.order) - 1))
+
+    def next(self):
+        """Next row, starts a new round when all rows has been played."""
+        if not self.order:
+            return None
+        if self.cursor >= len(self.order):
+            self.shuffle()
+        self.cursor += 1
+        return self.order[self.cursor - 1]
+
+    def peek(self):
+        """
+        Row that next will return, None if it is not known because a new
+        round has to be shuffled first.
+        """
+        if self.cursor < len(self.order):
+            return self.order[self.cursor]
+        return None
+
+    def previous(self):
+        """Step back to the previously played row."""
+        if not self.order:
+            return None
+        if self.cursor > 1:
+            self.cursor -= 1
+        return self.order[max(0, self.cursor - 1)]
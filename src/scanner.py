@@ -0,0 +1,110 @@
+import collections
+import concurrent.futures
+import logging
+import os
+
+EXTENTIONS = ('.mp3',)
+MAX_WORKERS = 8
+BATCH_SIZE = 500
+
+# Result of visiting one directory. Tracks is a dict path -> (size, mtime)
+# or None if the directory was not listed because it was unchanged, mtime
+# is None if the directory could not be read.
+Directory = collections.namedtuple(
+    'Directory', ('path', 'mtime', 'tracks', 'subdirs'))
+
+class Scanner():
+    """
+    Walk directory trees in parallel.
+
+    Directories are listed with os.scandir by a bounded pool of threads,
+    which hides most of the latency on network shares. File sizes and
+    modification times are taken from the DirEntry objects, on Windows
+    that comes for free with the listing.
+    """
+    def __init__(self, extentions=EXTENTIONS, max_workers=MAX_WORKERS,
+                 batch_size=BATCH_SIZE):
+        self.log = logging.getLogger('MilongaPlayer.Scanner')
+        self.extentions = tuple(ext.lower() for ext in extentions)
+        self.max_workers = max_workers
+        self.batch_size = batch_size
+
+    def visit(self, path, snapshot=None):
+        """
+        Visit a single directory.
+
+        If snapshot is given it is called with path and modification time
+        and should return the stored subdirectories if the directory is
+        unchanged, in that case the directory is not listed.
+        """
+        try:
+            mtime = os.stat(path).st_mtime
+        except OSError as err:
+            self.log.warning(f'Could not stat {path}: {err}')
+            return Directory(path, None, None, [])
+        if snapshot:
+            subdirs = snapshot(path, mtime)
+            if subdirs is not None:
+                return Directory(path, mtime, None, subdirs)
+        tracks = {}
+        subdirs = []
+        try:
+            with os.scandir(path) as entries:
+                for entry in entries:
+                    try:
+                        # Linked directories are not followed, as with
+                        # os.walk, a link to a parent would never end.
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.name)
+                        elif entry.name.lower().endswith(self.extentions):
+                            stat = entry.stat()
+                            tracks[entry.path] = (stat.st_size, stat.st_mtime)
+                    except OSError as err:
+                        self.log.warning(f'Could not stat {entry.path}: {err}')
+        except OSError as err:
+            self.log.warning(f'Could not list {path}: {err}')
+            return Directory(path, None, None, [])
+        return Directory(path, mtime, tracks, subdirs)
+
+    def walk(self, roots, snapshot=None):
+        """
+        Walk roots and yield lists of visited directories.
+
+        Directories are yielded in batches as they are done, not in any
+        particular order. A batch is yielded when it holds batch_size
+        tracks or when the walk is done.
+        """
+        seen = set()
+        batch = []
+        count = 0
+        with concurrent.futures.ThreadPoolExecutor(self.max_workers) as pool:
+            pending = set()
+            for root in roots:
+                if root not in seen:
+                    seen.add(root)
+                    pending.add(pool.submit(self.visit, root, snapshot))
+            while pending:
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    directory = future.result()
+                    for name in directory.subdirs:
+                        path = os.path.join(directory.path, name)
+                        if path not in seen:
+                            seen.add(path)
+                            pending.add(pool.submit(self.visit, path, snapshot))
+                    batch.append(directory)
+                    count += len(directory.tracks or ())
+                    if count >= self.batch_size:
+                        yield batch
+                        batch = []
+                        count = 0
+        if batch:
+            yield batch
+
+    def tracks(self, roots):
+        """Walk roots and yield batches of (path, size, mtime)."""
+        for batch in self.walk(roots):
+            yield [(path, ) + stat
+                   for directory in batch if directory.tracks
+                   for path, stat in directory.tracks.items()]
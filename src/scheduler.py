@@ -0,0 +1,89 @@
+import logging
+import queue
+import threading
+import time
+import tkinter
+
+class Scheduler():
+    """
+    Deliver events from other threads to the Tk thread.
+
+    Events are put on a thread safe queue and a small thread wakes the
+    Tk main loop with a virtual event when there is something to handle.
+    The same thread fires a timer, so events can be scheduled ahead
+    without polling. Callback is called in the Tk thread with the name
+    and arguments of every event.
+    """
+    def __init__(self, widget, callback, sequence='<<PlayerEvent>>'):
+        self.log = logging.getLogger('MilongaPlayer.Scheduler')
+        self.widget = widget
+        self.callback = callback
+        self.sequence = sequence
+        self.events = queue.Queue()
+        self.condition = threading.Condition()
+        self.wake = False
+        self.timer = None
+        self.running = True
+        widget.bind(sequence, self.dispatch, add='+')
+        self.thread = threading.Thread(
+            target=self.run, name='Scheduler', daemon=True)
+        self.thread.start()
+
+    def post(self, name, *args):
+        """Post event, can be called from any thread."""
+        self.events.put((name, args))
+        with self.condition:
+            self.wake = True
+            self.condition.notify()
+
+    def set_timer(self, delay, name, *args):
+        """Post event after delay seconds, replaces any earlier timer."""
+        with self.condition:
+            self.timer = (time.monotonic() + delay, name, args)
+            self.condition.notify()
+
+    def cancel_timer(self):
+        """Cancel timer if set."""
+        with self.condition:
+            self.timer = None
+            self.condition.notify()
+
+    def run(self):
+        """Wait for events and timers and wake the Tk thread."""
+        while True:
+            with self.condition:
+                while self.running and not self.wake:
+                    timeout = None
+                    if self.timer:
+                        timeout = self.timer[0] - time.monotonic()
+                        if timeout <= 0:
+                            self.events.put(self.timer[1:])
+                            self.timer = None
+                            break
+                    self.condition.wait(timeout)
+                if not self.running:
+                    return
+                self.wake = False
+            try:
+                self.widget.event_generate(self.sequence, when='tail')
+            except (tkinter.TclError, RuntimeError):
+                self.log.info('Widget is gone, stopping scheduler')
+                return
+
+    def dispatch(self, event=None):
+        """Handle all queued events, runs in the Tk thread."""
+        while True:
+            try:
+                name, args = self.events.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                self.callback(name, *args)
+            except Exception:
+                self.log.error(f'Failed to handle event {name}', exc_info=True)
+
+    def stop(self):
+        """Stop the scheduler thread."""
+        with self.condition:
+            self.running = False
+            self.condition.notify()
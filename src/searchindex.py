@@ -0,0 +1,129 @@
+import bisect
+import os
+import re
+import unicodedata
+
+WORD = re.compile(r'\w+')
+# Tag columns that are searched together with the file and folder name.
+TEXT_COLUMNS = ('artist', 'singer', 'title', 'year', 'genre')
+# More new words than this are merged by sorting all words again.
+MERGE_SIZE = 1000
+# Milliseconds without typing before a search box searches.
+SEARCH_DELAY = 100
+# Milliseconds between searches while the search index is built.
+SEARCH_RETRY = 200
+
+def normalize(text):
+    """Lower case text without accents, so that Rodriguez finds Rodríguez."""
+    text = text.casefold()
+    if text.isascii():
+        return text
+    text = unicodedata.normalize('NFKD', text)
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+def tokenize(text):
+    """Words of text, normalized."""
+    return WORD.findall(normalize(text))
+
+def describe(path, tags=None):
+    """Searchable text of a track, file name, folder name and tags."""
+    directory, name = os.path.split(path)
+    words = [os.path.splitext(name)[0], os.path.basename(directory)]
+    for column in TEXT_COLUMNS:
+        value = (tags or {}).get(column)
+        if value:
+            words.append(str(value))
+    return ' '.join(words)
+
+class SearchIndex():
+    """
+    Incremental prefix search over the words of tracks.
+
+    Every key is indexed by the words of its text, a query matches keys
+    that has a word starting with every word of the query. The words are
+    kept sorted so that all words with a prefix are a range found by
+    bisection, the cost of a lookup follows the number of keys found
+    and not the size of the index.
+    """
+    def __init__(self):
+        self.words = {}
+        self.postings = {}
+        self.sorted = []
+        self.new = set()
+        self.last = None
+
+    def __len__(self):
+        return len(self.words)
+
+    def __contains__(self, key):
+        return key in self.words
+
+    def add(self, key, text):
+        """Index key by the words of text, replacing what it had."""
+        self.remove(key)
+        words = tuple(set(tokenize(text)))
+        self.words[key] = words
+        for word in words:
+            keys = self.postings.get(word)
+            if keys is None:
+                keys = self.postings[word] = set()
+                self.new.add(word)
+            keys.add(key)
+        self.last = None
+
+    def remove(self, key):
+        """Remove key from the index."""
+        words = self.words.pop(key, None)
+        if words is None:
+            return
+        for word in words:
+            keys = self.postings[word]
+            keys.discard(key)
+            if not keys:
+                # Stale words in the sorted list are skipped by lookup.
+                del self.postings[word]
+                self.new.discard(word)
+        self.last = None
+
+    def merge(self):
+        """Move new words in to the sorted list."""
+        if len(self.new) > MERGE_SIZE or len(self.sorted) > 2 * len(self.postings):
+            self.sorted = sorted(self.postings)
+        else:
+            for word in self.new:
+                bisect.insort(self.sorted, word)
+        self.new = set()
+
+    def lookup(self, prefix):
+        """Keys with a word starting with prefix."""
+        if self.new:
+            self.merge()
+        start = bisect.bisect_left(self.sorted, prefix)
+        end = bisect.bisect_left(self.sorted, prefix + '\U0010ffff', start)
+        result = set()
+        for word in self.sorted[start:end]:
+            result.update(self.postings.get(word, ()))
+        return result
+
+    def search(self, query):
+        """
+        Set of keys matching query, None if query has no words.
+
+        The keys of every word are looked up and intersected, longest
+        word first as it usually has the fewest keys. The keys of the
+        words of the last query are kept, so typing only looks up the
+        word being typed. The result must not be changed.
+        """
+        words = sorted(set(tokenize(query)), key=len, reverse=True)
+        if not words:
+            return None
+        found = {}
+        result = None
+        for word in words:
+            keys = self.last.get(word) if self.last else None
+            if keys is None:
+                keys = self.lookup(word)
+            found[word] = keys
+            result = keys if result is None else result & keys
+        self.last = found
+        return result
@@ -1,7 +1,9 @@
 import logging
 import tkinter
+import tkinter.filedialog
 import tkinter.ttk
 
+import metrics
 from widgets import Dialog, SetKey
 
 class SettingsDialog(Dialog):
@@ -26,7 +28,8 @@ class SettingsDialog(Dialog):
             'general': General(
                 self.settings_frame, initial_data['general']),
             'key_bindings': KeyBindings(
-                self.settings_frame, initial_data['key_bindings'])}
+                self.settings_frame, initial_data['key_bindings']),
+            'metrics': Metrics(self.settings_frame)}
         self.setup_view()
 
     def setup_view(self):
@@ -39,7 +42,7 @@ class SettingsDialog(Dialog):
                     iid = self.view.insert(root, 'end', text=name)
                     self.add_categories(iid, name[1:])
 
-        add_categories('', ('General', 'Key bindings'))
+        add_categories('', ('General', 'Key bindings', 'Metrics'))
         self.view.bind('<Button-1>', self.switch_frame)
 
     def switch_frame(self, event):
@@ -62,14 +65,23 @@ class General(tkinter.ttk.Frame):
     def __init__(self, master, initial_data, *args, **kwargs):
         super().__init__(master, *args, **kwargs)
         self.changed = False
+        initial_data = {**self.defaults(), **(initial_data or {})}
+        self.normalize = tkinter.BooleanVar(self, initial_data['normalize'])
+        tkinter.ttk.Checkbutton(
+            self, text='Even out loudness between tracks (needs ffmpeg)',
+            variable=self.normalize, command=self.set_changed).pack(
+                side='top', anchor='w')
+
+    def set_changed(self):
+        self.changed = True
 
     @property
     def result(self):
-        return {}
+        return {'normalize': self.normalize.get()}
     
     @staticmethod
     def defaults():
-        return {}
+        return {'normalize': False}
 
 class KeyBindings(tkinter.ttk.Frame):
     """Keybindings frame."""
@@ -131,3 +143,79 @@ class KeyBindings(tkinter.ttk.Frame):
             if result is not None and current != result:
                 self.changed = True
                 self.view.set(iid, 'Binding', result)
+
+class Metrics(tkinter.ttk.Frame):
+    """
+    Timings of the application.
+
+    Metrics are turned on with enabled = true in the [metrics] section of
+    config.ini, the checkbutton only turns them on for this session.
+    """
+    COLUMNS = ('count', 'mean', 'p50', 'p95', 'max')
+
+    def __init__(self, master, *args, **kwargs):
+        super().__init__(master, *args, **kwargs)
+        self.log = logging.getLogger('MilongaPlayer.Settings.Metrics')
+        self.changed = False
+        self.result = None
+        self.enabled = tkinter.BooleanVar(self, metrics.registry.enabled)
+        tkinter.ttk.Checkbutton(
+            self, text='Collect metrics', variable=self.enabled,
+            command=self.set_enabled).pack(side='top', anchor='w')
+        self.view = tkinter.ttk.Treeview(self, columns=self.COLUMNS)
+        self.view.heading('#0', text='Operation')
+        for column in self.COLUMNS:
+            self.view.heading(column, text=f'{column} (ms)' if column != 'count'
+                              else column)
+            self.view.column(column, width=70, anchor='e')
+        self.view.pack(side='top', fill=tkinter.BOTH, expand=1)
+        buttons = tkinter.ttk.Frame(self)
+        buttons.pack(side='top', fill=tkinter.X)
+        for text, command in (('Refresh', self.refresh),
+                              ('Clear', self.clear),
+                              ('Write to file', self.dump),
+                              (f'Profile {metrics.PROFILE_SECONDS} s',
+                               self.profile)):
+            tkinter.ttk.Button(buttons, text=text, command=command).pack(
+                side='left')
+        self.refresh()
+
+    def set_enabled(self):
+        metrics.registry.enabled = self.enabled.get()
+
+    def refresh(self):
+        """Show current metrics."""
+        self.view.delete(*self.view.get_children())
+        summaries, counters = metrics.registry.summary()
+        for m in summaries:
+            self.view.insert('', 'end', text=m['name'], values=(
+                m['count'], f'{m["mean"]:.1f}', f'{m["p50"]:.1f}',
+                f'{m["p95"]:.1f}', f'{m["max"]:.1f}'))
+        for name, value in counters.items():
+            self.view.insert('', 'end', text=name, values=(value, ))
+
+    def clear(self):
+        metrics.registry.clear()
+        self.refresh()
+
+    def dump(self):
+        """Append the metrics to a file."""
+        path = tkinter.filedialog.asksaveasfilename(
+            parent=self, defaultextension='.txt', initialfile='metrics.txt')
+        if path:
+            metrics.registry.dump(path)
+
+    def profile(self):
+        """
+        Profile the main thread for PROFILE_SECONDS, the stats are
+        written to a file that can be read with pstats.
+        """
+        path = tkinter.filedialog.asksaveasfilename(
+            parent=self, defaultextension='.prof', initialfile='milonga.prof')
+        if not path or not metrics.registry.start_profile():
+            return
+        # Scheduled on the main window so that the profile outlives the
+        # dialog.
+        self.nametowidget('.').after(
+            metrics.PROFILE_SECONDS * 1000,
+            lambda: metrics.registry.stop_profile(path))
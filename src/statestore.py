@@ -0,0 +1,95 @@
+import hashlib
+import logging
+import os
+import pickle
+
+import metrics
+
+FORMAT_VERSION = 1
+SUFFIX = '.dat'
+
+class StateStore():
+    """
+    Saved state kept as separate records.
+
+    Every record is pickled to its own file together with a format
+    version. Records are read when asked for and only written when their
+    content differ from what is on disk. Writes go to a temporary file
+    that is moved in place, so a crash during save never leaves a broken
+    record behind.
+    """
+    def __init__(self, path):
+        self.log = logging.getLogger('MilongaPlayer.StateStore')
+        self.path = path
+        self.digests = {}
+        os.makedirs(path, exist_ok=True)
+
+    def record_path(self, key):
+        """Path to the file of a record."""
+        return os.path.join(self.path, f'{key}{SUFFIX}')
+
+    def keys(self):
+        """Keys of all saved records."""
+        return [name[:-len(SUFFIX)] for name in os.listdir(self.path)
+                if name.endswith(SUFFIX)]
+
+    @metrics.timed('state.load')
+    def load(self, key, default=None):
+        """
+        Load a record.
+
+        Returns default if the record does not exist or can not be read,
+        a broken record only loses that record.
+        """
+        path = self.record_path(key)
+        try:
+            with open(path, 'br') as fh:
+                data = fh.read()
+            version, value = pickle.loads(data)
+        except FileNotFoundError:
+            self.log.info(f'No saved record: {key}')
+            return default
+        except Exception:
+            self.log.error(f'Could not load record: {key}', exc_info=True)
+            return default
+        if version != FORMAT_VERSION:
+            self.log.warning(f'Record {key} has format {version}, '
+                             f'expected {FORMAT_VERSION}')
+            return default
+        self.digests[key] = hashlib.sha1(data).digest()
+        return value
+
+    @metrics.timed('state.save')
+    def save(self, key, value):
+        """
+        Save a record if it has changed.
+
+        Returns True if the record was written.
+        """
+        data = pickle.dumps((FORMAT_VERSION, value),
+                            protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha1(data).digest()
+        if self.digests.get(key) == digest:
+            self.log.debug(f'Record {key} unchanged')
+            metrics.count('state.unchanged')
+            return False
+        path = self.record_path(key)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'bw') as fh:
+            fh.write(data)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, path)
+        self.digests[key] = digest
+        self.log.debug(f'Record {key} saved, {len(data)} bytes')
+        metrics.count('state.bytes written', len(data))
+        return True
+
+    def delete(self, key):
+        """Delete a record."""
+        self.log.info(f'Deleting record: {key}')
+        self.digests.pop(key, None)
+        try:
+            os.remove(self.record_path(key))
+        except FileNotFoundError:
+            pass
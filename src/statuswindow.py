@@ -3,11 +3,18 @@ import tkinter
 import tkinter.font
 import tkinter.ttk
 
+# Milliseconds without resize events before the font is fitted.
+RESIZE_DELAY = 150
+MIN_FONT_SIZE = 4
+
 class StatusWindow():
-    def __init__(self, master, player_instance):
-        self.player_instance = player_instance
+    def __init__(self, master, telemetry):
         self.top = tkinter.Toplevel(master)
-        self.top.bind('<Configure>', self.resize)
+        self.top.bind('<Configure>', self.on_configure)
+        self.resize_id = None
+        self.fitted = None
+        self.widths = {}
+        self.linespaces = {}
 
         # Label
         self.current_track = tkinter.StringVar()
@@ -16,25 +23,57 @@ class StatusWindow():
         self.label = tkinter.ttk.Label(
             self.top, textvariable=self.current_track, font=self.label_font)
         self.label.pack(fill=tkinter.BOTH, expand=1)
+        # Sizes are tried on a copy so the label is only changed once.
+        self.measure_font = self.label_font.copy()
+
+        telemetry.subscribe(self.top, self.on_telemetry)
 
-        self.worker()
+    def on_telemetry(self, changed, values):
+        if 'name' in changed:
+            current_track = os.path.splitext(changed['name'])[0]
+            self.current_track.set(current_track)
+            self.resize()
 
-    def worker(self):
-        current_track = self.player_instance.current_track or ''
-        current_track = os.path.splitext(os.path.basename(current_track))[0]
-        self.current_track.set(current_track)
-        self.top.after(500, self.worker)
+    def on_configure(self, event):
+        """Fit the font when the window has stopped changing size."""
+        if event.widget is not self.top:
+            return
+        if self.resize_id:
+            self.top.after_cancel(self.resize_id)
+        self.resize_id = self.top.after(RESIZE_DELAY, self.resize)
 
-    def resize(self, *args, **kwargs):
+    def fits(self, text, size, width, height):
+        """True if text in font size fits in width and height."""
+        if not size in self.linespaces:
+            self.measure_font['size'] = size
+            self.linespaces[size] = self.measure_font.metrics('linespace')
+        if self.linespaces[size] >= height:
+            return False
+        if not (text, size) in self.widths:
+            self.measure_font['size'] = size
+            self.widths[(text, size)] = self.measure_font.measure(text)
+        return self.widths[(text, size)] < width
+
+    def resize(self):
+        """Set the largest font size where the track fits the window."""
+        self.resize_id = None
         current = self.current_track.get()
         if not current:
             return
         height = self.label.winfo_height()
         width = self.label.winfo_width()
-        self.label_font['size'] = 4
-        font = self.label_font
-        while (current and
-               font.measure(current) < width and
-               font.metrics('linespace') < height):
-            self.label_font['size'] += 1
-        self.label_font['size'] -= 1
+        if self.fitted == (current, width, height):
+            return
+        if not self.fitted or self.fitted[0] != current:
+            # Widths of earlier tracks are not needed again.
+            self.widths.clear()
+        self.fitted = (current, width, height)
+        low = MIN_FONT_SIZE - 1
+        high = max(MIN_FONT_SIZE, height)
+        while low < high:
+            size = (low + high + 1) // 2
+            if self.fits(current, size, width, height):
+                low = size
+            else:
+                high = size - 1
+        self.label_font['size'] = max(low, 1)
@@ -0,0 +1,84 @@
+import logging
+import os
+
+# Milliseconds between samples while playing and while idle.
+INTERVAL = 100
+IDLE_INTERVAL = 1000
+
+class Telemetry():
+    """
+    Sample the player and publish changed values.
+
+    The player is sampled once per tick however many subscribers there
+    are, and subscribers are only called with the values that changed.
+    Sampling slows down while nothing is playing or the main window is
+    iconified and stops when there are no subscribers left.
+    """
+    def __init__(self, master, player_instance):
+        self.log = logging.getLogger('MilongaPlayer.Telemetry')
+        self.master = master
+        self.player_instance = player_instance
+        self.subscribers = {}
+        self.values = {}
+        self.after_id = None
+
+    def subscribe(self, widget, callback):
+        """
+        Call callback with changed values and all values until widget is
+        destroyed. It is called at once with the current values.
+        """
+        self.log.debug(f'Subscribing: {widget}')
+        self.subscribers[str(widget)] = callback
+        widget.bind('<Destroy>',
+                    lambda event: self.on_destroy(event, widget), add='+')
+        callback(dict(self.values), self.values)
+        if not self.after_id:
+            self.tick()
+
+    def unsubscribe(self, widget):
+        """Stop publishing to widget."""
+        self.log.debug(f'Unsubscribing: {widget}')
+        self.subscribers.pop(str(widget), None)
+
+    def on_destroy(self, event, widget):
+        """Unsubscribe widget when it is destroyed."""
+        # Destroy events of the children are also seen on a toplevel.
+        if event.widget is widget:
+            self.unsubscribe(widget)
+
+    def sample(self):
+        """Read values from the player."""
+        player = self.player_instance
+        track = player.current_track or ''
+        values = {'track': track,
+                  'name': os.path.basename(track),
+                  'playing': bool(player.is_playing())}
+        if player.get_media():
+            values['position'] = player.get_position()
+            values['time'] = max(0, player.get_time())
+            values['duration'] = max(0, player.get_length())
+        return values
+
+    def tick(self):
+        """Sample and publish changes, then schedule the next tick."""
+        self.after_id = None
+        if not self.subscribers:
+            self.log.debug('No subscribers, stopping')
+            return
+        values = self.sample()
+        changed = {key: value for key, value in values.items()
+                   if self.values.get(key) != value}
+        self.values = values
+        if changed:
+            for key, callback in list(self.subscribers.items()):
+                try:
+                    callback(changed, values)
+                except Exception:
+                    self.log.error(f'Subscriber {key} failed', exc_info=True)
+        self.after_id = self.master.after(self.interval(), self.tick)
+
+    def interval(self):
+        """Time to next tick."""
+        if not self.values.get('playing') or self.master.state() == 'iconic':
+            return IDLE_INTERVAL
+        return INTERVAL
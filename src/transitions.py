@@ -0,0 +1,196 @@
+import collections
+import ctypes
+import logging
+import os
+import threading
+import time
+
+import metrics
+
+# Phases of a transition, from the end of a track or the key press to
+# the next track playing.
+PHASES = ('wait', 'open', 'parse', 'start')
+# A transition that has not reached play after this many seconds has
+# been abandoned, a later play is timed on its own.
+STALE = 10
+# Number of slowest transitions listed in the summary.
+SLOWEST = 5
+# Filesystems of network shares on posix.
+NETWORK_FILESYSTEMS = ('nfs', 'nfs4', 'cifs', 'smbfs', 'smb3', 'afpfs',
+                       'fuse.sshfs', 'davfs', 'fuse.davfs2')
+
+def mount_points():
+    """Mount points of network filesystems on posix, longest first."""
+    points = []
+    try:
+        with open('/proc/mounts', encoding='utf-8') as fh:
+            for line in fh:
+                fields = line.split()
+                if len(fields) > 2 and fields[2] in NETWORK_FILESYSTEMS:
+                    points.append(fields[1].replace('\\040', ' '))
+    except OSError:
+        pass
+    return sorted(points, key=len, reverse=True)
+
+class Location():
+    """Tells if paths are on a local disk or a network share."""
+    def __init__(self):
+        self.drives = {}
+        self.mounts = None
+
+    def __call__(self, path):
+        return 'network' if self.is_network(path) else 'local'
+
+    def is_network(self, path):
+        """True if path is on a network share."""
+        if path.startswith(('\\\\', '//')):
+            return True
+        if os.name == 'nt':
+            drive = os.path.splitdrive(os.path.abspath(path))[0]
+            if drive not in self.drives:
+                # DRIVE_REMOTE
+                self.drives[drive] = ctypes.windll.kernel32.GetDriveTypeW(
+                    drive + '\\') == 4
+            return self.drives[drive]
+        if self.mounts is None:
+            self.mounts = mount_points()
+        path = os.path.abspath(path)
+        return any(path == point or path.startswith(point.rstrip('/') + '/')
+                   for point in self.mounts)
+
+class Transitions():
+    """
+    Time from the end of a track, or the user asking for another one,
+    to the next track playing.
+
+    A transition begins with its cause and is split in phases, 'wait'
+    until the player is asked to play, 'open' to find the file and set
+    the media, 'parse' until VLC has found the streams of the file and
+    'start' until VLC reports playing. The phases are marked from the Tk
+    thread and from VLC threads.
+
+    Transitions are kept per location, local or network, for the summary
+    of the evening that is written on close.
+    """
+    def __init__(self):
+        self.log = logging.getLogger('MilongaPlayer.Transitions')
+        self.location = Location()
+        self.lock = threading.Lock()
+        self.pending = None
+        self.started = time.time()
+        self.metrics = {}
+        self.causes = collections.Counter()
+        self.failed = collections.Counter()
+        self.slowest = []
+
+    def begin(self, cause):
+        """Start timing a transition caused by cause."""
+        with self.lock:
+            self.pending = {'cause': cause, 'start': time.perf_counter()}
+
+    def opening(self, track):
+        """
+        The player is about to open track, a transition is begun if none
+        is pending.
+        """
+        now = time.perf_counter()
+        with self.lock:
+            pending = self.pending
+            if (pending is None or 'track' in pending or
+                    now - pending['start'] > STALE):
+                pending = self.pending = {'cause': 'play', 'start': now}
+            pending['track'] = track
+            pending['open'] = now
+
+    def opened(self, preloaded):
+        """The media of the track is set."""
+        with self.lock:
+            if self.pending and 'opened' not in self.pending:
+                self.pending['opened'] = time.perf_counter()
+                self.pending['preloaded'] = preloaded
+
+    def parsed(self):
+        """VLC has found the streams of the track."""
+        with self.lock:
+            if (self.pending and 'opened' in self.pending and
+                    'parsed' not in self.pending):
+                self.pending['parsed'] = time.perf_counter()
+
+    def cancel(self, reason=None):
+        """Forget the pending transition, reason counts it as failed."""
+        with self.lock:
+            pending, self.pending = self.pending, None
+            if pending and reason and 'track' in pending:
+                self.failed[reason] += 1
+        if pending and reason and 'track' in pending:
+            self.log.warning(f'Transition to {pending["track"]} failed: '
+                             f'{reason}')
+
+    def playing(self):
+        """The track is playing, record the pending transition."""
+        now = time.perf_counter()
+        with self.lock:
+            pending, self.pending = self.pending, None
+        if not pending or 'opened' not in pending:
+            return
+        parsed = pending.get('parsed', pending['opened'])
+        phases = {'wait': pending['open'] - pending['start'],
+                  'open': pending['opened'] - pending['open'],
+                  'parse': parsed - pending['opened'],
+                  'start': now - parsed,
+                  'gap': now - pending['start']}
+        phases = {name: value * 1000 for name, value in phases.items()}
+        track = pending['track']
+        location = self.location(track)
+        self.log.info(
+            f'Transition {pending["cause"]} {location} '
+            f'{"preloaded " if pending["preloaded"] else ""}'
+            f'{phases["gap"]:.0f} ms (' +
+            ', '.join(f'{name} {phases[name]:.0f}' for name in PHASES) +
+            f'): {track}')
+        with self.lock:
+            self.causes[pending['cause']] += 1
+            for name, value in phases.items():
+                key = f'{name} {location}'
+                metric = self.metrics.get(key)
+                if metric is None:
+                    metric = self.metrics[key] = metrics.Metric(key)
+                metric.add(value)
+            self.slowest.append((phases['gap'], location, track))
+            self.slowest = sorted(self.slowest, reverse=True)[:SLOWEST]
+        if metrics.registry.enabled:
+            for name, value in phases.items():
+                metrics.registry.add(f'transition.{name}', value)
+
+    def report(self):
+        """Summary of the evening as text."""
+        with self.lock:
+            summaries = [self.metrics[key].summary() for key in
+                         sorted(self.metrics)]
+            causes = dict(self.causes)
+            failed = dict(self.failed)
+            slowest = list(self.slowest)
+        started = time.strftime('%Y-%m-%d %H:%M', time.localtime(self.started))
+        lines = [f'Transitions {started} - {time.strftime("%H:%M")}',
+                 f'{"phase":<16}{"count":>8}{"p50":>10}{"p95":>10}{"max":>10}']
+        for m in summaries:
+            lines.append(f'{m["name"]:<16}{m["count"]:>8}{m["p50"]:>10.0f}'
+                         f'{m["p95"]:>10.0f}{m["max"]:>10.0f}')
+        lines.append('Causes: ' + ', '.join(
+            f'{cause} {count}' for cause, count in sorted(causes.items())))
+        if failed:
+            lines.append('Failed: ' + ', '.join(
+                f'{reason} {count}' for reason, count in sorted(failed.items())))
+        if slowest:
+            lines.append('Slowest:')
+            for gap, location, track in slowest:
+                lines.append(f'{gap:>8.0f} ms {location:<8}{track}')
+        return '\n'.join(lines) + '\n'
+
+    def write(self, path):
+        """Append the summary to file path if anything was played."""
+        if not self.metrics and not self.failed:
+            return
+        with open(path, 'a', encoding='utf-8') as fh:
+            fh.write(self.report() + '\n')
+        self.log.info(f'Transitions written to {path}')
@@ -141,3 +141,168 @@ class SetKey(Dialog):
     def apply(self):
         """Set result upon OK button press."""
         self.result = self.key.get()
+
+class VirtualTreeview(tkinter.ttk.Frame):
+    """
+    Treeview that only holds the rows that are visible.
+
+    The rows are owned by a model that has to implement row_count(),
+    row(index) returning (key, text, values) and row_index(key). Only the
+    visible window plus a few rows of overscan are inserted in the
+    Treeview, so the cost of rendering does not depend on the number of
+    rows. Selection is kept here since most rows are not in the Treeview.
+    """
+    OVERSCAN = 5
+
+    def __init__(self, master, model, *args, **kwargs):
+        super().__init__(master)
+        self.model = model
+        self.first = 0
+        self.visible = 20
+        self.selected = set()
+        self.materialized = {}
+        self.tree = tkinter.ttk.Treeview(self, *args, **kwargs)
+        self.scrollbar = tkinter.ttk.Scrollbar(
+            self, orient='vertical', command=self.yview)
+        self.tree.pack(side='left', expand=1, fill=tkinter.BOTH)
+        self.scrollbar.pack(side='left', fill=tkinter.Y)
+        self.tree.bind('<Configure>', self.on_configure)
+        self.tree.bind('<<TreeviewSelect>>', self.on_select)
+        self.tree.bind('<MouseWheel>', self.on_wheel)
+        self.tree.bind('<Button-4>', lambda event: self.scroll(-3))
+        self.tree.bind('<Button-5>', lambda event: self.scroll(3))
+        for key, step in (('<Up>', -1), ('<Down>', 1)):
+            self.tree.bind(key, lambda event, step=step: self.step(step))
+
+    def on_wheel(self, event):
+        """
+        Scroll by the wheel, Windows gives multiples of 120 and macOS
+        small steps, at least one row is scrolled either way.
+        """
+        if event.delta:
+            self.scroll(int(-event.delta / 120) or
+                        (-1 if event.delta > 0 else 1))
+
+    def refresh(self):
+        """Render rows again, call when the model has changed."""
+        count = self.model.row_count()
+        self.first = max(0, min(self.first, count - self.visible))
+        self.selected.intersection_update(
+            key for key in self.selected if self.row_exists(key))
+        self.render()
+
+    def row_exists(self, key):
+        try:
+            return self.model.row_index(key) is not None
+        except (KeyError, ValueError):
+            return False
+
+    def render(self):
+        """Put the visible window of rows in to the Treeview."""
+        count = self.model.row_count()
+        children = self.tree.get_children()
+        if children:
+            self.tree.delete(*children)
+        self.materialized = {}
+        last = min(count, self.first + self.visible + self.OVERSCAN)
+        for index in range(self.first, last):
+            key, text, values = self.model.row(index)
+            iid = self.tree.insert('', 'end', text=text, values=values)
+            self.materialized[iid] = key
+        self.tree.selection_set([iid for iid, key in self.materialized.items()
+                                 if key in self.selected])
+        if count:
+            self.scrollbar.set(self.first / count,
+                               min(count, self.first + self.visible) / count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_configure(self, event=None):
+        """Recalculate number of visible rows."""
+        children = self.tree.get_children()
+        bbox = self.tree.bbox(children[0]) if children else None
+        if bbox:
+            heading, row_height = bbox[1], bbox[3]
+        else:
+            heading, row_height = 25, 20
+        visible = max(1, (self.tree.winfo_height() - heading) // row_height)
+        if visible != self.visible:
+            self.visible = visible
+            self.refresh()
+
+    def on_select(self, event=None):
+        """Sync selection done by the Treeview class bindings."""
+        tree_selection = set(self.tree.selection())
+        for iid, key in self.materialized.items():
+            if iid in tree_selection:
+                self.selected.add(key)
+            else:
+                self.selected.discard(key)
+
+    def yview(self, *args):
+        """Scrollbar command."""
+        count = self.model.row_count()
+        if args[0] == 'moveto':
+            self.first = int(float(args[1]) * count)
+        elif args[0] == 'scroll':
+            number = int(args[1])
+            if args[2] == 'pages':
+                number *= self.visible
+            self.first += number
+        self.refresh()
+
+    def scroll(self, rows):
+        """Scroll a number of rows."""
+        self.first += rows
+        self.refresh()
+        return 'break'
+
+    def step(self, step):
+        """Move selection one row up or down."""
+        current = self.selection()
+        count = self.model.row_count()
+        if not count:
+            return 'break'
+        if current:
+            index = self.model.row_index(current[0 if step < 0 else -1])
+            index = max(0, min(count - 1, index + step))
+        else:
+            index = 0
+        key = self.model.row(index)[0]
+        self.selection_set((key, ))
+        self.see(key)
+        return 'break'
+
+    def see(self, key):
+        """Scroll so that key is visible, if it is shown."""
+        if not self.row_exists(key):
+            return
+        index = self.model.row_index(key)
+        if index < self.first:
+            self.first = index
+        elif index >= self.first + self.visible:
+            self.first = index - self.visible + 1
+        self.refresh()
+
+    def identify_row(self, y):
+        """Key of row at y or None."""
+        return self.materialized.get(self.tree.identify_row(y))
+
+    def identify_region(self, x, y):
+        return self.tree.identify_region(x, y)
+
+    def selection(self):
+        """Selected keys in the order of the model."""
+        return sorted(self.selected, key=self.model.row_index)
+
+    def selection_set(self, keys):
+        self.selected = set(keys)
+        self.render()
+
+    def selection_add(self, keys):
+        self.selected.update(keys)
+        self.render()
+
+    def selection_remove(self, keys):
+        self.selected.difference_update(keys)
+        self.render()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import library
+
+class RescanTest(unittest.TestCase):
+    """Incremental rescans of a scanned root."""
+    def setUp(self):
+        self.temp = tempfile.mkdtemp(prefix='milonga-test-')
+        self.music = os.path.join(self.temp, 'music')
+        for folder in ('Di Sarli', 'Troilo'):
+            os.makedirs(os.path.join(self.music, folder))
+            for number in range(2):
+                self.write(folder, f'{number}.mp3')
+        self.library = library.Library(os.path.join(self.temp, 'library.db'))
+        self.library.scan([self.music])
+
+    def tearDown(self):
+        self.library.close()
+        shutil.rmtree(self.temp, ignore_errors=True)
+
+    def path(self, *names):
+        return os.path.join(self.music, *names)
+
+    def write(self, folder, name, size=0):
+        with open(self.path(folder, name), 'wb') as fh:
+            fh.write(bytes(size))
+
+    def touch(self, folder):
+        """Move the modification time of folder forward."""
+        mtime = os.stat(self.path(folder)).st_mtime + 10
+        os.utime(self.path(folder), (mtime, mtime))
+
+    def test_unchanged_lists_nothing(self):
+        with mock.patch.object(self.library, 'update_dir') as update_dir:
+            diff = self.library.rescan([self.music])
+        self.assertFalse(any(diff))
+        update_dir.assert_not_called()
+
+    def test_added_and_removed(self):
+        self.write('Troilo', '2.mp3')
+        os.remove(self.path('Troilo', '0.mp3'))
+        self.touch('Troilo')
+        diff = self.library.rescan([self.music])
+        self.assertEqual(diff.added, [self.path('Troilo', '2.mp3')])
+        self.assertEqual(diff.removed, [self.path('Troilo', '0.mp3')])
+        self.assertEqual(len(self.library.files(self.music)), 4)
+
+    def test_only_changed_folders_are_listed(self):
+        self.write('Troilo', '2.mp3')
+        self.touch('Troilo')
+        update_dir = self.library.update_dir
+        with mock.patch.object(self.library, 'update_dir',
+                               side_effect=update_dir) as listed:
+            self.library.rescan([self.music])
+        self.assertEqual([call.args[0].path for call in listed.call_args_list],
+                         [self.path('Troilo')])
+
+    def test_removed_folder(self):
+        shutil.rmtree(self.path('Di Sarli'))
+        diff = self.library.rescan([self.music])
+        self.assertEqual(sorted(diff.removed),
+                         [self.path('Di Sarli', f'{number}.mp3')
+                          for number in range(2)])
+        self.assertEqual(self.library.files(self.music),
+                         [self.path('Troilo', f'{number}.mp3')
+                          for number in range(2)])
+
+    def test_rewritten_in_place_needs_force(self):
+        mtime = os.stat(self.path('Troilo')).st_mtime
+        self.write('Troilo', '0.mp3', 100)
+        os.utime(self.path('Troilo'), (mtime, mtime))
+        self.assertFalse(any(self.library.rescan([self.music])))
+        diff = self.library.rescan([self.music], force=True)
+        self.assertEqual(diff.modified, [self.path('Troilo', '0.mp3')])
+
+    def test_trie_follows_rescan(self):
+        trie = self.library.tree()
+        self.write('Troilo', '2.mp3')
+        self.touch('Troilo')
+        self.library.rescan([self.music])
+        self.assertEqual(trie.count(self.path('Troilo')), 3)
+        self.assertEqual(len(trie), 5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import library
+
+class CachedTest(unittest.TestCase):
+    """Cached metadata of files that are not in the library."""
+    def setUp(self):
+        self.temp = tempfile.mkdtemp(prefix='milonga-test-')
+        self.library = library.Library(os.path.join(self.temp, 'library.db'))
+        self.path = os.path.join(self.temp, 'track.mp3')
+        with open(self.path, 'wb') as fh:
+            fh.write(bytes(1000))
+        self.library.metadata.read_chunk([self.path])
+
+    def tearDown(self):
+        self.library.close()
+        shutil.rmtree(self.temp, ignore_errors=True)
+
+    def test_unchanged_file_is_cached(self):
+        self.assertIn(self.path, self.library.metadata.cached([self.path]))
+
+    def test_rewritten_file_is_not_cached(self):
+        with open(self.path, 'wb') as fh:
+            fh.write(bytes(2000))
+        self.assertEqual(self.library.metadata.cached([self.path]), {})
+
+    def test_removed_file_is_not_cached(self):
+        os.remove(self.path)
+        self.assertEqual(self.library.metadata.cached([self.path]), {})
+
+if __name__ == '__main__':
+    unittest.main()
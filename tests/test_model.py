@@ -0,0 +1,91 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from playlist.model import PlayListModel
+
+PATHS = [f'/music/{name}.mp3' for name in 'abcde']
+
+class PlayListModelTest(unittest.TestCase):
+    def setUp(self):
+        self.model = PlayListModel()
+        self.changes = []
+        self.model.add_observer(self.changes.append)
+        self.model.add(PATHS)
+
+    def test_add_skips_other_files(self):
+        added = self.model.add(['/music/cover.jpg', '/music/f.MP3'])
+        self.assertEqual(added, ['/music/f.MP3'])
+        self.assertEqual(len(self.model), 6)
+
+    def test_step_through(self):
+        self.assertEqual(self.model.get_track(), PATHS[0])
+        self.assertEqual(self.model.peek_track(), PATHS[1])
+        self.assertEqual(self.model.get_track(1), PATHS[1])
+        self.assertEqual(self.model.get_track(-2), PATHS[4])
+
+    def test_queue_first(self):
+        self.model.get_track()
+        self.model.enqueue([3, 2, 3])
+        self.model.dequeue([3])
+        self.assertEqual(self.model.peek_track(), PATHS[3])
+        self.assertEqual([self.model.get_track(1) for _ in range(3)],
+                         [PATHS[3], PATHS[2], PATHS[1]])
+
+    def test_random_plays_every_row(self):
+        self.model.random = True
+        played = {self.model.get_track()}
+        played.update(self.model.get_track(1) for _ in range(len(PATHS) - 1))
+        self.assertEqual(played, set(PATHS))
+
+    def test_remove_current_moves_to_next(self):
+        self.model.play_row(1)
+        self.model.enqueue([2])
+        self.model.remove([1, 2])
+        self.assertEqual(self.model.current, 3)
+        self.assertEqual(len(self.model.queue), 0)
+        self.assertEqual(self.model.get_track(), PATHS[3])
+
+    def test_move(self):
+        self.model.move([0, 1], 3)
+        self.assertEqual(self.model.rows, [2, 3, 0, 1, 4])
+        self.model.move([4], 2)
+        self.assertEqual(self.model.rows, [4, 2, 3, 0, 1])
+
+    def test_batch_notifies_once(self):
+        self.changes.clear()
+        with self.model.batch():
+            self.model.enqueue([1])
+            self.model.play_row(2)
+        self.assertEqual(self.changes, [{'queue', 'playing'}])
+
+    def test_state_round_trip(self):
+        self.model.remove([0])
+        self.model.play_row(2)
+        self.model.enqueue([4, 3])
+        self.model.shuffle.next()
+        model = PlayListModel()
+        model.load(self.model.state())
+        self.assertEqual([model.paths[i] for i in model.rows], PATHS[1:])
+        self.assertEqual(model.paths[model.current], PATHS[2])
+        self.assertEqual([model.paths[i] for i in model.queue],
+                         [PATHS[4], PATHS[3]])
+        self.assertEqual([model.paths[i] for i in model.shuffle.order],
+                         [self.model.paths[i]
+                          for i in self.model.shuffle.order])
+        self.assertEqual(model.shuffle.cursor, 1)
+
+    def test_load_old_rows(self):
+        model = PlayListModel()
+        model.load({'playlist': [('I001', PATHS[0], ()),
+                                 ('I002', PATHS[1], ())],
+                    'current_index': 'I002', 'queue': ['I001', 'I009']})
+        self.assertEqual(model.paths[model.current], PATHS[1])
+        self.assertEqual([model.paths[i] for i in model.queue], [PATHS[0]])
+        self.assertEqual(len(model.shuffle), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import library
+from playlist import pattern
+
+class RestoreTest(unittest.TestCase):
+    """Patterns restored from a saved state against a new library."""
+    def setUp(self):
+        self.temp = tempfile.mkdtemp(prefix='milonga-test-')
+        self.music = os.path.join(self.temp, 'music')
+        os.makedirs(os.path.join(self.music, 'Di Sarli'))
+        for number in range(3):
+            open(os.path.join(self.music, 'Di Sarli', f'{number}.mp3'),
+                 'wb').close()
+        self.libraries = []
+
+    def tearDown(self):
+        for lib in self.libraries:
+            lib.close()
+        shutil.rmtree(self.temp, ignore_errors=True)
+
+    def new_library(self, name):
+        lib = library.Library(os.path.join(self.temp, 'data', name))
+        self.libraries.append(lib)
+        return lib
+
+    def saved(self):
+        """Pattern made against a scanned library."""
+        p = pattern.Pattern('Tango', [self.music], 2,
+                            library=self.new_library('old.db'))
+        self.assertEqual(p.file_count(), 3)
+        return p
+
+    def test_from_record_scans_roots(self):
+        p = pattern.from_record(self.saved().record(),
+                                self.new_library('new.db'))
+        self.assertEqual(p.file_count(), 3)
+        self.assertEqual(len(p.select_files()), 2)
+
+    def test_pickled_scans_roots(self):
+        p = pickle.loads(pickle.dumps(self.saved()))
+        p.library = self.new_library('new.db')
+        self.assertEqual(len(p.files), 3)
+
+    def test_restored_tracks_share_trie_strings(self):
+        record = pickle.loads(pickle.dumps(self.saved().record()))
+        p = pattern.from_record(record, self.new_library('new.db'))
+        files = {path: path for path in p.files}
+        for path in p.playlist:
+            self.assertIs(path, files[path])
+
+    def test_pick_files_keeps_playlist(self):
+        p = self.saved()
+        playlist = list(p.playlist)
+        picked = p.pick_files()
+        self.assertEqual(len(picked), 2)
+        self.assertEqual(p.playlist, playlist)
+
+class LibraryTest(unittest.TestCase):
+    def test_library_required(self):
+        with self.assertRaises(ValueError):
+            pattern.Pattern('Tango')
+
+    def test_restored_without_library(self):
+        p = pattern.from_record({'name': 'Tango', 'root_paths': ['/music'],
+                                 'number': 4})
+        with self.assertRaises(RuntimeError):
+            p.select_files()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,26 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from playlist import plan
+
+class EveningTest(unittest.TestCase):
+    def test_fills_hours(self):
+        evening = plan.Plan(['Tango', 'Vals'],
+                            {'Tango': ['a', 'b', 'c'], 'Vals': ['d', 'e']},
+                            {'Tango': 3, 'Vals': 2}, seed=1)
+        tandas = evening.evening(1)
+        seconds = sum(len(tracks) for _, _, tracks in tandas) * plan.TRACK_SECONDS
+        self.assertGreaterEqual(seconds, 3600)
+
+    def test_empty_tandas_end(self):
+        evening = plan.Plan(['Tango', 'Vals'],
+                            {'Tango': ['a'], 'Vals': []},
+                            {'Tango': 0, 'Vals': 3}, seed=1)
+        self.assertEqual(len(evening.evening(1)), 2)
+
+if __name__ == '__main__':
+    unittest.main()
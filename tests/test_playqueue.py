@@ -0,0 +1,49 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from playlist.playqueue import PlayQueue
+
+class PlayQueueTest(unittest.TestCase):
+    def test_order(self):
+        queue = PlayQueue([3, 1, 2])
+        self.assertEqual(list(queue), [3, 1, 2])
+        self.assertEqual(queue.peek(), 3)
+        self.assertEqual([queue.pop() for _ in range(4)], [3, 1, 2, None])
+        self.assertEqual(len(queue), 0)
+        self.assertIsNone(queue.peek())
+
+    def test_positions(self):
+        queue = PlayQueue([1, 2, 1, 3])
+        self.assertEqual(queue.positions(1), [1, 3])
+        self.assertEqual(queue.positions(3), [4])
+        self.assertEqual(queue.positions(4), [])
+        queue.pop()
+        self.assertEqual(queue.positions(1), [2])
+        self.assertEqual(queue.positions(2), [1])
+
+    def test_positions_after_remove(self):
+        queue = PlayQueue([1, 2, 3, 2, 4])
+        self.assertTrue(queue.remove_last(2))
+        self.assertEqual(queue.positions(4), [4])
+        queue.discard(1)
+        self.assertEqual(list(queue), [2, 3, 4])
+        self.assertEqual(queue.positions(2), [1])
+        self.assertEqual(queue.positions(4), [3])
+        self.assertFalse(queue.remove_last(1))
+
+    def test_pop_skips_removed(self):
+        queue = PlayQueue([1, 2, 3])
+        queue.discard(1)
+        queue.discard(2)
+        self.assertEqual(queue.peek(), 3)
+        self.assertEqual(queue.pop(), 3)
+        self.assertEqual(queue.removed, [])
+        queue.append(4)
+        self.assertEqual(queue.positions(4), [1])
+
+if __name__ == '__main__':
+    unittest.main()
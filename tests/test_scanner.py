@@ -0,0 +1,34 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import scanner
+
+class ScannerTest(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.mkdtemp(prefix='milonga-test-')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp, ignore_errors=True)
+
+    @unittest.skipUnless(hasattr(os, 'symlink'), 'needs symlinks')
+    def test_symlink_loop(self):
+        folder = os.path.join(self.temp, 'B')
+        os.makedirs(folder)
+        for name in ('a.mp3', 'b.mp3'):
+            open(os.path.join(folder, name), 'wb').close()
+        try:
+            os.symlink(folder, os.path.join(folder, 'loop'))
+        except OSError:
+            self.skipTest('symlinks not permitted')
+        tracks = [track for batch in scanner.Scanner().tracks([self.temp])
+                  for track in batch]
+        self.assertEqual(len(tracks), 2)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import searchindex
+
+class SearchIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = searchindex.SearchIndex()
+        self.index.add(1, 'Rodríguez Desde el alma')
+        self.index.add(2, 'Di Sarli Bahía Blanca')
+        self.index.add(3, 'Di Sarli Organito de la tarde')
+
+    def test_prefix_words(self):
+        self.assertEqual(self.index.search('sar'), {2, 3})
+        self.assertEqual(self.index.search('di sar tar'), {3})
+        self.assertEqual(self.index.search('canaro'), set())
+        self.assertIsNone(self.index.search(' - '))
+
+    def test_accents_and_case(self):
+        self.assertEqual(self.index.search('RODRIGUEZ'), {1})
+        self.assertEqual(self.index.search('bahia'), {2})
+
+    def test_typing_reuses_last_query(self):
+        self.assertEqual(self.index.search('di'), {2, 3})
+        self.assertEqual(self.index.search('di b'), {2})
+        self.assertEqual(self.index.search('di bl'), {2})
+
+    def test_changes_are_found(self):
+        self.index.search('alma')
+        self.index.add(4, 'Biagi Alma de bohemio')
+        self.assertEqual(self.index.search('alma'), {1, 4})
+        self.index.remove(1)
+        self.index.remove(1)
+        self.assertEqual(self.index.search('alma'), {4})
+        self.index.add(4, 'Biagi Lagrimitas de mi corazón')
+        self.assertEqual(self.index.search('alma'), set())
+        self.assertEqual(len(self.index), 3)
+        self.assertIn(4, self.index)
+
+    def test_many_new_words_are_merged(self):
+        for key in range(searchindex.MERGE_SIZE + 10):
+            self.index.add(f'track{key}', f'word{key}')
+        self.assertEqual(self.index.search('word1000'), {'track1000'})
+        self.assertEqual(self.index.sorted, sorted(self.index.sorted))
+
+    def test_describe(self):
+        text = searchindex.describe('/music/Di Sarli/Bahia.mp3',
+                                    {'artist': 'Carlos Di Sarli', 'year': 1941})
+        self.assertEqual(searchindex.tokenize(text),
+                         ['bahia', 'di', 'sarli', 'carlos', 'di', 'sarli',
+                          '1941'])
+
+if __name__ == '__main__':
+    unittest.main()
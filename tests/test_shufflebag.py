@@ -0,0 +1,58 @@
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+from playlist.shufflebag import ShuffleBag
+
+class ShuffleBagTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+
+    def test_round_plays_every_row_once(self):
+        bag = ShuffleBag(range(10))
+        for _ in range(3):
+            self.assertEqual(sorted(bag.next() for _ in range(10)),
+                             list(range(10)))
+
+    def test_no_repeat_between_rounds(self):
+        bag = ShuffleBag(range(2))
+        played = [bag.next() for _ in range(40)]
+        self.assertTrue(all(a != b for a, b in zip(played, played[1:])))
+
+    def test_added_row_in_current_round(self):
+        bag = ShuffleBag(range(5))
+        played = [bag.next() for _ in range(2)]
+        bag.add(5)
+        rest = [bag.next() for _ in range(4)]
+        self.assertEqual(sorted(played + rest), list(range(6)))
+
+    def test_removed_rows_are_not_played(self):
+        bag = ShuffleBag(range(6))
+        played = [bag.next() for _ in range(3)]
+        bag.remove(played[0])
+        unplayed = [row for row in range(6) if row not in played]
+        bag.remove(unplayed[0])
+        rest = [bag.next() for _ in range(2)]
+        self.assertEqual(sorted(played[1:] + rest),
+                         sorted(played[1:] + unplayed[1:]))
+        self.assertEqual(len(bag), 4)
+
+    def test_peek_and_previous(self):
+        bag = ShuffleBag(range(3))
+        self.assertEqual(bag.peek(), bag.next())
+        second = bag.next()
+        self.assertEqual(bag.previous(), bag.order[0])
+        self.assertEqual(bag.next(), second)
+
+    def test_restore(self):
+        bag = ShuffleBag(order=[2, 0, 1], cursor=1)
+        self.assertEqual([bag.next(), bag.next()], [0, 1])
+        self.assertIsNone(bag.peek())
+        self.assertIsNone(ShuffleBag().next())
+
+if __name__ == '__main__':
+    unittest.main()
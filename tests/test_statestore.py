@@ -0,0 +1,72 @@
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src'))
+
+import statestore
+
+class StateStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.temp = tempfile.mkdtemp(prefix='milonga-test-')
+        self.store = statestore.StateStore(self.temp)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp, ignore_errors=True)
+
+    def test_save_and_load(self):
+        self.assertTrue(self.store.save('record', {'name': 'Tango'}))
+        store = statestore.StateStore(self.temp)
+        self.assertEqual(store.load('record'), {'name': 'Tango'})
+        self.assertEqual(store.keys(), ['record'])
+
+    def test_unchanged_record_is_not_written(self):
+        self.store.save('record', [1, 2])
+        mtime = os.stat(self.store.record_path('record')).st_mtime_ns
+        self.assertFalse(self.store.save('record', [1, 2]))
+        self.assertEqual(
+            os.stat(self.store.record_path('record')).st_mtime_ns, mtime)
+        self.assertTrue(self.store.save('record', [1, 2, 3]))
+
+    def test_loaded_record_is_not_written(self):
+        self.store.save('record', [1, 2])
+        store = statestore.StateStore(self.temp)
+        store.load('record')
+        self.assertFalse(store.save('record', [1, 2]))
+
+    def test_failed_write_keeps_record(self):
+        self.store.save('record', [1, 2])
+        with mock.patch('os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.store.save('record', [3])
+        store = statestore.StateStore(self.temp)
+        self.assertEqual(store.load('record'), [1, 2])
+        self.assertEqual(store.keys(), ['record'])
+
+    def test_other_version_is_default(self):
+        with open(self.store.record_path('record'), 'wb') as fh:
+            pickle.dump((statestore.FORMAT_VERSION + 1, [1]), fh)
+        self.assertEqual(self.store.load('record', 'default'), 'default')
+
+    def test_broken_record_is_default(self):
+        with open(self.store.record_path('record'), 'wb') as fh:
+            fh.write(b'broken')
+        self.assertIsNone(self.store.load('record'))
+
+    def test_missing_record_is_default(self):
+        self.assertEqual(self.store.load('missing', {}), {})
+
+    def test_delete(self):
+        self.store.save('record', [1])
+        self.store.delete('record')
+        self.store.delete('record')
+        self.assertEqual(self.store.keys(), [])
+        self.assertTrue(self.store.save('record', [1]))
+
+if __name__ == '__main__':
+    unittest.main()